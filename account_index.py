@@ -0,0 +1,211 @@
+import os
+import sqlite3
+import time
+
+from page_cache import file_hash
+
+
+DEFAULT_INDEX_PATH = "data/AccountIndex.sqlite"
+
+
+class AccountIndex:
+    """
+    Persistent index of the accounts found by a run, stored in SQLite.
+    Subordinate accounts are kept as (first page, last page) ranges with
+    their bunchcode, master accounts with their subordinate accounts in
+    order, and each source PDF with its content hash and page count, so
+    reorder_and_merge can run again without parsing either PDF.
+    The master and subordinate halves are saved separately; one file can
+    hold both, or each can come from a different run. The index also keeps
+    the state of the last incremental subordinate scan.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(scan_state)")]
+        if columns and "page_refs_hash" not in columns:
+            # Scan state from before the byte range was kept; the next incremental run scans every page
+            self.db.executescript("DROP TABLE scan_state; DROP TABLE scan_hits;")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (
+                kind TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                page_count INTEGER NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS subordinate_accounts (
+                account TEXT PRIMARY KEY,
+                first_page INTEGER NOT NULL,
+                last_page INTEGER NOT NULL,
+                bunchcode TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS master_accounts (
+                position INTEGER PRIMARY KEY,
+                account TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS master_subordinates (
+                master_position INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                subordinate TEXT NOT NULL,
+                PRIMARY KEY (master_position, position)
+            );
+            CREATE TABLE IF NOT EXISTS scan_state (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                path TEXT NOT NULL,
+                backend TEXT NOT NULL,
+                layout TEXT NOT NULL,
+                last_page INTEGER NOT NULL,
+                prefix_hash TEXT NOT NULL,
+                open_account TEXT,
+                open_bunchcode TEXT,
+                byte_count INTEGER NOT NULL,
+                byte_hash TEXT NOT NULL,
+                object_count INTEGER NOT NULL,
+                page_refs_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS scan_hits (
+                page INTEGER PRIMARY KEY,
+                account TEXT NOT NULL,
+                bunchcode TEXT NOT NULL
+            );
+        """)
+
+    def _save_source(self, kind, source_path, page_count, digest):
+        self.db.execute(
+            "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)",
+            (kind, source_path, digest or file_hash(source_path), page_count, time.time())
+        )
+
+    def save_subordinate_data(self, subordinate_data, source_path, page_count, digest=None):
+        """
+        Replaces the subordinate half of the index with the accounts of a
+        subordinate data dictionary. Each account's pages are contiguous,
+        so only the first and last page numbers (1-indexed) are stored.
+        """
+        rows = [(account, data['pages'][0], data['pages'][-1], data['bunchcode'])
+                for account, data in subordinate_data.items()]
+        with self.db:
+            self.db.execute("DELETE FROM subordinate_accounts")
+            self.db.executemany("INSERT INTO subordinate_accounts VALUES (?, ?, ?, ?)", rows)
+            self._save_source('subordinate', source_path, page_count, digest)
+
+    def save_master_data(self, master_data, source_path, page_count, digest=None):
+        """
+        Replaces the master half of the index with a master data dictionary,
+        keeping the order of the master accounts and of their subordinates.
+        """
+        masters = []
+        subordinates = []
+        for master_position, (master_account, master_subordinates) in enumerate(master_data.items()):
+            masters.append((master_position, master_account))
+            subordinates.extend((master_position, position, subordinate)
+                                for position, subordinate in enumerate(master_subordinates))
+        with self.db:
+            self.db.execute("DELETE FROM master_accounts")
+            self.db.execute("DELETE FROM master_subordinates")
+            self.db.executemany("INSERT INTO master_accounts VALUES (?, ?)", masters)
+            self.db.executemany("INSERT INTO master_subordinates VALUES (?, ?, ?)", subordinates)
+            self._save_source('master', source_path, page_count, digest)
+
+    def source(self, kind):
+        """
+        Returns the 'path', 'file_hash' and 'page_count' of the PDF the
+        'master' or 'subordinate' half was built from, or None if that half
+        has not been saved.
+        """
+        row = self.db.execute(
+            "SELECT path, file_hash, page_count FROM sources WHERE kind = ?", (kind,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'path': row[0], 'file_hash': row[1], 'page_count': row[2]}
+
+    def subordinate_data(self):
+        """
+        Returns the subordinate data dictionary saved in the index, in page
+        order, with each account's pages as a range.
+        """
+        rows = self.db.execute(
+            "SELECT account, first_page, last_page, bunchcode FROM subordinate_accounts ORDER BY first_page"
+        )
+        return {account: {'pages': range(first_page, last_page + 1), 'bunchcode': bunchcode}
+                for account, first_page, last_page, bunchcode in rows}
+
+    def master_data(self):
+        """
+        Returns the master data dictionary saved in the index, in order.
+        """
+        master_data = {}
+        positions = {}
+        for position, master_account in self.db.execute(
+                "SELECT position, account FROM master_accounts ORDER BY position"):
+            master_data[master_account] = []
+            positions[position] = master_account
+        for master_position, subordinate in self.db.execute(
+                "SELECT master_position, subordinate FROM master_subordinates ORDER BY master_position, position"):
+            master_data[positions[master_position]].append(subordinate)
+        return master_data
+
+    def account_pages(self, account):
+        """
+        Returns the 1-indexed pages of one subordinate account as a range,
+        or None if the account is not in the index. This is a single primary
+        key lookup, whatever the size of the index.
+        """
+        row = self.db.execute(
+            "SELECT first_page, last_page FROM subordinate_accounts WHERE account = ?", (account,)
+        ).fetchone()
+        return range(row[0], row[1] + 1) if row else None
+
+    def save_scan_state(self, source_path, backend, layout, last_page, prefix_hash, hits, byte_count, byte_hash,
+                        object_count, page_refs_hash):
+        """
+        Saves the state of an incremental subordinate scan: the backend and
+        layout it used, the number of pages scanned, the hash of those pages
+        and the account boundaries found, as (page number, account number,
+        bunchcode) tuples. The account still open on the last page is kept
+        with its bunchcode. The size, content hash and object count (the
+        trailer's /Size) of the file scanned, and a hash of its page object
+        numbers, are kept too, to recognize a file that was only appended
+        to.
+        """
+        open_account, open_bunchcode = hits[-1][1:] if hits else (None, None)
+        with self.db:
+            self.db.execute("DELETE FROM scan_hits")
+            self.db.executemany("INSERT INTO scan_hits VALUES (?, ?, ?)", hits)
+            self.db.execute(
+                "INSERT OR REPLACE INTO scan_state VALUES (0, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (source_path, backend, layout, last_page, prefix_hash, open_account, open_bunchcode, byte_count,
+                 byte_hash, object_count, page_refs_hash)
+            )
+
+    def scan_state(self):
+        """
+        Returns the saved incremental scan state as a dictionary, with the
+        account boundaries under 'hits' in page order, or None if no
+        incremental scan has been saved.
+        """
+        row = self.db.execute(
+            "SELECT path, backend, layout, last_page, prefix_hash, open_account, open_bunchcode, byte_count, byte_hash, "
+            "object_count, page_refs_hash FROM scan_state"
+        ).fetchone()
+        if row is None:
+            return None
+        hits = [tuple(hit) for hit in self.db.execute("SELECT page, account, bunchcode FROM scan_hits ORDER BY page")]
+        return {'path': row[0], 'backend': row[1], 'layout': row[2], 'last_page': row[3],
+                'prefix_hash': row[4], 'open_account': row[5], 'open_bunchcode': row[6], 'byte_count': row[7],
+                'byte_hash': row[8], 'object_count': row[9], 'page_refs_hash': row[10], 'hits': hits}
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,228 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from page_cache import PageCache
+from run_report import RunReport
+from text_backends import BACKENDS, DEFAULT_BACKEND
+from utils import STREAMING_BATCH_SIZE, extract_master_data, extract_subordinate_data, reorder_and_merge
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_NAME = "SubordinateReordered.pdf"
+
+
+def find_jobs(source):
+    """
+    Returns the list of jobs to run, as dictionaries with 'name', 'master',
+    'subordinate' and 'output' paths. source is either a directory whose
+    subdirectories each hold a Master.pdf and a Subordinate.pdf (one per
+    utility district), or a JSON manifest listing the jobs. Relative paths
+    in a manifest are relative to the manifest's directory, and 'output'
+    defaults to SubordinateReordered.pdf next to the Subordinate PDF.
+    Raises ValueError if two jobs of a manifest have the same name.
+    """
+    jobs = []
+
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            job_dir = os.path.join(source, name)
+            master_pdf = os.path.join(job_dir, "Master.pdf")
+            subordinate_pdf = os.path.join(job_dir, "Subordinate.pdf")
+            if os.path.isfile(master_pdf) and os.path.isfile(subordinate_pdf):
+                jobs.append({'name': name, 'master': master_pdf, 'subordinate': subordinate_pdf,
+                             'output': os.path.join(job_dir, OUTPUT_NAME)})
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source) as f:
+            manifest = json.load(f)
+        for i, entry in enumerate(manifest):
+            subordinate_pdf = os.path.join(base_dir, entry['subordinate'])
+            output_pdf = entry.get('output') or os.path.join(os.path.dirname(entry['subordinate']), OUTPUT_NAME)
+            jobs.append({'name': entry.get('name', f"job{i + 1}"),
+                         'master': os.path.join(base_dir, entry['master']),
+                         'subordinate': subordinate_pdf,
+                         'output': os.path.join(base_dir, output_pdf)})
+        _check_job_names(jobs)
+
+    return jobs
+
+
+def _check_job_names(jobs):
+    """
+    Raises ValueError if two jobs have the same name, as the results of a
+    batch are kept by job name.
+    """
+    seen = set()
+    duplicates = set()
+    for job in jobs:
+        if job['name'] in seen:
+            duplicates.add(job['name'])
+        seen.add(job['name'])
+    if duplicates:
+        raise ValueError(f"Duplicate job names: {', '.join(sorted(duplicates))}")
+
+
+def _init_worker(log_level):
+    logging.basicConfig(level=log_level, format="%(asctime)s %(levelname)s %(process)d %(name)s: %(message)s")
+
+
+def _run_task(phase, kwargs, use_cache):
+    """
+    Runs one phase of a job inside a pool worker. Returns the phase result
+    and the worker's run report for that phase.
+    """
+    report = RunReport()
+    cache = PageCache() if use_cache and phase != "reorder_and_merge" else None
+    function = {
+        "extract_master_data": extract_master_data,
+        "extract_subordinate_data": extract_subordinate_data,
+        "reorder_and_merge": reorder_and_merge,
+    }[phase]
+
+    try:
+        with report.phase(phase):
+            if cache:
+                kwargs = dict(kwargs, cache=cache)
+            result = function(report=report, **kwargs)
+    finally:
+        if cache:
+            cache.close()
+    return result, report.to_dict()
+
+
+def run_batch(jobs, workers=None, use_cache=True, streaming=False, log_level=logging.WARNING,
+              backend=DEFAULT_BACKEND, optimize_output=False):
+    """
+    Runs the jobs concurrently on a pool of worker processes. The master and
+    subordinate extractions of a job are submitted together, so they run in
+    parallel; its reorder is submitted as soon as both have finished. A
+    failure only fails its own job. With optimize_output each output is
+    written with reorder_and_merge's optimize. Returns a summary dictionary
+    with the per-job status, timings and counters, and the overall
+    throughput. Raises ValueError if two jobs have the same name.
+    """
+    _check_job_names(jobs)
+    batch_size = STREAMING_BATCH_SIZE if streaming else None
+    started = time.perf_counter()
+    results = {job['name']: {'name': job['name'], 'status': 'running', 'phases': {}, 'counters': {}}
+               for job in jobs}
+    job_started = {}
+    pending_extractions = {}  # Job name -> {phase: result} until both extractions are in
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(log_level,)) as executor:
+        running = {}
+
+        def submit(job, phase, kwargs):
+            future = executor.submit(_run_task, phase, kwargs, use_cache)
+            running[future] = (job, phase)
+
+        for job in jobs:
+            job_started[job['name']] = time.perf_counter()
+            pending_extractions[job['name']] = {}
+            submit(job, "extract_master_data", {'master_pdf_path': job['master'], 'backend': backend})
+            submit(job, "extract_subordinate_data", {'subordinate_pdf_path': job['subordinate'],
+                                                     'streaming': streaming, 'backend': backend})
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, phase = running.pop(future)
+                job_result = results[job['name']]
+                if job_result['status'] == 'failed':
+                    continue  # The other half of a failed job; nothing left to do with it
+
+                try:
+                    result, report = future.result()
+                except Exception as e:
+                    logger.error("Job %s failed in %s: %s", job['name'], phase, e)
+                    job_result.update(status='failed', failed_phase=phase, error=f"{type(e).__name__}: {e}")
+                    job_result['seconds'] = round(time.perf_counter() - job_started[job['name']], 3)
+                    continue
+
+                job_result['phases'].update(report['phases'])
+                job_result['counters'].update(report['counters'])
+
+                if phase == "reorder_and_merge":
+                    job_result['status'] = 'ok'
+                    job_result['output'] = job['output']
+                    job_result['seconds'] = round(time.perf_counter() - job_started[job['name']], 3)
+                    logger.info("Job %s finished in %.2fs", job['name'], job_result['seconds'])
+                    continue
+
+                extractions = pending_extractions[job['name']]
+                extractions[phase] = result
+                if len(extractions) == 2:
+                    del pending_extractions[job['name']]
+                    submit(job, "reorder_and_merge", {
+                        'master_data': extractions["extract_master_data"],
+                        'subordinate_data': extractions["extract_subordinate_data"],
+                        'subordinate_pdf_path': job['subordinate'],
+                        'output_pdf_path': job['output'],
+                        'batch_size': batch_size,
+                        'optimize': optimize_output,
+                    })
+
+    total_seconds = time.perf_counter() - started
+    succeeded = [job for job in results.values() if job['status'] == 'ok']
+    total_pages = sum(job['counters'].get('subordinate_pages', 0) for job in succeeded)
+    return {
+        'jobs': list(results.values()),
+        'job_count': len(jobs),
+        'succeeded': len(succeeded),
+        'failed': len(jobs) - len(succeeded),
+        'total_seconds': round(total_seconds, 3),
+        'subordinate_pages': total_pages,
+        'pages_per_second': round(total_pages / total_seconds, 1) if total_seconds else None,
+        'workers': workers or os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reorder many Master/Subordinate PDF pairs concurrently.")
+    parser.add_argument("source", help="Directory of job subdirectories (each with Master.pdf and Subordinate.pdf) "
+                                       "or a JSON manifest of {name, master, subordinate, output} entries")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes shared by all jobs (default: number of CPUs)")
+    parser.add_argument("--summary", default="batch_summary.json",
+                        help="Path of the JSON summary (default: batch_summary.json)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the on-disk page cache")
+    parser.add_argument("--streaming", action="store_true", help="Run each job in constant-memory streaming mode")
+    parser.add_argument("--optimize-output", action="store_true",
+                        help="Write identical objects once and pack each output into compressed object streams")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                        help=f"Text extraction backend (default: {DEFAULT_BACKEND})")
+    parser.add_argument("--verbose", action="store_true", help="Log progress from inside the workers")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    try:
+        jobs = find_jobs(args.source)
+    except ValueError as e:
+        parser.error(f"{args.source}: {e}")
+    if not jobs:
+        parser.error(f"No Master/Subordinate pairs found in {args.source}")
+    logger.info("Running %d jobs...", len(jobs))
+
+    summary = run_batch(jobs, workers=args.workers, use_cache=not args.no_cache, streaming=args.streaming,
+                        log_level=logging.INFO if args.verbose else logging.WARNING, backend=args.backend,
+                        optimize_output=args.optimize_output)
+
+    for job in summary['jobs']:
+        if job['status'] == 'ok':
+            logger.info("%-20s ok      %8.2fs", job['name'], job['seconds'])
+        else:
+            logger.info("%-20s FAILED  %s", job['name'], job.get('error'))
+    logger.info("%d of %d jobs succeeded in %.2fs (%s subordinate pages/s)", summary['succeeded'],
+                summary['job_count'], summary['total_seconds'], summary['pages_per_second'])
+
+    with open(args.summary, 'w') as f:
+        json.dump(summary, f, indent=2)
+    logger.info("Summary written to %s", args.summary)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from generate_test_data import generate_dataset
+from text_backends import BACKENDS, DEFAULT_BACKEND
+from utils import STREAMING_BATCH_SIZE
+
+
+PHASES = ("extract_master_data", "extract_subordinate_data", "reorder_and_merge")
+
+
+def _run_phase(phase, args):
+    """
+    Runs one phase in a fresh worker process and returns its result with
+    the wall time, CPU time and peak RSS of that process. Logging below
+    ERROR is switched off so console output does not skew the timings.
+    """
+    import utils
+
+    logging.basicConfig(level=logging.ERROR)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = getattr(utils, phase)(*args[0], **args[1])
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    own_rss, workers_rss = utils.peak_rss_mb()
+    return result, wall, cpu, max(own_rss, workers_rss)
+
+
+def _page_count(pdf_path):
+    from PyPDF2 import PdfReader
+
+    with open(pdf_path, 'rb') as f:
+        return len(PdfReader(f).pages)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(master_pdf, subordinate_pdf, output_pdf, workers=1, streaming=False, backend=DEFAULT_BACKEND,
+              optimize_output=False):
+    """
+    Times each phase on one Master/Subordinate pair. Every phase runs in its
+    own spawned process, so its peak memory is measured on its own.
+    The reorder results also hold the size of the output. With
+    optimize_output the reorder runs a second time with optimize=True, as
+    reorder_and_merge_optimized, whose result also holds the size and wall
+    time of the plain output before it, for a before and after comparison.
+    Returns a list of per-phase result dictionaries.
+    """
+    master_pages = _page_count(master_pdf)
+    subordinate_pages = _page_count(subordinate_pdf)
+    batch_size = STREAMING_BATCH_SIZE if streaming else None
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+
+    def run(phase, pages, *args, label=None, **kwargs):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result, wall, cpu, peak_rss = executor.submit(_run_phase, phase, (args, kwargs)).result()
+        results.append({
+            'phase': label or phase,
+            'pages': pages,
+            'wall_seconds': round(wall, 3),
+            'cpu_seconds': round(cpu, 3),
+            'pages_per_second': round(pages / wall, 1) if wall else None,
+            'peak_rss_mb': peak_rss,
+        })
+        return result
+
+    master_data = run("extract_master_data", master_pages, master_pdf, backend=backend)
+    subordinate_data = run("extract_subordinate_data", subordinate_pages, subordinate_pdf,
+                           workers=workers, streaming=streaming, backend=backend)
+    run("reorder_and_merge", subordinate_pages, master_data, subordinate_data, subordinate_pdf, output_pdf,
+        batch_size=batch_size)
+    results[-1]['output_bytes'] = os.path.getsize(output_pdf)
+    if optimize_output:
+        plain = results[-1]
+        run("reorder_and_merge", subordinate_pages, master_data, subordinate_data, subordinate_pdf, output_pdf,
+            batch_size=batch_size, optimize=True, label="reorder_and_merge_optimized")
+        results[-1].update(output_bytes=os.path.getsize(output_pdf), output_bytes_before=plain['output_bytes'],
+                           wall_seconds_before=plain['wall_seconds'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each phase on synthetic Master/Subordinate PDFs.")
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="Comma separated Subordinate page counts to benchmark (default: 1000,10000)")
+    parser.add_argument("--data-dir", default="data/benchmark",
+                        help="Directory for the generated PDFs, reused when present (default: data/benchmark)")
+    parser.add_argument("--results", default="benchmark_results.jsonl",
+                        help="JSON lines file the results are appended to (default: benchmark_results.jsonl)")
+    parser.add_argument("--workers", type=int, default=1, help="Scan workers (default: 1)")
+    parser.add_argument("--streaming", action="store_true", help="Benchmark the streaming mode")
+    parser.add_argument("--optimize-output", action="store_true",
+                        help="Also benchmark the reorder with an optimized output, to compare size and write time")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                        help=f"Text extraction backend (default: {DEFAULT_BACKEND})")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated PDFs (default: 0)")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    for size in [int(size) for size in args.sizes.split(",")]:
+        size_dir = os.path.join(args.data_dir, f"{size}-seed{args.seed}")
+        master_pdf = os.path.join(size_dir, "Master.pdf")
+        subordinate_pdf = os.path.join(size_dir, "Subordinate.pdf")
+        if not (os.path.exists(master_pdf) and os.path.exists(subordinate_pdf)):
+            print(f"Generating {size} page test data in {size_dir}...")
+            generate_dataset(size_dir, total_pages=size, seed=args.seed)
+
+        print(f"Benchmarking {size} pages...")
+        results = benchmark(master_pdf, subordinate_pdf, os.path.join(size_dir, "SubordinateReordered.pdf"),
+                            workers=args.workers, streaming=args.streaming, backend=args.backend,
+                            optimize_output=args.optimize_output)
+
+        with open(args.results, 'a') as f:
+            for result in results:
+                output_size = f" {result['output_bytes'] / 2 ** 20:>8.1f} MB output" if 'output_bytes' in result else ""
+                if 'output_bytes_before' in result:
+                    output_size += (f" ({result['output_bytes'] / result['output_bytes_before'] - 1:+.0%} size, "
+                                    f"{result['wall_seconds'] - result['wall_seconds_before']:+.2f}s write time)")
+                print(f"  {result['phase']:<28} {result['wall_seconds']:>9.2f}s "
+                      f"{result['pages_per_second']:>9} pages/s {result['peak_rss_mb']:>8} MB{output_size}")
+                record = dict(result, size=size, seed=args.seed, workers=args.workers,
+                              streaming=args.streaming, backend=args.backend, commit=commit, timestamp=time.time())
+                f.write(json.dumps(record) + "\n")
+
+    print(f"Results appended to {args.results}")
+
+if __name__ == "__main__":
+    main()
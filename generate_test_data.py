@@ -0,0 +1,201 @@
+import argparse
+import os
+import random
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+
+LINE_HEIGHT = 14  # Points between text lines
+TOP_MARGIN = 40  # Points from the top of the page to the first line
+LEFT_MARGIN = 40
+ROWS_PER_MASTER_PAGE = 40  # Subordinate table rows on one Master page
+USAGE_LINES = 24  # Body lines on a Subordinate page
+
+
+def _draw_lines(c, lines, y):
+    """
+    Draws text lines top to bottom starting at y and returns the next y.
+    """
+    for line in lines:
+        c.drawString(LEFT_MARGIN, y, line)
+        y -= LINE_HEIGHT
+    return y
+
+
+def _draw_logo(c):
+    """
+    Draws the shared statement logo. It is a form XObject, so every page
+    references the same object, like a real print run.
+    """
+    if not getattr(c, "_logo_defined", False):
+        c.beginForm("logo")
+        c.setFillGray(0.4)
+        c.rect(0, 0, 90, 24, fill=1, stroke=0)
+        c.setFillGray(1)
+        c.drawString(8, 8, "PUBLIC SERVICE")
+        c.endForm()
+        c._logo_defined = True
+    c.saveState()
+    c.translate(letter[0] - 130, letter[1] - 50)
+    c.doForm("logo")
+    c.restoreState()
+
+
+def generate_subordinate_pdf(path, accounts, compress=True):
+    """
+    Writes a Subordinate PDF. accounts is a list of
+    (account number, bunchcode, page count, trailing blank page) tuples.
+    The first page of an account has "Page 1 of N" on the 3rd line, the
+    account number on the 6th line and the bunchcode as the last line.
+    """
+    c = canvas.Canvas(path, pagesize=letter, pageCompression=1 if compress else 0)
+    width, height = letter
+
+    for account_number, bunchcode, page_count, trailing_blank in accounts:
+        for page in range(1, page_count + 1):
+            _draw_logo(c)
+            header = [
+                "PUBLIC SERVICE COMPANY OF NEW MEXICO",
+                "Electric Bill Statement",
+                f"Page {page} of {page_count}",
+                "Statement Date: 26-DEC-2024",
+                "Bill Date Account Number Service Address",
+            ]
+            if page == 1:
+                header.append(f"26-DEC-2024 {account_number} - 7 RIO RANCHO, NM")
+            else:
+                header.append(f"Account {account_number} (continued)")
+            y = _draw_lines(c, header, height - TOP_MARGIN)
+
+            body = [f"Meter {i + 1:02d} Usage {random.randint(100, 9999)} kWh ${random.randint(10, 999)}.{random.randint(0, 99):02d}"
+                    for i in range(USAGE_LINES)]
+            _draw_lines(c, body, y - LINE_HEIGHT)
+
+            if page == 1:
+                c.drawString(LEFT_MARGIN, 30, bunchcode)
+            c.showPage()
+
+        if trailing_blank:
+            c.showPage()
+
+    c.save()
+
+
+def generate_master_pdf(path, masters, compress=True):
+    """
+    Writes a Master PDF. masters is a list of
+    (master number, master name, subordinate account numbers) tuples.
+    Each Master Account starts with a "Page 1 of N" page holding the
+    "Electric Summary Billing Statement for:" header, and lists its
+    subordinates in an "Account Number Name/ID Total" table. The last page
+    ends with a "Final Bill Transfers" section that must not be read.
+    """
+    c = canvas.Canvas(path, pagesize=letter, pageCompression=1 if compress else 0)
+    width, height = letter
+
+    for master_number, master_name, subordinates in masters:
+        chunks = [subordinates[i:i + ROWS_PER_MASTER_PAGE]
+                  for i in range(0, len(subordinates), ROWS_PER_MASTER_PAGE)] or [[]]
+
+        for page, rows in enumerate(chunks, start=1):
+            lines = [f"Page {page} of {len(chunks)}"]
+            if page == 1:
+                lines += [
+                    "Electric Summary Billing Statement for:",
+                    master_name,
+                    f"Account Number: {master_number}",
+                    "Statement Date: 26-DEC-2024",
+                ]
+            lines.append("Account Number Name/ID Total")
+            for i, subordinate in enumerate(rows):
+                account_number, subordinate_number = subordinate.split(" - ")
+                lines.append(f"{account_number} / {subordinate_number} METER SITE {i + 1} ${random.randint(10, 9999)}.{random.randint(0, 99):02d}")
+            if page == len(chunks):
+                lines += [
+                    "Final Bill Transfers",
+                    f"{random.randint(100000000, 999999999)} / {random.randint(1000000, 9999999)} TRANSFERRED $0.00",
+                ]
+            _draw_lines(c, lines, height - TOP_MARGIN)
+            c.showPage()
+
+    c.save()
+
+
+def generate_dataset(output_dir, total_pages=1000, min_pages=1, max_pages=3, orphan_ratio=0.05,
+                     missing_ratio=0.01, blank_ratio=0.1, master_count=20, bunchcode_count=8,
+                     seed=0, compress=True, account_count=None):
+    """
+    Writes a matching Master.pdf / Subordinate.pdf pair into output_dir.
+    Subordinate accounts are added until the Subordinate PDF reaches
+    total_pages or, with an account_count, until there are that many of
+    them (total_pages is then ignored). orphan_ratio of them are left out
+    of the Master PDF, missing_ratio extra accounts are listed in the
+    Master PDF but have no pages, and blank_ratio of them end with a blank
+    page.
+    Returns the (master path, subordinate path) pair.
+    """
+    random.seed(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    bunchcodes = [f"BUNCH{i:03d}" for i in range(1, bunchcode_count + 1)]
+
+    accounts = []
+    page_total = 0
+    while (len(accounts) < account_count) if account_count else (page_total < total_pages):
+        account_number = f"{random.randint(100000000, 999999999)} - {len(accounts) + 1000000:07d}"
+        page_count = random.randint(min_pages, max_pages)
+        if account_count:
+            last = len(accounts) + 1 == account_count
+        else:
+            page_count = min(page_count, total_pages - page_total)
+            last = page_total + page_count == total_pages
+        trailing_blank = not last and random.random() < blank_ratio
+        accounts.append((account_number, random.choice(bunchcodes), page_count, trailing_blank))
+        page_total += page_count + trailing_blank
+
+    # The Master lists every non-orphan account, plus a few that never print
+    listed = [account[0] for account in accounts if random.random() >= orphan_ratio]
+    listed += [f"{random.randint(100000000, 999999999)} - {9000000 + i:07d}"
+               for i in range(int(len(accounts) * missing_ratio))]
+    random.shuffle(listed)
+
+    masters = []
+    for i in range(master_count):
+        masters.append((f"{500000000 + i:09d}", f"CITY OF RIO RANCHO DISTRICT {i + 1}", listed[i::master_count]))
+
+    master_pdf = os.path.join(output_dir, "Master.pdf")
+    subordinate_pdf = os.path.join(output_dir, "Subordinate.pdf")
+    generate_master_pdf(master_pdf, masters, compress)
+    generate_subordinate_pdf(subordinate_pdf, accounts, compress)
+    return master_pdf, subordinate_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Master.pdf / Subordinate.pdf pair.")
+    parser.add_argument("--output-dir", default="data/synthetic", help="Directory to write the PDFs to")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--pages", type=int, default=1000, help="Pages in the Subordinate PDF (default: 1000)")
+    size.add_argument("--accounts", type=int,
+                      help="Subordinate accounts to generate, instead of a page count; the pages follow from them")
+    parser.add_argument("--min-pages", type=int, default=1, help="Fewest pages per account (default: 1)")
+    parser.add_argument("--max-pages", type=int, default=3, help="Most pages per account (default: 3)")
+    parser.add_argument("--orphan-ratio", type=float, default=0.05,
+                        help="Share of subordinate accounts missing from the Master PDF (default: 0.05)")
+    parser.add_argument("--missing-ratio", type=float, default=0.01,
+                        help="Share of extra Master entries with no subordinate pages (default: 0.01)")
+    parser.add_argument("--blank-ratio", type=float, default=0.1,
+                        help="Share of accounts followed by a blank page (default: 0.1)")
+    parser.add_argument("--masters", type=int, default=20, help="Number of Master Accounts (default: 20)")
+    parser.add_argument("--bunchcodes", type=int, default=8, help="Number of distinct bunchcodes (default: 8)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--no-compress", action="store_true", help="Write uncompressed page content")
+    args = parser.parse_args()
+
+    master_pdf, subordinate_pdf = generate_dataset(
+        args.output_dir, args.pages, args.min_pages, args.max_pages, args.orphan_ratio, args.missing_ratio,
+        args.blank_ratio, args.masters, args.bunchcodes, args.seed, not args.no_compress, args.accounts
+    )
+    print(f"Created {master_pdf} and {subordinate_pdf}")
+
+if __name__ == "__main__":
+    main()
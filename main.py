@@ -1,23 +1,382 @@
-from utils import extract_master_data, extract_subordinate_data, reorder_and_merge
+import argparse
+import logging
+import os
+import shutil
+
+from account_index import DEFAULT_INDEX_PATH, AccountIndex
+from page_cache import DEFAULT_CACHE_SIZE_MB, PageCache, file_hash
+from reorder_plan import build_plan
+from run_report import RunReport
+from sharded_output import SHARD_MODES, plan_shards, write_shards
+from text_backends import BACKENDS, DEFAULT_BACKEND
+from utils import (DEFAULT_LAYOUT, STREAMING_BATCH_SIZE, check_backend_parity, extract_master_data,
+                   extract_subordinate_data, extract_subordinate_data_incremental, linearize_pdf, peak_rss_mb,
+                   reorder_and_merge, scan_reorder_and_merge)
+
+logger = logging.getLogger(__name__)
+
+# File paths
+MASTER_PDF = "data/Master.pdf"
+SUBORDINATE_PDF = "data/Subordinate.pdf"
+OUTPUT_PDF = "data/SubordinateReordered.pdf"
+SHARD_DIR = "data/shards"
+
+
+def plan_output(master_data, subordinate_data, report):
+    """
+    Builds the ReorderPlan every output writer runs from, and records its
+    statistics.
+    """
+    with report.phase("build_plan"):
+        plan = build_plan(master_data, subordinate_data)
+    report.set_pages("build_plan", len(plan))
+    report.set('plan', plan.stats())
+    return plan
+
+
+def log_dry_run(args, plan, subordinate_data, report):
+    """
+    Logs what the output would be, for --dry-run.
+    """
+    stats = report.counters['plan']
+    logger.info("Dry run: %d output pages (%d Subordinate pages, %d blank pads) for %d accounts, "
+                "%d master accounts and %d bunchcode groups", stats['output_pages'], stats['source_pages'],
+                stats['blank_pages'], stats['accounts'], stats['master_accounts'],
+                len(stats['orphan_accounts_by_bunchcode']))
+    logger.info("Subordinate accounts listed in the Master PDF but missing: %d", stats['missing_subordinates'])
+    for bunchcode, count in stats['orphan_accounts_by_bunchcode'].items():
+        logger.info("Accounts not in the Master PDF with bunchcode %s: %d", bunchcode, count)
+    if args.shard_by:
+        shard_count = len(plan_shards(plan, subordinate_data, args.shard_by))
+        report.set('plan', dict(stats, shards=shard_count))
+        logger.info("Shards, one per %s: %d", args.shard_by, shard_count)
+    logger.info("Plan built in %.1f ms", report.phases['build_plan']['wall_seconds'] * 1000)
+
+
+def write_output(args, master_data, subordinate_data, plan, subordinate_pdf, output_pdf, report):
+    """
+    Runs reorder_and_merge, or write_shards when sharded output is asked for,
+    from the plan. Returns the list of PDFs written, in order.
+    """
+    batch_size = args.batch_size if args.streaming else None
+    if args.shard_by:
+        logger.info("Reordering into one PDF per %s...", args.shard_by)
+        with report.phase("write_shards"):
+            manifest = write_shards(master_data, subordinate_data, subordinate_pdf, args.shard_dir,
+                                    shard_by=args.shard_by, workers=args.shard_workers, batch_size=batch_size,
+                                    report=report, optimize=args.optimize_output, plan=plan)
+        report.set_pages("write_shards", report.counters['output_pages'])
+        logger.info("Shards successfully created in %s", args.shard_dir)
+        return [os.path.join(args.shard_dir, shard['file']) for shard in manifest['shards']]
+
+    # Reorder and merge
+    logger.info("Reordering and merging PDFs...")
+    with report.phase("reorder_and_merge"):
+        reorder_and_merge(master_data, subordinate_data, subordinate_pdf, output_pdf, batch_size=batch_size,
+                          report=report, optimize=args.optimize_output, plan=plan)
+    report.set_pages("reorder_and_merge", report.counters['output_pages'])
+    logger.info("PDF successfully created: %s", output_pdf)
+    return [output_pdf]
+
+
+def linearize_output(args, output_paths, report):
+    """
+    Linearizes the PDFs written, when it is asked for, recording their total
+    size before and after.
+    """
+    if not args.linearize:
+        return
+
+    size_before = size_after = 0
+    with report.phase("linearize_output"):
+        for output_path in output_paths:
+            before, after = linearize_pdf(output_path)
+            size_before += before
+            size_after += after
+    logger.info("Linearized %d PDF(s): %.1f MB -> %.1f MB", len(output_paths), size_before / 2 ** 20,
+                size_after / 2 ** 20)
+    report.set('linearization', {'bytes_before': size_before, 'bytes_after': size_after})
+
+
+def check_output(args, master_data, subordinate_data, subordinate_pdf, output_paths, report, plan=None, cache=None):
+    """
+    Runs verify_output on the PDFs written, when verification is asked for,
+    keeping the Subordinate PDF's page fingerprints in the page cache.
+    """
+    if not args.verify:
+        return
+    from verify_output import verify_output  # Imported here as it loads PyPDF2
+
+    with report.phase("verify_output"):
+        result = verify_output(master_data, subordinate_data, subordinate_pdf, output_paths, shard_by=args.shard_by,
+                               report=report, plan=plan, cache=cache)
+    report.set_pages("verify_output", result['input_pages'] + result['output_pages'])
+
+
+def reorder_from_index(args, report, cache=None):
+    """
+    Writes the reordered PDF from saved account indexes, without parsing
+    the Master or Subordinate PDF. Refuses to run if the Subordinate PDF
+    has changed since its index was built.
+    """
+    with AccountIndex(args.master_index) as index:
+        if index.source('master') is None:
+            raise SystemExit(f"No master accounts saved in {args.master_index}")
+        master_data = index.master_data()
+    with AccountIndex(args.subordinate_index) as index:
+        source = index.source('subordinate')
+        if source is None:
+            raise SystemExit(f"No subordinate accounts saved in {args.subordinate_index}")
+        subordinate_data = index.subordinate_data()
+
+    subordinate_pdf = args.subordinate or source['path']
+    if file_hash(subordinate_pdf) != source['file_hash']:
+        raise SystemExit(f"{subordinate_pdf} does not match the PDF indexed in {args.subordinate_index}; "
+                         f"run a full reorder to rebuild the index")
+    logger.info("Loaded %d master accounts and %d subordinate accounts from the index",
+                len(master_data), len(subordinate_data))
+    report.set('subordinate_pages', source['page_count'])
+    plan = plan_output(master_data, subordinate_data, report)
+    if args.dry_run:
+        log_dry_run(args, plan, subordinate_data, report)
+        return
+    output_paths = write_output(args, master_data, subordinate_data, plan, subordinate_pdf, args.output, report)
+    linearize_output(args, output_paths, report)
+    check_output(args, master_data, subordinate_data, subordinate_pdf, output_paths, report, plan, cache)
+
+
+def build_common_parser(defaults=True):
+    """
+    Returns the parser of the options shared by a full run and the reorder
+    subcommand. Without defaults, an option not given is left out of the
+    parsed arguments, so the subcommand's copy of it does not overwrite
+    the value given before the subcommand.
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--streaming", action="store_true",
+                        help="Keep memory flat on very large PDFs by releasing parsed pages and writing in batches")
+    common.add_argument("--batch-size", type=int, default=STREAMING_BATCH_SIZE,
+                        help=f"Pages written per batch in streaming mode (default: {STREAMING_BATCH_SIZE})")
+    common.add_argument("--shard-by", choices=SHARD_MODES,
+                        help="Write one PDF per master account (orphans per bunchcode), per bunchcode or per "
+                             "subordinate account, with a manifest, instead of a single PDF")
+    common.add_argument("--shard-dir", default=SHARD_DIR, help=f"Directory for the shards (default: {SHARD_DIR})")
+    common.add_argument("--shard-workers", type=int, default=None,
+                        help="Processes writing shards (default: number of CPUs)")
+    common.add_argument("--optimize-output", action="store_true",
+                        help="Write identical objects (fonts, images) once and pack the output into compressed "
+                             "object streams, for a smaller file; pages are unchanged. benchmark.py "
+                             "--optimize-output compares its size and write time with a plain output")
+    common.add_argument("--linearize", action="store_true",
+                        help="Linearize the output for fast first-page access (needs the qpdf command line tool)")
+    common.add_argument("--verify", action="store_true",
+                        help="Check by page fingerprints that the output holds every Subordinate page once, "
+                             "in the expected order; exits with status 1 if not")
+    common.add_argument("--dry-run", action="store_true",
+                        help="Plan the output and log its page, blank pad, missing and orphan account counts "
+                             "without writing any PDF")
+    common.add_argument("--quiet", action="store_true", help="Only log warnings and errors")
+    common.add_argument("--verbose", action="store_true", help="Also log every account and page list")
+    common.add_argument("--report", help="Write a JSON run report (timings and counters) to this path")
+    common.add_argument("--profile", help="Write cProfile statistics of the phases to this path")
+    if not defaults:
+        for action in common._actions:
+            action.default = argparse.SUPPRESS
+    return common
+
+
+def build_parser(prog=None):
+    """
+    Returns the command line parser of a reorder run. prog is the program
+    name usage messages show (default: the script's).
+    """
+    parser = argparse.ArgumentParser(prog=prog, description="Reorder the Subordinate PDF to follow the Master PDF.",
+                                     parents=[build_common_parser()])
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes used to scan the Subordinate PDF (default: 1)")
+    parser.add_argument("--full-text", action="store_true",
+                        help="Read the full page text of both PDFs, instead of the Subordinate header/footer bands "
+                             "and the learned Master table column")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Parse every page again instead of reusing the on-disk page cache")
+    parser.add_argument("--cache-size-mb", type=float, default=DEFAULT_CACHE_SIZE_MB,
+                        help=f"Size cap of the page cache in MB (default: {DEFAULT_CACHE_SIZE_MB})")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH,
+                        help=f"Save the account index of this run to this path (default: {DEFAULT_INDEX_PATH})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only scan Subordinate pages appended since the last incremental run, "
+                             "using the scan state saved in the account index")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Write the output while the Subordinate PDF is still being scanned")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                        help=f"Text extraction backend (default: {DEFAULT_BACKEND})")
+    parser.add_argument("--check-parity", action="store_true",
+                        help="Extract with every backend, compare the results and exit without writing a PDF")
+
+    subparsers = parser.add_subparsers(dest="command", metavar="{reorder}",
+                                       help="Run a single step instead of the full reorder")
+    reorder_parser = subparsers.add_parser("reorder", parents=[build_common_parser(defaults=False)],
+                                           help="Write the reordered PDF from saved account indexes")
+    reorder_parser.add_argument("--master-index", default=DEFAULT_INDEX_PATH,
+                                help=f"Index holding the master accounts (default: {DEFAULT_INDEX_PATH})")
+    reorder_parser.add_argument("--subordinate-index", default=DEFAULT_INDEX_PATH,
+                                help=f"Index holding the subordinate accounts (default: {DEFAULT_INDEX_PATH})")
+    reorder_parser.add_argument("--subordinate",
+                                help="Subordinate PDF to read pages from (default: the one the index was built from)")
+    reorder_parser.add_argument("--output", default=OUTPUT_PDF, help=f"Output PDF (default: {OUTPUT_PDF})")
+    return parser
+
+
+def parse_args(argv=None, prog=None):
+    """
+    Parses and checks the options of a reorder run (sys.argv by default).
+    prog is as in build_parser.
+    """
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+
+    if args.pipelined and args.incremental:
+        parser.error("--pipelined and --incremental cannot be combined")
+    if args.pipelined and args.dry_run:
+        parser.error("--pipelined writes while scanning and cannot be combined with --dry-run")
+    if args.pipelined and args.shard_by:
+        parser.error("--pipelined writes a single PDF and cannot be combined with --shard-by")
+    if args.linearize and shutil.which("qpdf") is None:
+        parser.error("--linearize needs the qpdf command line tool, which was not found on PATH; install the qpdf "
+                     "package of your system (an optional dependency, see requirements.txt) or drop --linearize")
+    return args
+
+
+def log_level(args):
+    return logging.WARNING if args.quiet else logging.DEBUG if args.verbose else logging.INFO
+
 
 def main():
-    # File paths
-    master_pdf = "data/Master.pdf"
-    subordinate_pdf = "data/Subordinate.pdf"
-    output_pdf = "data/SubordinateReordered.pdf"
-    
+    args = parse_args()
+    logging.basicConfig(level=log_level(args), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    run(args, RunReport(profile=bool(args.profile)))
+
+
+def run(args, report):
+    """
+    Runs the reorder the parsed options ask for, with paths relative to the
+    current directory, recording it in report. Raises SystemExit when the
+    run fails (with status 1 for a failed parity check or verification).
+    """
+    if args.command == "reorder":
+        cache = None if args.no_cache else PageCache(max_size_mb=args.cache_size_mb)
+        reorder_from_index(args, report, cache)
+        finish(args, report, cache)
+        return
+
+    master_pdf = MASTER_PDF
+    subordinate_pdf = SUBORDINATE_PDF
+    output_pdf = OUTPUT_PDF
+
+    layout = None if args.full_text else DEFAULT_LAYOUT
+    if args.check_parity:
+        parity = check_backend_parity(master_pdf, subordinate_pdf, layout=layout)
+        for backend, differences in parity['differences'].items():
+            if not any([differences['master_accounts'], differences['subordinate_accounts'],
+                        not differences['master_order_matches']]):
+                logger.info("Backend %s matches %s", backend, parity['reference'])
+                continue
+            logger.error("Backend %s differs from %s: %d master accounts, %d subordinate accounts%s", backend,
+                         parity['reference'], len(differences['master_accounts']),
+                         len(differences['subordinate_accounts']),
+                         "" if differences['master_order_matches'] else ", master order")
+            for account in differences['master_accounts'] + differences['subordinate_accounts']:
+                logger.error("  %s", account)
+        raise SystemExit(0 if parity['match'] else 1)
+
+    cache = None if args.no_cache else PageCache(max_size_mb=args.cache_size_mb)
+    report.set('backend', args.backend)
+
     # Extract data
-    print("Extracting data from Master PDF...")
-    master_data = extract_master_data(master_pdf)
-    
-    print("Building and Index/Dictionary from Subordinate PDF...")
-    subordinate_data = extract_subordinate_data(subordinate_pdf)
-    
-    # Reorder and merge
-    print("Reordering and merging PDFs...")
-    reorder_and_merge(master_data, subordinate_data, subordinate_pdf, output_pdf)
+    logger.info("Extracting data from Master PDF...")
+    with report.phase("extract_master_data"):
+        master_data = extract_master_data(master_pdf, cache=cache, report=report, backend=args.backend,
+                                          learn_table=not args.full_text)
+    report.set_pages("extract_master_data", report.counters['master_pages'])
+
+    if args.pipelined:
+        logger.info("Scanning the Subordinate PDF while reordering and merging...")
+        batch_size = args.batch_size if args.streaming else None
+        with report.phase("scan_reorder_and_merge"):
+            subordinate_data, plan = scan_reorder_and_merge(
+                master_data, subordinate_pdf, output_pdf, workers=args.workers, layout=layout,
+                streaming=args.streaming, batch_size=batch_size, report=report, backend=args.backend,
+                optimize=args.optimize_output)
+        report.set_pages("scan_reorder_and_merge", report.counters['subordinate_pages'])
+        report.set('plan', plan.stats())
+        save_index(args.index, master_data, master_pdf, subordinate_data, subordinate_pdf, report)
+        logger.info("PDF successfully created: %s", output_pdf)
+        linearize_output(args, [output_pdf], report)
+        check_output(args, master_data, subordinate_data, subordinate_pdf, [output_pdf], report, plan, cache)
+        finish(args, report, cache)
+        return
+
+    logger.info("Building and Index/Dictionary from Subordinate PDF...")
+    with report.phase("extract_subordinate_data"):
+        if args.incremental:
+            with AccountIndex(args.index) as index:
+                subordinate_data = extract_subordinate_data_incremental(
+                    subordinate_pdf, index, workers=args.workers, layout=layout, streaming=args.streaming,
+                    report=report, backend=args.backend)
+        else:
+            subordinate_data = extract_subordinate_data(subordinate_pdf, workers=args.workers, layout=layout,
+                                                        cache=cache, streaming=args.streaming, report=report,
+                                                        backend=args.backend)
+    report.set_pages("extract_subordinate_data", report.counters['subordinate_pages'])
+
+    save_index(args.index, master_data, master_pdf, subordinate_data, subordinate_pdf, report)
     
-    print(f"PDF successfully created: {output_pdf}")
+    plan = plan_output(master_data, subordinate_data, report)
+    if args.dry_run:
+        log_dry_run(args, plan, subordinate_data, report)
+        finish(args, report, cache)
+        return
+    output_paths = write_output(args, master_data, subordinate_data, plan, subordinate_pdf, output_pdf, report)
+    linearize_output(args, output_paths, report)
+    check_output(args, master_data, subordinate_data, subordinate_pdf, output_paths, report, plan, cache)
+    finish(args, report, cache)
+
+
+def save_index(index_path, master_data, master_pdf, subordinate_data, subordinate_pdf, report):
+    """
+    Saves the accounts of a run to the account index, with the file hashes
+    the extraction already computed for the page cache, if it did.
+    """
+    with AccountIndex(index_path) as index:
+        index.save_master_data(master_data, master_pdf, report.counters['master_pages'],
+                               report.counters.get('master_file_hash'))
+        index.save_subordinate_data(subordinate_data, subordinate_pdf, report.counters['subordinate_pages'],
+                                    report.counters.get('subordinate_file_hash'))
+    logger.info("Account index saved to %s", index_path)
+
+
+def finish(args, report, cache=None):
+    """
+    Records the cache statistics and peak memory, and writes the run report
+    and profile.
+    """
+    if cache:
+        logger.info(cache.summary())
+        report.set('cache', cache.stats())
+        cache.close()
+
+    own_rss, workers_rss = peak_rss_mb()
+    logger.info("Peak memory (RSS): %s MB, largest worker: %s MB", own_rss, workers_rss)
+    report.set('peak_rss_mb', own_rss)
+    report.set('peak_worker_rss_mb', workers_rss)
+
+    if args.report:
+        report.write(args.report)
+    if args.profile:
+        report.dump_profile(args.profile)
+
+    if not report.counters.get('verification', {'ok': True})['ok']:
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
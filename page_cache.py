@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pdf_reorder", "page_cache.sqlite")
+DEFAULT_CACHE_SIZE_MB = 512
+
+
+def file_hash(pdf_path):
+    """
+    Returns the SHA-256 hex digest of a file's content, read in 1 MB blocks.
+    """
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PageCache:
+    """
+    Persistent on-disk cache of per-page extraction results, stored in SQLite.
+    Entries are keyed by the file's content hash, the kind of parse
+    ('master' or 'subordinate', with the backend and settings the page was
+    read with) and the 0-indexed page number, so a re-run
+    against an unchanged PDF can skip the pages it has already parsed.
+    The total size of the stored results is capped; the least recently
+    used entries are evicted first.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_size_mb=DEFAULT_CACHE_SIZE_MB):
+        self.path = path
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Several batch workers may share one cache file, so wait for locks
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                file_hash TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (file_hash, kind, page)
+            );
+            CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used);
+            CREATE TABLE IF NOT EXISTS documents (
+                file_hash TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                page_count INTEGER NOT NULL,
+                PRIMARY KEY (file_hash, kind)
+            );
+        """)
+
+    def load(self, digest, kind):
+        """
+        Returns the cached results for a file as a {page index: result} dict
+        and marks them as recently used.
+        """
+        rows = self.db.execute(
+            "SELECT page, value FROM pages WHERE file_hash = ? AND kind = ?", (digest, kind)
+        ).fetchall()
+        if rows:
+            with self.db:
+                self.db.execute(
+                    "UPDATE pages SET last_used = ? WHERE file_hash = ? AND kind = ?",
+                    (time.time(), digest, kind)
+                )
+        return {page: json.loads(value) for page, value in rows}
+
+    def store(self, digest, kind, results):
+        """
+        Stores a {page index: result} dict of JSON-serializable results,
+        then evicts the least recently used entries if the cache is over its
+        size cap.
+        """
+        if not results:
+            return
+
+        now = time.time()
+        rows = []
+        for page, result in results.items():
+            value = json.dumps(result)
+            rows.append((digest, kind, page, value, len(value), now))
+
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.stores += len(rows)
+        self._evict()
+
+    def page_count(self, digest, kind):
+        """
+        Returns the stored page count of a file, or None if it is unknown.
+        """
+        row = self.db.execute(
+            "SELECT page_count FROM documents WHERE file_hash = ? AND kind = ?", (digest, kind)
+        ).fetchone()
+        return row[0] if row else None
+
+    def store_page_count(self, digest, kind, page_count):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?)", (digest, kind, page_count))
+
+    def _evict(self):
+        """
+        Deletes the least recently used entries until the cache is back under
+        90% of its size cap.
+        """
+        total_size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+
+        target = total_size - int(self.max_size * 0.9)
+        freed = 0
+        evicted = []
+        for rowid, size in self.db.execute("SELECT rowid, size FROM pages ORDER BY last_used"):
+            evicted.append((rowid,))
+            freed += size
+            if freed >= target:
+                break
+
+        with self.db:
+            self.db.executemany("DELETE FROM pages WHERE rowid = ?", evicted)
+            # Forget page counts of files that no longer have any cached page
+            self.db.execute(
+                "DELETE FROM documents WHERE NOT EXISTS (SELECT 1 FROM pages "
+                "WHERE pages.file_hash = documents.file_hash AND pages.kind = documents.kind)"
+            )
+        self.evictions += len(evicted)
+
+    def stats(self):
+        """
+        Returns a dictionary of hit/miss counters for this run and the
+        current size of the cache.
+        """
+        entries, total_size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'entries': entries,
+            'size_mb': round(total_size / (1024 * 1024), 2),
+            'max_size_mb': round(self.max_size / (1024 * 1024), 2),
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Page cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['evictions']} evicted, {stats['entries']} entries "
+                f"({stats['size_mb']} of {stats['max_size_mb']} MB) at {self.path}")
+
+    def close(self):
+        self.db.close()
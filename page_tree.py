@@ -0,0 +1,587 @@
+import hashlib
+import struct
+import zlib
+from array import array
+from io import BytesIO
+
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, StreamObject
+
+
+# Page attributes a page can inherit from its parent /Pages nodes
+INHERITABLE_ATTRIBUTES = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+# Fallback size for a blank page whose neighbour has no MediaBox (US Letter)
+LETTER_MEDIABOX = b"[0 0 612 792]"
+
+CATALOG_NUM = 1  # Object number of the output document catalog
+PAGES_NUM = 2  # Object number of the output page tree root
+
+# Objects packed into each compressed object stream when optimizing
+OBJECT_STREAM_SIZE = 100
+
+
+class PageTreeWriter:
+    """
+    Writes a PDF made of pages from one source PDF, plus blank pads, by
+    rewriting the page tree only. Every output page gets a new page
+    dictionary, but the objects it references (content streams, fonts,
+    images, form XObjects) are copied byte for byte, once, and shared by
+    every page that references them. Nothing is decoded or re-encoded.
+
+    Blank pads have no content stream and share one empty resource
+    dictionary; they take the MediaBox of the source page before them.
+
+    Pages are written to the output stream in batches of batch_size, and
+    the reader's object cache is emptied after each batch, so memory stays
+    flat however many pages are written. Without a batch_size everything
+    is written on close().
+
+    The output page order only lives in the page tree root, written last,
+    so a page can also be written ahead with write_page() as soon as it is
+    known, and given its place later with add_written_page().
+
+    With optimize=True the output is also made smaller, without changing
+    any page: source objects with identical content (a font or logo
+    embedded once per account, say) are written once, and every object
+    that is not a stream, page dictionaries included, is packed into
+    compressed object streams, with a cross-reference stream in place of
+    the xref table. This needs PDF 1.5, so the header says at least that.
+    optimization_stats() then tells what was saved.
+    """
+
+    def __init__(self, reader, stream, batch_size=None, source_page_refs=None, optimize=False):
+        self.reader = reader
+        self.batch_size = batch_size
+        self.page_count = 0  # Pages added so far, blank pads included
+        self.blank_count = 0  # Blank pads added so far
+        # Pages waiting to be written: a 0-indexed source page, -1 for a blank pad
+        # or -2 for a page written ahead
+        self._entries = array('q')
+        # Source page whose MediaBox each waiting blank pad copies, by position
+        self._blank_sizes = {}
+        # Output object number of each waiting page written ahead, by position
+        self._written = {}
+        self._written_count = 0  # Pages written ahead, for trimming the reader cache
+        self._kids = array('q')  # Output object numbers of the pages written so far
+        self._blank_resources_num = None
+        # Another writer's source_page_refs() on the same reader saves walking the page tree again
+        self._source_page_nums, self._source_page_gens = source_page_refs or (None, None)
+        self._writer = _ObjectWriter(reader, stream, optimize=optimize)
+
+    def _load_source_pages(self):
+        """
+        Walks the source page tree and records each page's object number and
+        generation, without loading the pages into PyPDF2 page objects.
+        """
+        nums = array('q')
+        gens = array('q')
+        root = self.reader.trailer["/Root"].get_object()
+        stack = [root["/Pages"]]
+        while stack:
+            node_ref = stack.pop()
+            node = node_ref.get_object()
+            if "/Kids" in node:
+                # Push in reverse so the first kid is visited first
+                stack.extend(reversed(node["/Kids"].get_object()))
+            else:
+                nums.append(node_ref.idnum)
+                gens.append(node_ref.generation)
+                if self.batch_size and len(nums) % self.batch_size == 0:
+                    self._trim_reader_cache()
+        self._source_page_nums = nums
+        self._source_page_gens = gens
+
+    def source_page_count(self):
+        """
+        Returns the number of pages in the source PDF.
+        """
+        if self._source_page_nums is None:
+            self._load_source_pages()
+        return len(self._source_page_nums)
+
+    def source_page_refs(self):
+        """
+        Returns the object numbers and generations of the source pages, for
+        passing on to another writer on the same reader.
+        """
+        if self._source_page_nums is None:
+            self._load_source_pages()
+        return self._source_page_nums, self._source_page_gens
+
+    def _source_page_ref(self, page_index):
+        if self._source_page_nums is None:
+            self._load_source_pages()
+        return self._source_page_nums[page_index], self._source_page_gens[page_index]
+
+    def add_page(self, page_index):
+        """
+        Appends a source page (0-indexed) to the output.
+        """
+        self._entries.append(page_index)
+        self.page_count += 1
+        self._flush_full_batch()
+
+    def add_blank_page(self, like_page_index):
+        """
+        Appends a blank page sized like a source page (0-indexed).
+        """
+        self._blank_sizes[len(self._entries)] = like_page_index
+        self._entries.append(-1)
+        self.page_count += 1
+        self.blank_count += 1
+        self._flush_full_batch()
+
+    def write_page(self, page_index):
+        """
+        Writes a source page (0-indexed) to the output stream now, without
+        placing it in the output. Returns its output object number, for
+        add_written_page().
+        """
+        num = self._writer.write_source_page(self._source_page_ref(page_index))
+        self._written_count += 1
+        if self.batch_size and self._written_count % self.batch_size == 0:
+            self._trim_reader_cache()
+        return num
+
+    def add_written_page(self, num):
+        """
+        Appends a page written ahead by write_page() to the output.
+        """
+        self._written[len(self._entries)] = num
+        self._entries.append(-2)
+        self.page_count += 1
+        self._flush_full_batch()
+
+    def _flush_full_batch(self):
+        if self.batch_size and len(self._entries) >= self.batch_size:
+            self.flush()
+
+    def _trim_reader_cache(self):
+        """
+        Drops the objects the reader has parsed and cached so far. Objects
+        already written are never needed again, and anything else is parsed
+        again on demand.
+        """
+        self.reader.resolved_objects.clear()
+
+    def flush(self):
+        """
+        Writes the pages added since the last flush to the output stream.
+        """
+        writer = self._writer
+        for position, page_index in enumerate(self._entries):
+            if page_index >= 0:
+                self._kids.append(writer.write_source_page(self._source_page_ref(page_index)))
+            elif page_index == -2:
+                self._kids.append(self._written[position])
+            else:
+                if self._blank_resources_num is None:
+                    self._blank_resources_num = writer.write_raw(b"<< >>")
+                mediabox = writer.page_mediabox(self._source_page_ref(self._blank_sizes[position]))
+                self._kids.append(writer.write_raw(
+                    b"<< /Type /Page /Parent %d 0 R /MediaBox %s /Resources %d 0 R >>"
+                    % (PAGES_NUM, mediabox, self._blank_resources_num)
+                ))
+
+        self._entries = array('q')
+        self._blank_sizes = {}
+        self._written = {}
+        writer.stream.flush()
+        if self.batch_size:
+            self._trim_reader_cache()
+
+    def close(self):
+        """
+        Writes the remaining pages, the page tree and the file trailer.
+        """
+        self.flush()
+        self._writer.finish(self._kids)
+
+    def output_bytes(self):
+        """
+        Returns the number of bytes written to the output stream so far.
+        """
+        return self._writer.stream.tell()
+
+    def optimization_stats(self):
+        """
+        Returns what optimize=True saved, as a dictionary with the
+        'deduplicated_objects' not written because an identical object
+        was, the 'deduplicated_stream_bytes' of stream data among them, the
+        number of 'object_streams' and of 'packed_objects' in them, and the
+        size of those objects before and after compression
+        ('packed_bytes', 'packed_compressed_bytes'). None without optimize.
+        """
+        return dict(self._writer.stats) if self._writer.optimize else None
+
+
+def _is_page_tree_node(obj):
+    return isinstance(obj, DictionaryObject) and obj.get("/Type") in ("/Page", "/Pages")
+
+
+class _ObjectWriter:
+    """
+    Serializes objects from a PyPDF2 reader straight into an output stream,
+    renumbering indirect references as it goes. Each source object is
+    written at most once, and with optimize, so is each distinct content
+    (see PageTreeWriter).
+    """
+
+    def __init__(self, reader, stream, optimize=False):
+        self.reader = reader
+        self.stream = stream
+        self.optimize = optimize
+        # Indexed by object number; 1 and 2 are reserved. The file offset of
+        # an object, or its index in its object stream when it is packed
+        self.offsets = array('q', [0, 0, 0])
+        self.containers = array('q', [0, 0, 0])  # Object stream holding each object, 0 when it is not packed
+        self.id_map = {}  # (source idnum, generation) -> output object number
+        self.pending = []  # Source references assigned a number but not written yet
+        self.parent_attributes = {}  # (source idnum, generation) of a /Pages node -> inherited attributes
+        self.digests = {}  # (source idnum, generation) -> content digest, None if it can't be shared
+        self.digest_nums = {}  # Content digest -> output object number
+        self.packed = []  # (object number, serialized object) waiting for an object stream
+        self.stats = {'deduplicated_objects': 0, 'deduplicated_stream_bytes': 0, 'object_streams': 0,
+                      'packed_objects': 0, 'packed_bytes': 0, 'packed_compressed_bytes': 0}
+
+        header = reader.pdf_header
+        if isinstance(header, str):
+            header = header.encode()
+        if optimize and header[5:8] < b"1.5":
+            header = b"%PDF-1.5"  # Object and cross-reference streams
+        stream.write(header + b"\n%\xe2\xe3\xcf\xd3\n")
+
+    def _new_num(self):
+        self.offsets.append(0)
+        self.containers.append(0)
+        return len(self.offsets) - 1
+
+    def _begin(self, num):
+        self.offsets[num] = self.stream.tell()
+        self.stream.write(b"%d 0 obj\n" % num)
+
+    def _write_object(self, num, data):
+        """
+        Writes a serialized object that is not a stream, packing it into an
+        object stream when optimizing.
+        """
+        if self.optimize:
+            self.packed.append((num, data))
+            if len(self.packed) >= OBJECT_STREAM_SIZE:
+                self._write_object_stream()
+            return
+        self._begin(num)
+        self.stream.write(data)
+        self.stream.write(b"\nendobj\n")
+
+    def _write_object_stream(self):
+        """
+        Writes the objects packed so far as one compressed object stream.
+        """
+        num = self._new_num()
+        index = []
+        body = BytesIO()
+        for position, (packed_num, data) in enumerate(self.packed):
+            index.append(b"%d %d" % (packed_num, body.tell()))
+            body.write(data)
+            body.write(b"\n")
+            self.offsets[packed_num] = position
+            self.containers[packed_num] = num
+        first = b" ".join(index) + b"\n"
+        data = zlib.compress(first + body.getvalue())
+
+        self._begin(num)
+        self.stream.write(b"<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >>\nstream\n"
+                          % (len(self.packed), len(first), len(data)))
+        self.stream.write(data)
+        self.stream.write(b"\nendstream\nendobj\n")
+
+        self.stats['object_streams'] += 1
+        self.stats['packed_objects'] += len(self.packed)
+        self.stats['packed_bytes'] += len(first) + body.tell()
+        self.stats['packed_compressed_bytes'] += len(data)
+        self.packed = []
+
+    def write_raw(self, data):
+        """
+        Writes an already serialized object and returns its object number.
+        """
+        num = self._new_num()
+        self._write_object(num, data)
+        return num
+
+    def _digest(self, ref):
+        """
+        Returns a digest of the content of a source object and of every
+        object it references, so two objects with the same digest can be
+        written once and shared. Returns None for an object that is part of
+        a reference loop, or references one, and for annotations (see
+        _keep_unshared): those are never shared.
+        """
+        key = (ref.idnum, ref.generation)
+        if key in self.digests:
+            return self.digests[key]
+        self.digests[key] = None  # Until it is known; meeting it again on the way down means a loop
+        out = BytesIO()
+        if self._digest_into(ref.get_object(), out):
+            self.digests[key] = hashlib.blake2b(out.getvalue(), digest_size=16).digest()
+        return self.digests[key]
+
+    def _digest_into(self, obj, out):
+        """
+        Writes what identifies obj to out: obj as serialize() would write it,
+        with references replaced by the digests of what they point to.
+        Returns False if a reference could not be digested.
+        """
+        if isinstance(obj, IndirectObject):
+            if _is_page_tree_node(obj.get_object()):
+                out.write(b"null")  # Written as null, see _reference()
+                return True
+            digest = self._digest(obj)
+            if digest is None:
+                return False
+            out.write(b"R" + digest)
+            return True
+        if isinstance(obj, DictionaryObject):
+            out.write(b"<<")
+            # Key order does not matter; a stream's /Length is written from its data
+            for key, value in sorted(obj.items()):
+                if key == "/Length" and isinstance(obj, StreamObject):
+                    continue
+                out.write(b" ")
+                key.write_to_stream(out, None)
+                out.write(b" ")
+                if not self._digest_into(value, out):
+                    return False
+            out.write(b" >>")
+            if isinstance(obj, StreamObject):
+                out.write(b"stream" + hashlib.blake2b(obj._data, digest_size=16).digest())
+            return True
+        if isinstance(obj, ArrayObject):
+            out.write(b"[")
+            for value in obj:
+                out.write(b" ")
+                if not self._digest_into(value, out):
+                    return False
+            out.write(b"]")
+            return True
+        obj.write_to_stream(out, None)
+        return True
+
+    def _keep_unshared(self, annots):
+        """
+        Marks a page's /Annots array and the annotations in it as never
+        shared: an annotation belongs to one page, and two identical ones
+        (links to the same place, say) must stay two objects.
+        """
+        if isinstance(annots, IndirectObject):
+            self.digests[(annots.idnum, annots.generation)] = None
+            annots = annots.get_object()
+        for annotation in annots:
+            if isinstance(annotation, IndirectObject):
+                self.digests[(annotation.idnum, annotation.generation)] = None
+
+    def _reference(self, ref):
+        """
+        Returns the output reference for a source reference. References to
+        source page tree nodes become null: pages are only brought in
+        through write_source_page, never by following links (/Parent,
+        annotation /P, link destinations), or the whole source tree would be
+        pulled into the output.
+        """
+        key = (ref.idnum, ref.generation)
+        num = self.id_map.get(key)
+        if num is None:
+            obj = ref.get_object()
+            if _is_page_tree_node(obj):
+                return b"null"
+            digest = self._digest(ref) if self.optimize else None
+            num = self.digest_nums.get(digest) if digest else None
+            if num is not None:
+                # Identical to an object already written, or about to be
+                self.stats['deduplicated_objects'] += 1
+                if isinstance(obj, StreamObject):
+                    self.stats['deduplicated_stream_bytes'] += len(obj._data)
+            else:
+                num = self._new_num()
+                self.pending.append(ref)
+                if digest:
+                    self.digest_nums[digest] = num
+            self.id_map[key] = num
+        return b"%d 0 R" % num
+
+    def serialize(self, obj, out):
+        """
+        Writes obj to out, replacing indirect references with their output
+        object numbers.
+        """
+        if isinstance(obj, IndirectObject):
+            out.write(self._reference(obj))
+        elif isinstance(obj, StreamObject):
+            data = obj._data
+            out.write(b"<<")
+            for key, value in obj.items():
+                if key == "/Length":
+                    continue  # May be an indirect object; the real length is written below
+                out.write(b" ")
+                key.write_to_stream(out, None)
+                out.write(b" ")
+                self.serialize(value, out)
+            out.write(b" /Length %d >>\nstream\n" % len(data))
+            out.write(data)
+            out.write(b"\nendstream")
+        elif isinstance(obj, DictionaryObject):
+            out.write(b"<<")
+            for key, value in obj.items():
+                out.write(b" ")
+                key.write_to_stream(out, None)
+                out.write(b" ")
+                self.serialize(value, out)
+            out.write(b" >>")
+        elif isinstance(obj, ArrayObject):
+            out.write(b"[")
+            for i, value in enumerate(obj):
+                if i:
+                    out.write(b" ")
+                self.serialize(value, out)
+            out.write(b"]")
+        else:
+            obj.write_to_stream(out, None)
+
+    def _write_pending(self):
+        """
+        Writes every source object referenced so far that has not been
+        written yet (which may reference further objects).
+        """
+        while self.pending:
+            ref = self.pending.pop()
+            num = self.id_map[(ref.idnum, ref.generation)]
+            obj = ref.get_object()
+            if self.optimize and not isinstance(obj, StreamObject):
+                out = BytesIO()
+                self.serialize(obj, out)
+                self._write_object(num, out.getvalue())
+                continue
+            self._begin(num)
+            self.serialize(obj, self.stream)
+            self.stream.write(b"\nendobj\n")
+
+    def _parent_attributes(self, parent_ref):
+        """
+        Returns the inheritable attributes a /Pages node passes down to its
+        pages. Kept per node, so a large /Kids array is not parsed again
+        after the reader's cache has been emptied.
+        """
+        key = (parent_ref.idnum, parent_ref.generation)
+        attributes = self.parent_attributes.get(key)
+        if attributes is None:
+            node = parent_ref.get_object()
+            grandparent = node.get("/Parent")
+            attributes = dict(self._parent_attributes(grandparent)) if grandparent is not None else {}
+            for name in INHERITABLE_ATTRIBUTES:
+                if name in node:
+                    attributes[name] = node[name]
+            self.parent_attributes[key] = attributes
+        return attributes
+
+    def _inherited(self, page, key):
+        """
+        Looks up a page attribute, following /Parent for inheritable ones.
+        """
+        if key in page:
+            return page[key]
+        parent = page.get("/Parent")
+        if parent is None:
+            return None
+        return self._parent_attributes(parent).get(key)
+
+    def page_mediabox(self, page_ref):
+        """
+        Returns the serialized MediaBox of a source page.
+        """
+        page = self.reader.get_object(IndirectObject(page_ref[0], page_ref[1], self.reader))
+        mediabox = self._inherited(page, "/MediaBox")
+        if mediabox is None:
+            return LETTER_MEDIABOX
+        out = BytesIO()
+        self.serialize(mediabox.get_object(), out)
+        return out.getvalue()
+
+    def write_source_page(self, page_ref):
+        """
+        Writes a new page dictionary for a source page, with inherited
+        attributes pulled down from the source page tree, followed by any
+        objects it references that are not written yet. Returns the page's
+        output object number.
+        """
+        page = self.reader.get_object(IndirectObject(page_ref[0], page_ref[1], self.reader))
+        if "/Annots" in page:
+            self._keep_unshared(page.raw_get("/Annots"))
+        out = BytesIO()
+        out.write(b"<< /Type /Page /Parent %d 0 R" % PAGES_NUM)
+        for key, value in page.items():
+            # Structure tree links are dropped along with the structure tree
+            if key in ("/Type", "/Parent", "/StructParents"):
+                continue
+            out.write(b" ")
+            key.write_to_stream(out, None)
+            out.write(b" ")
+            self.serialize(value, out)
+        for key in INHERITABLE_ATTRIBUTES:
+            if key not in page:
+                value = self._inherited(page, key)
+                if value is not None:
+                    out.write(b" ")
+                    NameObject(key).write_to_stream(out, None)
+                    out.write(b" ")
+                    self.serialize(value, out)
+        out.write(b" >>")
+
+        num = self.write_raw(out.getvalue())
+        self._write_pending()
+        return num
+
+    def finish(self, kids):
+        """
+        Writes the page tree root, the catalog, the cross-reference table
+        and the trailer.
+        """
+        self._write_object(PAGES_NUM, b"<< /Type /Pages /Count %d /Kids [%s] >>"
+                           % (len(kids), b" ".join(b"%d 0 R" % num for num in kids)))
+        self._write_object(CATALOG_NUM, b"<< /Type /Catalog /Pages %d 0 R >>" % PAGES_NUM)
+        if self.optimize:
+            if self.packed:
+                self._write_object_stream()
+            self._write_xref_stream()
+            return
+
+        xref_location = self.stream.tell()
+        self.stream.write(b"xref\n0 %d\n" % len(self.offsets))
+        self.stream.write(b"0000000000 65535 f \n")
+        for offset in self.offsets[1:]:
+            self.stream.write(b"%010d 00000 n \n" % offset)
+        self.stream.write(b"trailer\n<< /Size %d /Root %d 0 R >>\n" % (len(self.offsets), CATALOG_NUM))
+        self.stream.write(b"startxref\n%d\n%%%%EOF\n" % xref_location)
+
+    def _write_xref_stream(self):
+        """
+        Writes a compressed cross-reference stream, which also holds the
+        trailer, in place of the xref table: one entry per object, its file
+        offset, or the object stream it is packed in and its index there.
+        """
+        num = self._new_num()
+        xref_location = self.stream.tell()
+        self.offsets[num] = xref_location
+        offset_size = 4 if xref_location < 2 ** 32 else 8
+        entry = struct.Struct(">B%sH" % ("I" if offset_size == 4 else "Q"))
+        entries = [entry.pack(0, 0, 65535)]
+        for container, offset in zip(self.containers[1:], self.offsets[1:]):
+            entries.append(entry.pack(2, container, offset) if container else entry.pack(1, offset, 0))
+        data = zlib.compress(b"".join(entries))
+
+        self._begin(num)
+        self.stream.write(b"<< /Type /XRef /Size %d /W [1 %d 2] /Root %d 0 R /Filter /FlateDecode /Length %d >>"
+                          b"\nstream\n" % (len(self.offsets), offset_size, CATALOG_NUM, len(data)))
+        self.stream.write(data)
+        self.stream.write(b"\nendstream\nendobj\n")
+        self.stream.write(b"startxref\n%d\n%%%%EOF\n" % xref_location)
@@ -0,0 +1,282 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from run_report import RunReport
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "data/reorder.sock"
+
+
+def _warm_worker():
+    """
+    Process pool initializer: imports every PDF library a job may need, so
+    jobs don't pay for it. Scan, shard and verification pools started by a
+    job are forked from this worker and start warm too.
+    """
+    # Job records go to the job's client only, not to the daemon's log
+    logging.getLogger().handlers.clear()
+
+    import main  # noqa: F401
+    import pdfminer.layout  # noqa: F401
+    import pdfplumber  # noqa: F401
+    import pypdfium2  # noqa: F401
+    import reportlab.pdfgen.canvas  # noqa: F401
+    import page_tree  # noqa: F401
+    import sharded_output  # noqa: F401
+    import verify_output  # noqa: F401
+
+
+def _ready(barrier):
+    """
+    Waits for every worker to pick up one of these, which makes the pool
+    start all its workers at once.
+    """
+    barrier.wait()
+    return os.getpid()
+
+
+def _run_job(argv, cwd, events):
+    """
+    Runs one reorder job inside a pool worker: argv holds main.py's options,
+    and paths are relative to cwd. main.py reads and writes paths relative
+    to the current directory, so the worker changes into cwd for the job:
+    that is process-wide state, which is safe because a pool worker runs
+    one job at a time and changes back when the job is over. Log records at the job's log level are
+    put on the events queue as they are emitted, then None once the job is
+    over. Returns a dictionary with 'status' ('ok' or 'failed'),
+    'exit_code', 'error' and the run 'report'.
+    """
+    from main import log_level, parse_args, run  # Only workers need it; submitting a job stays light
+
+    usage = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(usage):
+            args = parse_args(argv, prog="main.py")
+    except SystemExit as e:
+        events.put(None)
+        return {'status': 'failed', 'exit_code': e.code, 'error': usage.getvalue().strip(), 'report': None}
+
+    root = logging.getLogger()
+    handler = logging.handlers.QueueHandler(events)
+    root.addHandler(handler)
+    root.setLevel(log_level(args))
+    report = RunReport(profile=bool(args.profile))
+    exit_code = 0
+    error = None
+
+    daemon_cwd = os.getcwd()
+    try:
+        os.chdir(cwd)
+        run(args, report)
+    except SystemExit as e:
+        # main.py exits with a message or a status code
+        exit_code = e.code if isinstance(e.code, int) else 1
+        error = e.code if isinstance(e.code, str) else None
+    except Exception as e:
+        logging.getLogger("main").exception("Job failed")
+        exit_code = 1
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        os.chdir(daemon_cwd)
+        root.removeHandler(handler)
+        events.put(None)
+
+    return {'status': 'ok' if exit_code == 0 else 'failed', 'exit_code': exit_code, 'error': error,
+            'report': report.to_dict()}
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one connection: reads a job as a JSON line, {"argv": [...],
+    "cwd": "..."}, and writes JSON line events back until the job is done:
+    'accepted', then one 'log' event per log record, then 'done' with the
+    job's status, exit code, error and run report.
+    """
+
+    def send(self, event):
+        self.wfile.write(json.dumps(event).encode() + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        try:
+            job = json.loads(self.rfile.readline())
+            argv = [str(arg) for arg in job['argv']]
+            cwd = job.get('cwd') or os.getcwd()
+        except (ValueError, KeyError, TypeError) as e:
+            self.send({'event': 'done', 'status': 'failed', 'exit_code': 2, 'error': f"Invalid job: {e}",
+                       'report': None})
+            return
+
+        job_id = next(self.server.job_ids)
+        started = time.perf_counter()
+        logger.info("Job %d: %s (in %s)", job_id, " ".join(argv), cwd)
+        events = self.server.manager.Queue()
+        future = self.server.executor.submit(_run_job, argv, cwd, events)
+
+        try:
+            self.send({'event': 'accepted', 'job': job_id})
+            while True:
+                try:
+                    record = events.get(timeout=1)
+                except queue.Empty:
+                    if future.done() and events.empty():
+                        break  # The worker died before it could end the events
+                    continue
+                if record is None:
+                    break
+                self.send({'event': 'log', 'time': record.created, 'level': record.levelname,
+                           'name': record.name, 'message': record.getMessage()})
+
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'status': 'failed', 'exit_code': 1, 'error': f"{type(e).__name__}: {e}", 'report': None}
+            logger.info("Job %d %s in %.2fs", job_id, result['status'], time.perf_counter() - started)
+            self.send(dict(result, event='done', job=job_id))
+        except (BrokenPipeError, ConnectionResetError):
+            # The job runs on; only its events are lost
+            logger.warning("Job %d: client disconnected", job_id)
+
+
+class ReorderDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Long-running reorder service on a Unix socket. Jobs run on a pool of
+    worker processes that have already imported the PDF libraries, so a
+    job costs what its reorder costs and no more. Each connection is one
+    job; up to workers jobs run at once and the others wait their turn.
+    A worker must only ever run one job at a time, as a job changes the
+    worker's current directory (see _run_job): the pool is a process
+    pool, never a thread pool.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, workers=None):
+        self.socket_path = socket_path
+        self.job_ids = itertools.count(1)
+
+        if os.path.dirname(socket_path):
+            os.makedirs(os.path.dirname(socket_path), exist_ok=True)
+        if os.path.exists(socket_path):
+            # Refuse to take the socket over from a daemon that is still running
+            probe = socket.socket(socket.AF_UNIX)
+            try:
+                probe.connect(socket_path)
+                raise SystemExit(f"A reorder daemon is already listening on {socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(socket_path)
+            finally:
+                probe.close()
+
+        self.manager = multiprocessing.Manager()
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker)
+        # Start every worker now instead of on the first jobs
+        worker_count = workers or os.cpu_count()
+        barrier = self.manager.Barrier(worker_count)
+        pids = {future.result() for future in [self.executor.submit(_ready, barrier) for _ in range(worker_count)]}
+        logger.info("%d warm workers started", len(pids))
+
+        super().__init__(socket_path, JobHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown()
+        self.manager.shutdown()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def submit_job(argv, cwd=None, socket_path=DEFAULT_SOCKET_PATH):
+    """
+    Sends a job to the daemon and yields its events as dictionaries, ending
+    with the 'done' event. cwd defaults to the current directory.
+    """
+    with socket.socket(socket.AF_UNIX) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps({'argv': list(argv), 'cwd': os.path.abspath(cwd or os.getcwd())}).encode() + b"\n")
+        with client.makefile('rb') as events:
+            for line in events:
+                event = json.loads(line)
+                yield event
+                if event['event'] == 'done':
+                    return
+    raise ConnectionError(f"The reorder daemon on {socket_path} closed the connection before the job was done")
+
+
+def serve(socket_path=DEFAULT_SOCKET_PATH, workers=None):
+    """
+    Runs the daemon until it is interrupted or sent SIGTERM.
+    """
+    server = ReorderDaemon(socket_path, workers)
+    # shutdown() waits for serve_forever() to return, so it can't run on this thread
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    logger.info("Reorder daemon listening on %s", socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info("Reorder daemon stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run reorders on a warm local daemon.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH,
+                        help=f"Unix socket of the daemon (default: {DEFAULT_SOCKET_PATH})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Start the daemon")
+    serve_parser.add_argument("--workers", type=int, default=None,
+                              help="Jobs run at once, each on its own warm process (default: number of CPUs)")
+    submit_parser = subparsers.add_parser("submit", help="Run a reorder on the daemon and stream its progress")
+    submit_parser.add_argument("--print-report", action="store_true", help="Print the JSON run report to stdout")
+    submit_parser.add_argument("argv", nargs=argparse.REMAINDER,
+                               help="main.py options, after --; paths are relative to the current directory")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.command == "serve":
+        serve(args.socket, args.workers)
+        return
+
+    argv = args.argv[1:] if args.argv[:1] == ["--"] else args.argv
+    if not os.path.exists(args.socket):
+        raise SystemExit(f"No reorder daemon is listening on {args.socket}; start one with: reorder_daemon.py serve")
+    done = None
+    for event in submit_job(argv, socket_path=args.socket):
+        if event['event'] == 'log':
+            # Replay the job's records through local logging, keeping their time and origin
+            record = logging.makeLogRecord({'name': event['name'], 'levelname': event['level'],
+                                            'levelno': logging.getLevelName(event['level']),
+                                            'msg': event['message'], 'created': event['time'],
+                                            'msecs': event['time'] % 1 * 1000})
+            logging.getLogger(event['name']).handle(record)
+        elif event['event'] == 'done':
+            done = event
+
+    if done['error']:
+        logger.error(done['error'])
+    if args.print_report and done['report']:
+        json.dump(done['report'], sys.stdout, indent=2)
+        print()
+    raise SystemExit(done['exit_code'])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import logging
+from array import array
+
+
+logger = logging.getLogger(__name__)
+
+BLANK = 0  # Plan entry of a blank pad; pages are numbered from 1
+
+
+class ReorderPlan:
+    """
+    The reordered output, worked out before any PDF is opened. entries holds
+    one entry per output page: a 1-indexed Subordinate page, or BLANK for a
+    blank pad, sized like the page before it. Markers lay the entries out:
+      - accounts lists the subordinate accounts in output order, and
+        account_starts the position of each one's first entry
+      - sections lists the output sections as (kind, label, index of their
+        first account): 'master' with the master account, then 'bunchcode'
+        with the bunchcode of the accounts not in the Master PDF
+    Also keeps the subordinate accounts listed in the Master PDF but
+    missing from the Subordinate PDF, and the accounts not in the Master
+    PDF by bunchcode.
+    """
+
+    def __init__(self):
+        self.entries = array('q')
+        self.accounts = []
+        self.account_starts = array('q')
+        self.sections = []
+        self.missing_subordinates = []
+        self.orphans_by_bunchcode = {}
+        self.blank_count = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _add_accounts(self, subordinates, subordinate_data, placed=None):
+        """
+        Appends the pages of accounts found in subordinate_data, each
+        followed by a blank pad if it has an odd number of pages, so the
+        next account starts on a new sheet when printed duplex. Accounts
+        not found are added to missing_subordinates, and the ones placed to
+        the placed set, if given.
+        This runs once per account of the output, so it sticks to local
+        names and C-level array operations.
+        """
+        entries = self.entries
+        extend_entries = entries.extend
+        append_entry = entries.append
+        append_account = self.accounts.append
+        append_start = self.account_starts.append
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        for subordinate in subordinates:
+            data = subordinate_data.get(subordinate)
+            if data is None:
+                logger.warning("Subordinate account %s not found in subordinate data.", subordinate)
+                self.missing_subordinates.append(subordinate)
+                continue
+            pages = data['pages']
+            if debug:
+                logger.debug("Processing %s with %d page(s).", subordinate, len(pages))
+            append_account(subordinate)
+            append_start(len(entries))
+            extend_entries(pages)
+            if len(pages) % 2 != 0:
+                append_entry(BLANK)
+                self.blank_count += 1
+            if placed is not None:
+                placed.add(subordinate)
+
+    def account_entries(self, index):
+        """
+        Returns the entries of the account at index in accounts, blank pad
+        included.
+        """
+        end = self.account_starts[index + 1] if index + 1 < len(self.accounts) else len(self.entries)
+        return self.entries[self.account_starts[index]:end]
+
+    def iter_sections(self):
+        """
+        Yields each section as (kind, label, range of its account indexes).
+        """
+        for position, (kind, label, first) in enumerate(self.sections):
+            end = self.sections[position + 1][2] if position + 1 < len(self.sections) else len(self.accounts)
+            yield kind, label, range(first, end)
+
+    def stats(self):
+        """
+        Returns the plan's counts as a dictionary: output, source and blank
+        pages, accounts, Master sections, and the missing and orphan
+        accounts.
+        """
+        return {
+            'output_pages': len(self.entries),
+            'source_pages': len(self.entries) - self.blank_count,
+            'blank_pages': self.blank_count,
+            'accounts': len(self.accounts),
+            'master_accounts': sum(1 for kind, _, _ in self.sections if kind == 'master'),
+            'missing_subordinates': len(self.missing_subordinates),
+            'missing_subordinate_accounts': self.missing_subordinates,
+            'orphan_accounts_by_bunchcode': {bunchcode: len(accounts)
+                                             for bunchcode, accounts in sorted(self.orphans_by_bunchcode.items())},
+        }
+
+
+def build_plan(master_data, subordinate_data):
+    """
+    Plans the output in one pass over the Master accounts and one over the
+    Subordinate accounts: first the subordinate accounts in Master order,
+    then the accounts not in the Master PDF grouped by bunchcode and sorted
+    alphanumerically. Each account gets a blank pad if it has an odd number
+    of pages. Returns a ReorderPlan.
+    """
+    plan = ReorderPlan()
+    placed = set()  # Subordinate accounts already in the plan
+
+    logger.info("--Working Through Accounts In Master File--")
+    for master_account, subordinates in master_data.items():
+        first_account = len(plan.accounts)
+        plan._add_accounts(subordinates, subordinate_data, placed)
+        if len(plan.accounts) > first_account:
+            plan.sections.append(('master', master_account, first_account))
+
+    # Group the remaining accounts by bunchcode
+    for subordinate, data in subordinate_data.items():
+        if subordinate not in placed:
+            plan.orphans_by_bunchcode.setdefault(data['bunchcode'], []).append(subordinate)
+
+    logger.info("--Working Through Accounts NOT In Master File, Grouped By Bunchcode--")
+    for bunchcode in sorted(plan.orphans_by_bunchcode):
+        accounts = plan.orphans_by_bunchcode[bunchcode]
+        accounts.sort()
+        logger.info("Processing bunchcode %s with %d account(s).", bunchcode, len(accounts))
+        plan.sections.append(('bunchcode', bunchcode, len(plan.accounts)))
+        plan._add_accounts(accounts, subordinate_data)
+
+    return plan
+
+
+def write_plan(writer, entries, written_pages=None):
+    """
+    Adds plan entries to a PageTreeWriter: each source page, or with
+    written_pages (1-indexed source page -> output object number) the copy
+    of it already written ahead, and each blank pad, sized like the page
+    before it.
+    """
+    previous = 1
+    for entry in entries:
+        if entry == BLANK:
+            writer.add_blank_page(previous - 1)
+            continue
+        if written_pages is None:
+            writer.add_page(entry - 1)
+        else:
+            writer.add_written_page(written_pages[entry])
+        previous = entry
@@ -0,0 +1,89 @@
+import cProfile
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+class RunReport:
+    """
+    Collects per-phase timings and counters for one run and writes them as a
+    JSON report. Phases record wall time, CPU time of this process and, when
+    a page count is given, pages per second. With profile=True the phases
+    also run under one shared cProfile profiler (this process only; scan
+    workers are not profiled).
+    """
+
+    def __init__(self, profile=False):
+        self.started = time.time()
+        self.phases = {}
+        self.counters = {}
+        self.profiler = cProfile.Profile() if profile else None
+
+    @contextmanager
+    def phase(self, name, pages=None):
+        """
+        Times the body of a with block as the named phase.
+        """
+        logger.info("Starting phase %s", name)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if self.profiler:
+            self.profiler.enable()
+        try:
+            yield
+        finally:
+            if self.profiler:
+                self.profiler.disable()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self.phases[name] = {
+                'wall_seconds': round(wall, 3),
+                'cpu_seconds': round(cpu, 3),
+                'pages': pages,
+                'pages_per_second': round(pages / wall, 1) if pages and wall else None,
+            }
+            logger.info("Finished phase %s in %.2fs (%.2fs CPU)", name, wall, cpu)
+
+    def set_pages(self, name, pages):
+        """
+        Sets the page count of a phase whose size is only known once it has
+        run, and works out its pages per second.
+        """
+        phase = self.phases[name]
+        phase['pages'] = pages
+        phase['pages_per_second'] = round(pages / phase['wall_seconds'], 1) if phase['wall_seconds'] else None
+
+    def set(self, name, value):
+        """
+        Sets a counter or detail to a JSON-serializable value.
+        """
+        self.counters[name] = value
+
+    def to_dict(self):
+        return {
+            'started': self.started,
+            'total_seconds': round(time.time() - self.started, 3),
+            'phases': self.phases,
+            'counters': self.counters,
+        }
+
+    def write(self, report_path):
+        """
+        Writes the report as JSON.
+        """
+        with open(report_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        logger.info("Run report written to %s", report_path)
+
+    def dump_profile(self, profile_path):
+        """
+        Writes the cProfile statistics of the profiled phases, readable with
+        pstats or snakeviz.
+        """
+        if self.profiler:
+            self.profiler.dump_stats(profile_path)
+            logger.info("Profile written to %s", profile_path)
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from reorder_plan import build_plan, write_plan
+from utils import log_output_optimization
+
+logger = logging.getLogger(__name__)
+
+SHARD_MODES = ("master", "bunchcode", "account")
+MANIFEST_NAME = "manifest.json"
+
+# Source PDF opened once per shard worker process
+_reader = None
+_source_page_refs = None
+
+
+def plan_shards(plan, subordinate_data, shard_by="master"):
+    """
+    Splits a ReorderPlan into shards. Within a shard the accounts keep
+    their single-file output order. shard_by is:
+      'master': one shard per master account, then one per bunchcode group
+                of the accounts not in the Master PDF
+      'bunchcode': one shard per bunchcode, over all accounts, so a shard
+                   gathers accounts from all over the single-file output
+      'account': one shard per subordinate account
+    Returns a list of shards as dictionaries with the 'kind' and 'label' of
+    the shard, its 'accounts' in order and its plan 'entries'.
+    """
+    shards = []
+    shards_by_label = {}
+    for section_kind, section_label, account_indexes in plan.iter_sections():
+        for index in account_indexes:
+            subordinate = plan.accounts[index]
+            if shard_by == "account":
+                kind, label = "account", subordinate
+            elif shard_by == "bunchcode" or section_kind == "bunchcode":
+                kind, label = "bunchcode", subordinate_data[subordinate]['bunchcode']
+            else:
+                kind, label = section_kind, section_label
+
+            shard = shards_by_label.get((kind, label))
+            if shard is None:
+                shard = shards_by_label[(kind, label)] = {'kind': kind, 'label': label, 'accounts': [],
+                                                          'entries': array('q')}
+                shards.append(shard)
+            shard['accounts'].append(subordinate)
+            shard['entries'].extend(plan.account_entries(index))
+
+    return shards
+
+
+def _shard_filename(position, width, shard):
+    """
+    Returns a file name for a shard, numbered in output order.
+    """
+    label = re.sub(r'[^A-Za-z0-9._-]+', '_', shard['label']).strip('_') or "none"
+    return f"{position:0{width}d}-{shard['kind']}-{label}.pdf"
+
+
+def _open_source(subordinate_pdf_path):
+    """
+    Process pool initializer: opens the Subordinate PDF once per worker.
+    The file stays open for the life of the worker.
+    """
+    from PyPDF2 import PdfReader
+
+    global _reader
+    _reader = PdfReader(open(subordinate_pdf_path, 'rb'))
+
+
+def _write_shard(args):
+    """
+    Process pool entry point: writes one shard from its plan entries.
+    Returns the shard's page count, the
+    number of blank pages inserted, its size in bytes and its optimization
+    statistics (None unless optimize is set).
+    """
+    from page_tree import PageTreeWriter
+
+    global _source_page_refs
+    output_path, entries, batch_size, optimize = args
+
+    with open(output_path, 'wb') as output:
+        writer = PageTreeWriter(_reader, output, batch_size=batch_size, source_page_refs=_source_page_refs,
+                                optimize=optimize)
+        write_plan(writer, entries)
+        writer.close()
+        output_bytes = writer.output_bytes()
+
+    # Later shards in this worker reuse the source page list
+    _source_page_refs = writer.source_page_refs()
+    if batch_size:
+        _reader.resolved_objects.clear()
+    return writer.page_count, writer.blank_count, output_bytes, writer.optimization_stats()
+
+
+def write_shards(master_data, subordinate_data, subordinate_pdf_path, output_dir, shard_by="master", workers=None,
+                 batch_size=None, report=None, optimize=False, plan=None):
+    """
+    Writes the reordered output as one PDF per shard (see plan_shards) of a
+    ReorderPlan (see build_plan), built here unless one is given, into
+    output_dir, spread over a process pool of workers (default: one per
+    CPU). Every account gets the same blank page padding as in the single
+    file. Also writes a manifest.json listing each shard's file, accounts
+    and page counts, and returns it as a dictionary.
+    With a batch_size each worker writes in batches of that many pages.
+    optimize is as in reorder_and_merge, each shard sharing only its own
+    duplicate objects.
+    With a RunReport, the shard and page counts and the total size are
+    recorded in it.
+    """
+    logger.info("-------Starting Sharded PDF Creation (one file per %s)---------", shard_by)
+    if plan is None:
+        plan = build_plan(master_data, subordinate_data)
+    shards = plan_shards(plan, subordinate_data, shard_by)
+    missing_subordinates = plan.missing_subordinates
+
+    os.makedirs(output_dir, exist_ok=True)
+    width = len(str(len(shards)))
+    tasks = []
+    for position, shard in enumerate(shards, start=1):
+        shard['file'] = _shard_filename(position, width, shard)
+        tasks.append((os.path.join(output_dir, shard['file']), shard['entries'], batch_size, optimize))
+
+    worker_count = workers or os.cpu_count()
+    logger.info("Writing %d shards with %d workers...", len(shards), worker_count)
+    with ProcessPoolExecutor(max_workers=worker_count, initializer=_open_source,
+                             initargs=(subordinate_pdf_path,)) as executor:
+        # Small shards are handed out in runs, to keep the task overhead down
+        chunksize = max(1, len(tasks) // (worker_count * 4))
+        results = list(executor.map(_write_shard, tasks, chunksize=chunksize))
+
+    manifest_shards = []
+    optimization = None
+    for shard, (page_count, blank_count, output_bytes, shard_optimization) in zip(shards, results):
+        if shard_optimization:
+            optimization = {name: (optimization or {}).get(name, 0) + value
+                            for name, value in shard_optimization.items()}
+        manifest_shards.append({
+            'file': shard['file'],
+            'kind': shard['kind'],
+            'label': shard['label'],
+            'pages': page_count,
+            'blank_pages': blank_count,
+            'bytes': output_bytes,
+            'accounts': [{'account': subordinate,
+                          'bunchcode': subordinate_data[subordinate]['bunchcode'],
+                          'pages': len(subordinate_data[subordinate]['pages'])}
+                         for subordinate in shard['accounts']],
+        })
+
+    manifest = {
+        'source': subordinate_pdf_path,
+        'shard_by': shard_by,
+        'shards': manifest_shards,
+        'missing_subordinate_accounts': missing_subordinates,
+    }
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    output_pages = sum(shard['pages'] for shard in manifest_shards)
+    blank_pages = sum(shard['blank_pages'] for shard in manifest_shards)
+    output_bytes = sum(shard['bytes'] for shard in manifest_shards)
+    logger.info("Wrote %d shards with %d pages (%d blank, %.1f MB) to %s", len(shards), output_pages, blank_pages,
+                output_bytes / 2 ** 20, output_dir)
+    if optimization:
+        log_output_optimization(optimization)
+    logger.info("Shard manifest written to %s", manifest_path)
+
+    if report:
+        report.set('shards', len(shards))
+        report.set('output_pages', output_pages)
+        report.set('blank_pages_inserted', blank_pages)
+        report.set('output_bytes', output_bytes)
+        if optimization:
+            report.set('output_optimization', optimization)
+        report.set('missing_subordinates', len(missing_subordinates))
+        report.set('missing_subordinate_accounts', missing_subordinates)
+        report.set('shard_manifest', manifest_path)
+
+    return manifest
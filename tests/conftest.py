@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_test_data import generate_dataset
+
+
+@pytest.fixture(scope="session")
+def dataset(tmp_path_factory):
+    """
+    A small generated Master.pdf / Subordinate.pdf pair, with orphan
+    accounts, accounts missing from the Subordinate PDF and blank pages.
+    """
+    return generate_dataset(str(tmp_path_factory.mktemp("data")), total_pages=60, master_count=3,
+                            orphan_ratio=0.1, missing_ratio=0.05, seed=1)
@@ -0,0 +1,71 @@
+import pytest
+
+import account_index
+import main
+from account_index import AccountIndex
+from main import parse_args, reorder_from_index, save_index
+from page_cache import PageCache
+from run_report import RunReport
+from utils import extract_master_data, extract_subordinate_data
+from verify_output import expected_output, fingerprint_pages
+
+
+@pytest.fixture(scope="module")
+def index_path(dataset, tmp_path_factory):
+    """
+    Builds an account index from the fixture PDFs the way a full run does,
+    with the file hashes computed for the page cache.
+    """
+    master_pdf, subordinate_pdf = dataset
+    tmp = tmp_path_factory.mktemp("index")
+    cache = PageCache(str(tmp / "cache.sqlite"))
+    report = RunReport()
+    master_data = extract_master_data(master_pdf, cache=cache, report=report)
+    subordinate_data = extract_subordinate_data(subordinate_pdf, cache=cache, report=report)
+
+    path = str(tmp / "index.sqlite")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(account_index, "file_hash", pytest.fail)  # The hashes are passed through
+        save_index(path, master_data, master_pdf, subordinate_data, subordinate_pdf, report)
+    return path, master_data, subordinate_data
+
+
+def test_index_keeps_the_accounts_of_a_run(index_path):
+    path, master_data, subordinate_data = index_path
+    with AccountIndex(path) as index:
+        assert index.master_data() == master_data
+        assert list(index.master_data()) == list(master_data)
+        saved = index.subordinate_data()
+        assert list(saved) == list(subordinate_data)
+        for account, data in subordinate_data.items():
+            assert list(saved[account]['pages']) == list(data['pages'])
+            assert saved[account]['bunchcode'] == data['bunchcode']
+            assert list(index.account_pages(account)) == list(data['pages'])
+        assert index.account_pages("no such account") is None
+
+
+def test_reorder_from_index_does_not_parse_the_pdfs(dataset, index_path, tmp_path, monkeypatch):
+    _, subordinate_pdf = dataset
+    path, master_data, subordinate_data = index_path
+    monkeypatch.setattr(main, "extract_master_data", pytest.fail)
+    monkeypatch.setattr(main, "extract_subordinate_data", pytest.fail)
+
+    output_pdf = str(tmp_path / "Output.pdf")
+    args = parse_args(["reorder", "--master-index", path, "--subordinate-index", path,
+                       "--subordinate", subordinate_pdf, "--output", output_pdf, "--verify"])
+    report = RunReport()
+    reorder_from_index(args, report)
+    assert report.counters['verification']['ok']
+
+    input_fingerprints = fingerprint_pages(subordinate_pdf)
+    assert fingerprint_pages(output_pdf) == [input_fingerprints[page - 1] if page else None
+                                             for _, page in expected_output(master_data, subordinate_data)]
+
+
+def test_reorder_from_index_refuses_a_changed_pdf(dataset, index_path, tmp_path):
+    master_pdf, _ = dataset
+    path, _, _ = index_path
+    args = parse_args(["reorder", "--master-index", path, "--subordinate-index", path,
+                       "--subordinate", master_pdf, "--output", str(tmp_path / "Output.pdf")])
+    with pytest.raises(SystemExit, match="does not match"):
+        reorder_from_index(args, RunReport())
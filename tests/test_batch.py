@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from batch import find_jobs, run_batch
+from utils import extract_master_data, extract_subordinate_data
+from verify_output import expected_output, fingerprint_pages
+
+
+def _manifest(tmp_path, entries):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps(entries))
+    return str(path)
+
+
+def test_manifest_jobs_run_to_their_outputs(dataset, tmp_path):
+    master_pdf, subordinate_pdf = dataset
+    manifest = _manifest(tmp_path, [
+        {'name': "north", 'master': master_pdf, 'subordinate': subordinate_pdf, 'output': "north.pdf"},
+        {'name': "south", 'master': master_pdf, 'subordinate': subordinate_pdf, 'output': "south.pdf"},
+    ])
+    jobs = find_jobs(manifest)
+    assert [job['output'] for job in jobs] == [str(tmp_path / "north.pdf"), str(tmp_path / "south.pdf")]
+
+    summary = run_batch(jobs, workers=1, use_cache=False)
+    assert summary['succeeded'] == summary['job_count'] == 2
+    assert summary['subordinate_pages'] == 2 * len(fingerprint_pages(subordinate_pdf))
+
+    input_fingerprints = fingerprint_pages(subordinate_pdf)
+    expected = [input_fingerprints[page - 1] if page else None
+                for _, page in expected_output(extract_master_data(master_pdf),
+                                               extract_subordinate_data(subordinate_pdf))]
+    for job in summary['jobs']:
+        assert job['status'] == 'ok'
+        assert fingerprint_pages(job['output']) == expected
+
+
+def test_manifest_rejects_duplicate_job_names(dataset, tmp_path):
+    master_pdf, subordinate_pdf = dataset
+    entry = {'name': "north", 'master': master_pdf, 'subordinate': subordinate_pdf}
+    manifest = _manifest(tmp_path, [entry, dict(entry, output="other.pdf")])
+    with pytest.raises(ValueError, match="north"):
+        find_jobs(manifest)
@@ -0,0 +1,16 @@
+from PyPDF2 import PdfReader
+
+from generate_test_data import generate_dataset
+from utils import extract_subordinate_data
+
+
+def test_dataset_of_an_account_count(tmp_path):
+    _, subordinate_pdf = generate_dataset(str(tmp_path), total_pages=5, master_count=2, account_count=12, seed=3)
+    subordinate_data = extract_subordinate_data(subordinate_pdf)
+    assert len(subordinate_data) == 12
+    assert len(PdfReader(subordinate_pdf).pages) == sum(len(data['pages']) for data in subordinate_data.values())
+
+
+def test_dataset_of_a_page_count(dataset):
+    _, subordinate_pdf = dataset
+    assert len(PdfReader(subordinate_pdf).pages) == 60
@@ -0,0 +1,120 @@
+from io import BytesIO
+
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+
+from account_index import AccountIndex
+from run_report import RunReport
+from utils import extract_subordinate_data, extract_subordinate_data_incremental
+
+
+def _write_first_pages(source_pdf, path, page_count):
+    writer = PdfWriter()
+    reader = PdfReader(source_pdf)
+    for page in reader.pages[:page_count]:
+        writer.add_page(page)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+def _append_incrementally(old_pdf, source_pdf, path):
+    """
+    Writes old_pdf followed by an incremental update adding the pages of
+    source_pdf past old_pdf's page count, with old_pdf's first page
+    resources (the generator gives every page the same ones).
+    """
+    with open(old_pdf, 'rb') as f:
+        old_bytes = f.read()
+    old = PdfReader(old_pdf)
+    source = PdfReader(source_pdf)
+    pages_ref = old.trailer["/Root"].raw_get("/Pages")
+    kids = [f"{kid.idnum} {kid.generation} R" for kid in old.get_object(pages_ref).raw_get("/Kids")]
+    resources = BytesIO()
+    old.pages[0].raw_get("/Resources").write_to_stream(resources, None)
+
+    update = BytesIO()
+    offsets = {}
+    num = old.trailer["/Size"]
+
+    def write_object(obj_num, data):
+        offsets[obj_num] = len(old_bytes) + update.tell()
+        update.write(f"{obj_num} 0 obj\n".encode() + data + b"\nendobj\n")
+
+    for page in source.pages[len(old.pages):]:
+        contents = page["/Contents"].get_object()
+        stream_filter = BytesIO()
+        contents["/Filter"].write_to_stream(stream_filter, None)
+        write_object(num, b"<< /Length %d /Filter %s >>\nstream\n" % (len(contents._data), stream_filter.getvalue())
+                     + contents._data + b"\nendstream")
+        write_object(num + 1, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                     b"/Resources %s >>" % (pages_ref.idnum, num, resources.getvalue()))
+        kids.append(f"{num + 1} 0 R")
+        num += 2
+    write_object(pages_ref.idnum, f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode())
+
+    xref_offset = len(old_bytes) + update.tell()
+    update.write(b"xref\n0 1\n0000000000 65535 f \n")
+    for obj_num, offset in sorted(offsets.items()):
+        update.write(b"%d 1\n%010d 00000 n \n" % (obj_num, offset))
+    previous = int(old_bytes.rsplit(b"startxref", 1)[1].split()[0])
+    root = old.trailer.raw_get("/Root")
+    update.write(f"trailer\n<< /Size {num} /Root {root.idnum} 0 R /Prev {previous} >>\n"
+                 f"startxref\n{xref_offset}\n%%EOF\n".encode())
+    with open(path, 'wb') as f:
+        f.write(old_bytes + b"\n" * (not old_bytes.endswith(b"\n")) + update.getvalue())
+
+
+@pytest.fixture(scope="module")
+def full_scan(dataset):
+    return extract_subordinate_data(dataset[1])
+
+
+@pytest.fixture(scope="module")
+def split_page(full_scan):
+    """
+    A page count that cuts an account in two: its first page is the last
+    old page.
+    """
+    return next(data['pages'][0] for data in full_scan.values() if len(data['pages']) > 1 and data['pages'][0] > 1)
+
+
+@pytest.mark.parametrize("appended", ["update", "rewritten"])
+def test_account_runs_on_into_appended_pages(dataset, full_scan, split_page, tmp_path, appended):
+    _, subordinate_pdf = dataset
+    old_pdf = str(tmp_path / "old.pdf")
+    new_pdf = str(tmp_path / "new.pdf")
+    _write_first_pages(subordinate_pdf, old_pdf, split_page)
+    if appended == "update":
+        _append_incrementally(old_pdf, subordinate_pdf, new_pdf)
+    else:
+        _write_first_pages(subordinate_pdf, new_pdf, len(PdfReader(subordinate_pdf).pages))
+
+    with AccountIndex(str(tmp_path / "index.sqlite")) as index:
+        extract_subordinate_data_incremental(old_pdf, index)
+        report = RunReport()
+        subordinate_data = extract_subordinate_data_incremental(new_pdf, index, report=report)
+
+    assert subordinate_data == full_scan
+    assert report.counters['subordinate_pages_scanned'] == len(PdfReader(subordinate_pdf).pages) - split_page
+    assert report.counters['subordinate_prefix_check'] == ("bytes" if appended == "update" else "pages")
+
+
+def test_changed_old_page_is_scanned_again(dataset, full_scan, split_page, tmp_path):
+    _, subordinate_pdf = dataset
+    old_pdf = str(tmp_path / "old.pdf")
+    _write_first_pages(subordinate_pdf, old_pdf, split_page)
+
+    with AccountIndex(str(tmp_path / "index.sqlite")) as index:
+        extract_subordinate_data_incremental(old_pdf, index)
+        # Same page count, the last old page dropped for the one after it
+        writer = PdfWriter()
+        reader = PdfReader(subordinate_pdf)
+        for page in list(reader.pages[:split_page - 1]) + list(reader.pages[split_page:]):
+            writer.add_page(page)
+        new_pdf = str(tmp_path / "new.pdf")
+        with open(new_pdf, 'wb') as f:
+            writer.write(f)
+        report = RunReport()
+        extract_subordinate_data_incremental(new_pdf, index, report=report)
+
+    assert report.counters['subordinate_pages_scanned'] == len(reader.pages) - 1
@@ -0,0 +1,16 @@
+import pytest
+
+from main import parse_args
+
+
+@pytest.mark.parametrize("argv", [
+    ["--dry-run", "--verify", "--batch-size", "7", "reorder"],
+    ["reorder", "--dry-run", "--verify", "--batch-size", "7"],
+    ["--dry-run", "reorder", "--verify", "--batch-size", "7"],
+])
+def test_shared_options_apply_on_either_side_of_the_subcommand(argv):
+    args = parse_args(argv)
+    assert args.command == "reorder"
+    assert args.dry_run and args.verify
+    assert args.batch_size == 7
+    assert not args.streaming and args.shard_by is None
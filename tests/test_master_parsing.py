@@ -0,0 +1,64 @@
+import pytest
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from generate_test_data import LEFT_MARGIN, LINE_HEIGHT, TOP_MARGIN
+from utils import extract_master_data
+
+
+def _draw_page(c, lines, order):
+    """
+    Draws lines at the positions _draw_lines would, in the order of the
+    line indexes in order, so the content stream runs out of reading order.
+    """
+    top = letter[1] - TOP_MARGIN
+    for index in order:
+        c.drawString(LEFT_MARGIN, top - index * LINE_HEIGHT, lines[index])
+    c.showPage()
+
+
+def _rows(first, count):
+    return [f"{100000000 + first + i} / {1000000 + first + i:07d} METER SITE {i + 1} $10.00" for i in range(count)]
+
+
+def _subordinates(first, count):
+    return [f"{100000000 + first + i} - {1000000 + first + i:07d}" for i in range(count)]
+
+
+def _first_page(page_count, name, number, rows):
+    return [f"Page 1 of {page_count}", "Electric Summary Billing Statement for:", name,
+            f"Account Number: {number}", "Statement Date: 26-DEC-2024",
+            "Account Number Name/ID Total"] + rows
+
+
+@pytest.fixture
+def out_of_order_master(tmp_path):
+    """
+    A Master PDF whose pages do not draw their text top to bottom: a
+    continuation page draws its rows before the page number and header,
+    and the first page of the second Master Account draws "Page 1 of 1"
+    after its body.
+    """
+    path = str(tmp_path / "Master.pdf")
+    c = canvas.Canvas(path, pagesize=letter)
+
+    lines = _first_page(2, "FIRST", "500000000", _rows(0, 30))
+    _draw_page(c, lines, range(len(lines)))
+    lines = ["Page 2 of 2", "Account Number Name/ID Total"] + _rows(30, 30) + ["Final Bill Transfers"]
+    _draw_page(c, lines, list(range(2, len(lines))) + [0, 1])
+
+    lines = _first_page(1, "SECOND", "500000001", _rows(100, 20)) + ["Final Bill Transfers"]
+    _draw_page(c, lines, list(range(1, len(lines))) + [0])
+
+    c.save()
+    return path
+
+
+@pytest.mark.parametrize("backend", ["pdfplumber", "pdfium"])
+def test_learned_table_reads_pages_drawn_out_of_order(out_of_order_master, backend):
+    expected = {
+        "500000000 - FIRST": _subordinates(0, 60),
+        "500000001 - SECOND": _subordinates(100, 20),
+    }
+    assert extract_master_data(out_of_order_master, backend=backend, learn_table=False) == expected
+    assert extract_master_data(out_of_order_master, backend=backend, learn_table=True) == expected
@@ -0,0 +1,26 @@
+from page_cache import PageCache
+from utils import extract_master_data, extract_subordinate_data
+
+
+def test_cache_keeps_master_reads_apart_by_learn_table(dataset, tmp_path):
+    master_pdf, _ = dataset
+    cache = PageCache(str(tmp_path / "cache.sqlite"))
+    learned = extract_master_data(master_pdf, cache=cache, learn_table=True)
+    assert cache.hits == 0
+
+    assert extract_master_data(master_pdf, cache=cache, learn_table=False) == learned
+    assert cache.hits == 0
+    assert extract_master_data(master_pdf, cache=cache, learn_table=True) == learned
+    assert cache.hits > 0
+
+
+def test_cache_keeps_subordinate_reads_apart_by_layout(dataset, tmp_path):
+    _, subordinate_pdf = dataset
+    cache = PageCache(str(tmp_path / "cache.sqlite"))
+    by_layout = extract_subordinate_data(subordinate_pdf, cache=cache)
+    assert cache.hits == 0
+
+    assert extract_subordinate_data(subordinate_pdf, cache=cache, layout=None) == by_layout
+    assert cache.hits == 0
+    assert extract_subordinate_data(subordinate_pdf, cache=cache) == by_layout
+    assert cache.hits > 0
@@ -0,0 +1,129 @@
+import re
+
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import AnnotationBuilder
+
+from page_tree import OBJECT_STREAM_SIZE, PageTreeWriter
+from text_backends import open_document
+from verify_output import fingerprint_pages
+
+
+@pytest.fixture(scope="module")
+def duplicated_pdf(dataset, tmp_path_factory):
+    """
+    The Subordinate PDF's pages twice over, copied from two readers, so each
+    copy has its own font and logo objects, identical to the other's.
+    """
+    _, subordinate_pdf = dataset
+    path = str(tmp_path_factory.mktemp("duplicated") / "Duplicated.pdf")
+    readers = [PdfReader(subordinate_pdf), PdfReader(subordinate_pdf)]  # Kept alive while the writer copies
+    writer = PdfWriter()
+    for reader in readers:
+        for page in reader.pages:
+            writer.add_page(page)
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return path
+
+
+def _write(source_pdf, output_pdf, pages, optimize, batch_size=None):
+    """
+    Writes pages (0-indexed source pages, None for a blank pad) with a
+    PageTreeWriter and returns its optimization_stats().
+    """
+    with open(source_pdf, 'rb') as f, open(output_pdf, 'wb') as output:
+        writer = PageTreeWriter(PdfReader(f), output, batch_size=batch_size, optimize=optimize)
+        previous = 0
+        for page in pages:
+            if page is None:
+                writer.add_blank_page(previous)
+            else:
+                writer.add_page(page)
+                previous = page
+        writer.close()
+        return writer.optimization_stats()
+
+
+@pytest.mark.parametrize("batch_size", [None, 7])
+def test_optimized_output_has_the_same_pages(duplicated_pdf, tmp_path, batch_size):
+    page_count = len(PdfReader(duplicated_pdf).pages)
+    pages = [page for index in reversed(range(page_count)) for page in ([index, None] if index % 3 else [index])]
+    plain_pdf, optimized_pdf = str(tmp_path / "plain.pdf"), str(tmp_path / "optimized.pdf")
+    assert _write(duplicated_pdf, plain_pdf, pages, optimize=False, batch_size=batch_size) is None
+    stats = _write(duplicated_pdf, optimized_pdf, pages, optimize=True, batch_size=batch_size)
+
+    input_fingerprints = fingerprint_pages(duplicated_pdf)
+    expected = [input_fingerprints[page] if page is not None else None for page in pages]
+    assert fingerprint_pages(plain_pdf) == fingerprint_pages(optimized_pdf) == expected
+    with open_document(optimized_pdf, "pdfium") as document:
+        assert len(document) == len(pages)
+
+    # The second copy's fonts and logo are written once, for a smaller file
+    assert stats['deduplicated_objects'] > 0 and stats['deduplicated_stream_bytes'] > 0
+    with open(plain_pdf, 'rb') as f:
+        plain = f.read()
+    with open(optimized_pdf, 'rb') as f:
+        optimized = f.read()
+    assert len(optimized) < len(plain)
+
+    # Everything but streams is packed into object streams, indexed by a cross-reference stream
+    assert optimized.startswith(b"%PDF-1.5")
+    assert b"/Type /XRef" in optimized and b"\nxref\n" not in optimized
+    assert optimized.count(b"/Type /ObjStm") == stats['object_streams'] > 1
+    assert stats['packed_objects'] <= stats['object_streams'] * OBJECT_STREAM_SIZE
+    assert stats['packed_compressed_bytes'] < stats['packed_bytes']
+    assert not re.search(rb"\d+ 0 obj\s*<<\s*/Type /Page\b", optimized)
+
+
+def test_identical_annotations_stay_on_their_own_page(dataset, tmp_path):
+    _, subordinate_pdf = dataset
+    source_pdf = str(tmp_path / "links.pdf")
+    writer = PdfWriter()
+    for page in PdfReader(subordinate_pdf).pages[:2]:
+        writer.add_page(page)
+    for page_number in range(2):
+        writer.add_annotation(page_number, AnnotationBuilder.link(rect=(50, 50, 200, 80), url="https://example.com"))
+    with open(source_pdf, 'wb') as f:
+        writer.write(f)
+
+    output_pdf = str(tmp_path / "optimized.pdf")
+    _write(source_pdf, output_pdf, [0, 1], optimize=True)
+    first, second = (page.raw_get("/Annots")[0] for page in PdfReader(output_pdf).pages)
+    assert first.idnum != second.idnum
+    assert first.get_object()["/A"] == second.get_object()["/A"]
+
+
+class _CountingCache(dict):
+    """
+    A reader object cache that counts how often it is emptied.
+    """
+
+    clears = 0
+
+    def clear(self):
+        self.clears += 1
+        super().clear()
+
+
+def test_batches_are_written_as_pages_are_added(dataset, tmp_path):
+    _, subordinate_pdf = dataset
+    pages = [index for index in reversed(range(20)) for _ in range(2)]
+    plain_pdf = str(tmp_path / "plain.pdf")
+    _write(subordinate_pdf, plain_pdf, pages, optimize=False)
+
+    batched_pdf = str(tmp_path / "batched.pdf")
+    with open(subordinate_pdf, 'rb') as f, open(batched_pdf, 'wb') as output:
+        reader = PdfReader(f)
+        reader.resolved_objects = _CountingCache(reader.resolved_objects)
+        writer = PageTreeWriter(reader, output, batch_size=7)
+        sizes = []
+        for page in pages:
+            writer.add_page(page)
+            sizes.append(output.tell())
+        assert reader.resolved_objects.clears >= len(pages) // 7
+        writer.close()
+
+    # Each full batch reaches the file before the next page is added, not on close()
+    assert sizes[5] == sizes[0] < sizes[6] == sizes[12] < sizes[13]
+    assert fingerprint_pages(batched_pdf) == fingerprint_pages(plain_pdf)
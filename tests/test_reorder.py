@@ -0,0 +1,146 @@
+import os
+import re
+
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+
+from reorder_plan import BLANK, build_plan
+from run_report import RunReport
+from sharded_output import write_shards
+from utils import extract_master_data, extract_subordinate_data, reorder_and_merge, scan_reorder_and_merge
+from verify_output import expected_output, fingerprint_pages, verify_output
+
+MODES = [
+    ("single", None),
+    ("batched", None),
+    ("sharded", "master"),
+    ("sharded", "bunchcode"),
+    ("sharded", "account"),
+]
+
+
+@pytest.fixture(scope="module")
+def extracted(dataset):
+    master_pdf, subordinate_pdf = dataset
+    return extract_master_data(master_pdf), extract_subordinate_data(subordinate_pdf)
+
+
+def _write(mode, shard_by, dataset, extracted, tmp_path, plan=None, optimize=False):
+    """
+    Writes the output in one of MODES and returns the output PDF paths.
+    """
+    _, subordinate_pdf = dataset
+    master_data, subordinate_data = extracted
+    if mode == "sharded":
+        shard_dir = str(tmp_path / "shards")
+        manifest = write_shards(master_data, subordinate_data, subordinate_pdf, shard_dir, shard_by=shard_by,
+                                workers=1, optimize=optimize, plan=plan)
+        return [os.path.join(shard_dir, shard['file']) for shard in manifest['shards']]
+
+    tmp_path.mkdir(exist_ok=True)
+    output_pdf = str(tmp_path / "Output.pdf")
+    reorder_and_merge(master_data, subordinate_data, subordinate_pdf, output_pdf,
+                      batch_size=7 if mode == "batched" else None, optimize=optimize, plan=plan)
+    return [output_pdf]
+
+
+def _check_output(dataset, extracted, output_paths, shard_by):
+    """
+    Checks that the output holds the expected source pages, in order, with a
+    blank pad the size of the page before it where one is expected.
+    """
+    _, subordinate_pdf = dataset
+    master_data, subordinate_data = extracted
+    expected = expected_output(master_data, subordinate_data, shard_by)
+    input_fingerprints = fingerprint_pages(subordinate_pdf)
+    output_fingerprints = [fingerprint for path in output_paths for fingerprint in fingerprint_pages(path)]
+    assert output_fingerprints == [input_fingerprints[page - 1] if page else None for _, page in expected]
+
+    pages = [page for path in output_paths for page in PdfReader(path).pages]
+    for position, (_, page) in enumerate(expected):
+        if page is None:
+            assert "/Contents" not in pages[position]
+            assert list(pages[position].mediabox) == list(pages[position - 1].mediabox)
+    return expected
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+@pytest.mark.parametrize("mode, shard_by", MODES)
+def test_output_follows_the_plan(dataset, extracted, tmp_path, mode, shard_by, optimize):
+    output_paths = _write(mode, shard_by, dataset, extracted, tmp_path, optimize=optimize)
+    expected = _check_output(dataset, extracted, output_paths, shard_by)
+    assert any(page is None for _, page in expected)  # The dataset has blank pads to check
+
+    master_data, subordinate_data = extracted
+    result = verify_output(master_data, subordinate_data, dataset[1], output_paths, shard_by=shard_by, workers=1)
+    assert result['ok']
+    assert result['output_pages'] == result['expected_output_pages'] == len(expected)
+
+
+def test_verify_finds_swapped_and_duplicated_pages(dataset, extracted, tmp_path):
+    master_data, subordinate_data = extracted
+    plan = build_plan(master_data, subordinate_data)
+    first, second = plan.accounts[0], plan.accounts[1]
+    start, end = plan.account_starts[0], plan.account_starts[2]
+    # Swap the first two accounts' pages
+    plan.entries[start:end] = plan.account_entries(1) + plan.account_entries(0)
+    output_paths = _write("single", None, dataset, extracted, tmp_path / "swapped", plan)
+
+    result = verify_output(master_data, subordinate_data, dataset[1], output_paths, workers=1)
+    assert not result['ok']
+    assert set(result['mismatched_accounts']) >= {first, second}
+    assert not (result['dropped_input_pages'] or result['duplicated_input_pages'] or result['unknown_output_pages'])
+
+    plan = build_plan(master_data, subordinate_data)
+    source_pages = [position for position, entry in enumerate(plan.entries) if entry != BLANK]
+    dropped = plan.entries[source_pages[1]]
+    plan.entries[source_pages[1]] = plan.entries[source_pages[0]]
+    output_paths = _write("single", None, dataset, extracted, tmp_path / "duplicated", plan)
+
+    result = verify_output(master_data, subordinate_data, dataset[1], output_paths, workers=1)
+    assert not result['ok']
+    assert result['dropped_input_pages'] == [dropped]
+    assert result['duplicated_input_pages'] == [plan.entries[source_pages[0]]]
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_pipelined_returns_the_plan_it_wrote(dataset, extracted, tmp_path, optimize):
+    _, subordinate_pdf = dataset
+    master_data, subordinate_data = extracted
+    output_pdf = str(tmp_path / "Output.pdf")
+    scanned, plan = scan_reorder_and_merge(master_data, subordinate_pdf, output_pdf, optimize=optimize)
+
+    assert scanned == subordinate_data
+    assert plan.stats() == build_plan(master_data, subordinate_data).stats()
+    _check_output(dataset, extracted, [output_pdf], None)
+    assert verify_output(master_data, subordinate_data, subordinate_pdf, output_pdf, workers=1, plan=plan)['ok']
+
+
+def test_pipelined_leaves_a_duplicated_account_unreferenced(dataset, extracted, tmp_path):
+    _, subordinate_pdf = dataset
+    master_data, subordinate_data = extracted
+    account, data = next(iter(subordinate_data.items()))
+    source_pdf = str(tmp_path / "Duplicated.pdf")
+    writer = PdfWriter()
+    reader = PdfReader(subordinate_pdf)
+    for page in list(reader.pages) + [reader.pages[page - 1] for page in data['pages']]:
+        writer.add_page(page)
+    with open(source_pdf, 'wb') as f:
+        writer.write(f)
+
+    output_pdf = str(tmp_path / "Output.pdf")
+    report = RunReport()
+    scanned, plan = scan_reorder_and_merge(master_data, source_pdf, output_pdf, report=report)
+    assert scanned == extract_subordinate_data(source_pdf)
+    assert scanned[account]['pages'][0] == len(reader.pages) + 1  # The later copy wins
+    assert report.counters['unreferenced_pages'] == len(data['pages'])
+
+    # The earlier copy's page objects are in the file, but not in its page tree
+    with open(output_pdf, 'rb') as f:
+        page_objects = len(re.findall(rb"/Type /Page\b", f.read()))
+    assert page_objects == len(plan) + len(data['pages'])
+    assert len(PdfReader(output_pdf).pages) == len(plan)
+
+    sequential_pdf = str(tmp_path / "Sequential.pdf")
+    reorder_and_merge(master_data, scanned, source_pdf, sequential_pdf)
+    assert fingerprint_pages(output_pdf) == fingerprint_pages(sequential_pdf)
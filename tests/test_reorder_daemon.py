@@ -0,0 +1,54 @@
+import os
+import shutil
+import threading
+
+import pytest
+
+from reorder_daemon import ReorderDaemon, submit_job
+
+
+@pytest.fixture(scope="module")
+def daemon(tmp_path_factory):
+    socket_path = str(tmp_path_factory.mktemp("daemon") / "reorder.sock")
+    server = ReorderDaemon(socket_path, workers=1)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+@pytest.fixture
+def job_dir(dataset, tmp_path):
+    """
+    A directory laid out as main.py expects, with the generated pair under
+    data/.
+    """
+    os.mkdir(tmp_path / "data")
+    for path in dataset:
+        shutil.copy(path, tmp_path / "data")
+    return tmp_path
+
+
+def test_job_runs_in_its_directory(daemon, job_dir):
+    events = list(submit_job(["--no-cache", "--backend", "pdfium", "--verify"], cwd=str(job_dir),
+                             socket_path=daemon))
+
+    assert events[0]['event'] == 'accepted'
+    assert any(event['event'] == 'log' and event['name'] == 'verify_output' for event in events)
+    done = events[-1]
+    assert (done['event'], done['status'], done['exit_code'], done['error']) == ('done', 'ok', 0, None)
+    assert done['report']['counters']['verification']['ok']
+    assert os.path.exists(job_dir / "data" / "SubordinateReordered.pdf")
+    assert os.getcwd() != str(job_dir)
+
+
+def test_bad_arguments_fail_with_main_usage(daemon, job_dir):
+    events = list(submit_job(["--no-such-option"], cwd=str(job_dir), socket_path=daemon))
+
+    done = events[-1]
+    assert (done['event'], done['status'], done['exit_code']) == ('done', 'failed', 2)
+    assert done['error'].startswith("usage: main.py")
+    assert "--no-such-option" in done['error']
+    assert not os.path.exists(job_dir / "data" / "SubordinateReordered.pdf")
@@ -0,0 +1,53 @@
+from reorder_plan import BLANK, build_plan
+
+
+def _account(first_page, page_count, bunchcode):
+    return {'pages': range(first_page, first_page + page_count), 'bunchcode': bunchcode}
+
+
+MASTER_DATA = {
+    "500000001 - SECOND": ["C", "MISSING", "A"],
+    "500000000 - FIRST": ["B"],
+}
+
+SUBORDINATE_DATA = {
+    "A": _account(1, 1, "BUNCH002"),
+    "B": _account(2, 2, "BUNCH001"),
+    "C": _account(4, 3, "BUNCH001"),
+    "Z": _account(7, 1, "BUNCH002"),
+    "Y": _account(8, 2, "BUNCH002"),
+    "X": _account(10, 1, "BUNCH001"),
+}
+
+
+def test_plan_follows_master_then_orphans_by_bunchcode():
+    plan = build_plan(MASTER_DATA, SUBORDINATE_DATA)
+
+    assert plan.accounts == ["C", "A", "B", "X", "Y", "Z"]
+    assert plan.sections == [('master', "500000001 - SECOND", 0), ('master', "500000000 - FIRST", 2),
+                             ('bunchcode', "BUNCH001", 3), ('bunchcode', "BUNCH002", 4)]
+    assert plan.missing_subordinates == ["MISSING"]
+    assert plan.orphans_by_bunchcode == {"BUNCH001": ["X"], "BUNCH002": ["Y", "Z"]}
+
+
+def test_plan_pads_odd_accounts_with_a_blank():
+    plan = build_plan(MASTER_DATA, SUBORDINATE_DATA)
+
+    assert list(plan.entries) == [4, 5, 6, BLANK, 1, BLANK, 2, 3, 10, BLANK, 8, 9, 7, BLANK]
+    assert [list(plan.account_entries(index)) for index in range(len(plan.accounts))] == [
+        [4, 5, 6, BLANK], [1, BLANK], [2, 3], [10, BLANK], [8, 9], [7, BLANK]]
+    assert [(kind, label, list(accounts)) for kind, label, accounts in plan.iter_sections()] == [
+        ('master', "500000001 - SECOND", [0, 1]), ('master', "500000000 - FIRST", [2]),
+        ('bunchcode', "BUNCH001", [3]), ('bunchcode', "BUNCH002", [4, 5])]
+
+    stats = plan.stats()
+    assert (stats['output_pages'], stats['source_pages'], stats['blank_pages']) == (14, 10, 4)
+    assert stats['master_accounts'] == 2
+    assert stats['orphan_accounts_by_bunchcode'] == {"BUNCH001": 1, "BUNCH002": 2}
+
+
+def test_plan_skips_masters_without_printed_accounts():
+    plan = build_plan({"500000002 - EMPTY": ["MISSING"]}, {"A": _account(1, 2, "BUNCH001")})
+
+    assert plan.sections == [('bunchcode', "BUNCH001", 0)]
+    assert list(plan.entries) == [1, 2]
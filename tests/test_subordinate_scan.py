@@ -0,0 +1,125 @@
+import pytest
+
+import utils
+from text_backends import BACKENDS, PdfplumberDocument, open_document
+from utils import (DEFAULT_LAYOUT, _scan_chunks, check_backend_parity, detect_subordinate_account,
+                   extract_subordinate_data, read_subordinate_account)
+
+
+@pytest.fixture(scope="module")
+def serial(dataset):
+    _, subordinate_pdf = dataset
+    return extract_subordinate_data(subordinate_pdf)
+
+
+@pytest.mark.parametrize("workers", [2, 3, 7])
+def test_parallel_scan_matches_serial_scan(dataset, serial, workers):
+    _, subordinate_pdf = dataset
+    chunks = _scan_chunks(subordinate_pdf, [(0, 60)], workers, None, False, "pdfplumber")
+    edges = {chunk[1] + 1 for chunk in chunks[1:]}  # 1-indexed first pages of every chunk after the first
+    # Some account runs on across a chunk edge, so the stitching is tested
+    assert any(page in edges for data in serial.values() for page in data['pages'][1:])
+
+    parallel = extract_subordinate_data(subordinate_pdf, workers=workers)
+    assert list(parallel) == list(serial)
+    assert parallel == serial
+
+
+class _Document:
+    """
+    A document whose bands and pages hold canned lines, recording the reads.
+    """
+
+    def __init__(self, header, footer, page):
+        self.lines = {DEFAULT_LAYOUT['subordinate_header']: header, DEFAULT_LAYOUT['subordinate_footer']: footer}
+        self.page = page
+        self.reads = []
+
+    def region_lines(self, index, region):
+        self.reads.append(region)
+        return self.lines[region]
+
+    def page_lines(self, index):
+        self.reads.append("page")
+        return self.page
+
+
+HEADER = ["Electric Statement", "Customer", "Page 1 of 2", "Service Address", "Statement Date",
+          "Account: 123456789 - 1234567"]
+FOOTER = ["Thank you", "BUNCH7"]
+
+
+def test_band_reads_header_then_footer_of_an_account_page():
+    document = _Document(HEADER, FOOTER, [])
+    assert read_subordinate_account(document, 0) == ("123456789 - 1234567", "BUNCH7")
+    assert document.reads == [DEFAULT_LAYOUT['subordinate_header'], DEFAULT_LAYOUT['subordinate_footer']]
+
+
+@pytest.mark.parametrize("header", [
+    ["Electric Statement", "Customer", "Page 2 of 2", "Usage"],  # A continuation page
+    ["Page 1 of 2", "Electric Statement", "Customer"] + HEADER[3:],  # "Page 1 of" on the wrong line
+])
+def test_band_skips_a_page_that_starts_no_account(header):
+    document = _Document(header, FOOTER, HEADER + FOOTER)
+    assert read_subordinate_account(document, 0) is None
+    assert document.reads == [DEFAULT_LAYOUT['subordinate_header']]
+
+
+@pytest.mark.parametrize("header, footer", [
+    ([], FOOTER),  # Nothing in the header band
+    (HEADER[:4], FOOTER),  # Too few lines for the account line
+    (HEADER, []),  # Nothing in the footer band
+])
+def test_band_falls_back_to_the_full_page(header, footer):
+    document = _Document(header, footer, HEADER + ["Usage"] + FOOTER)
+    assert read_subordinate_account(document, 0) == ("123456789 - 1234567", "BUNCH7")
+    assert document.reads[-1] == "page"
+
+
+def test_bands_find_the_accounts_of_the_full_text(dataset, serial):
+    _, subordinate_pdf = dataset
+    with open_document(subordinate_pdf) as document:
+        for index in range(len(document)):
+            assert read_subordinate_account(document, index) == read_subordinate_account(document, index, None)
+    assert extract_subordinate_data(subordinate_pdf, layout=None) == serial
+
+
+def test_streaming_scan_trims_the_backend_cache(dataset, serial, monkeypatch):
+    _, subordinate_pdf = dataset
+    trims = []
+    trim_cache = PdfplumberDocument.trim_cache
+    monkeypatch.setattr(utils, "STREAMING_BATCH_SIZE", 7)
+    monkeypatch.setattr(PdfplumberDocument, "trim_cache", lambda self: trims.append(trim_cache(self)))
+
+    assert extract_subordinate_data(subordinate_pdf, streaming=True) == serial
+    assert len(trims) == 60 // 7
+
+
+@pytest.mark.parametrize("layout", [DEFAULT_LAYOUT, None])
+def test_backends_find_the_same_accounts(dataset, layout):
+    master_pdf, subordinate_pdf = dataset
+    parity = check_backend_parity(master_pdf, subordinate_pdf, backends=("pdfplumber", "pdfium"), layout=layout)
+    assert parity['match'], parity['differences']
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_backends_read_the_same_lines(dataset, backend):
+    _, subordinate_pdf = dataset
+    with open_document(subordinate_pdf) as reference, open_document(subordinate_pdf, backend) as document:
+        assert len(document) == len(reference)
+        for index in range(len(document)):
+            assert document.page_lines(index) == reference.page_lines(index)
+            for region in DEFAULT_LAYOUT.values():
+                assert document.region_lines(index, region) == reference.region_lines(index, region)
+            document.trim_cache()
+
+
+def test_trim_cache_without_pdfminer_caches(dataset):
+    _, subordinate_pdf = dataset
+    with open_document(subordinate_pdf, "pdfplumber") as document:
+        assert detect_subordinate_account(document.page_lines(0))
+        cached_objs = document.pdf.doc._cached_objs
+        del document.pdf.doc._cached_objs  # As in a pdfminer.six without this private cache
+        document.trim_cache()
+        assert not document.pdf.doc._parsed_objs
+        document.pdf.doc._cached_objs = cached_objs  # Closing the document still uses it
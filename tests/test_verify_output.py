@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from page_cache import PageCache
+from utils import extract_master_data, extract_subordinate_data, reorder_and_merge
+from verify_output import _mismatched_accounts, verify_output
+
+
+@pytest.fixture(scope="module")
+def extracted(dataset):
+    master_pdf, subordinate_pdf = dataset
+    return extract_master_data(master_pdf), extract_subordinate_data(subordinate_pdf)
+
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_verify_reads_input_fingerprints_from_cache(dataset, extracted, tmp_path, optimize):
+    _, subordinate_pdf = dataset
+    master_data, subordinate_data = extracted
+    output_pdf = str(tmp_path / "Output.pdf")
+    reorder_and_merge(master_data, subordinate_data, subordinate_pdf, output_pdf, optimize=optimize)
+
+    cache = PageCache(str(tmp_path / "cache.sqlite"))
+    cold = verify_output(master_data, subordinate_data, subordinate_pdf, output_pdf, workers=1, cache=cache)
+    assert cold['ok'] and cache.hits == 0
+    warm = verify_output(master_data, subordinate_data, subordinate_pdf, output_pdf, workers=1, cache=cache)
+    assert warm == cold
+    assert cache.hits == cold['input_pages']
+
+
+def test_alignment_stays_fast_with_many_blank_pads():
+    # 100k output pages, one account in two with a blank pad
+    expected = []
+    fingerprints = []
+    for account in range(50000):
+        for _ in range(1 + account % 2):
+            expected.append((account, len(expected) + 1))
+            fingerprints.append(len(expected).to_bytes(16, 'big'))
+        if account % 2 == 0:
+            expected.append((account, None))
+            fingerprints.append(None)
+
+    dropped = fingerprints[:60000] + fingerprints[60001:]
+    swapped = list(fingerprints)
+    swapped[100], swapped[90000] = swapped[90000], swapped[100]
+    start = time.perf_counter()
+    assert _mismatched_accounts(expected, fingerprints, dropped) == [expected[60000][0]]
+    assert _mismatched_accounts(expected, fingerprints, swapped) == [expected[100][0], expected[90000][0]]
+    assert time.perf_counter() - start < 10
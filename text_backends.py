@@ -0,0 +1,339 @@
+# Each backend imports its PDF library when a document is first opened, so
+# only the backend in use is loaded
+
+DEFAULT_BACKEND = "pdfplumber"
+
+
+def _lines_from_boxes(boxes, y_tolerance=3):
+    """
+    Groups (left, top, right, text) boxes into text lines, top to bottom.
+    Boxes whose top edges are within y_tolerance of the first box of a line
+    belong to that line, and are joined left to right. top is measured
+    upwards (PDF space), so larger is higher on the page.
+    """
+    boxes = sorted(boxes, key=lambda box: -box[1])
+
+    lines = []
+    line_boxes = []
+    for box in boxes:
+        if line_boxes and line_boxes[0][1] - box[1] > y_tolerance:
+            lines.append(line_boxes)
+            line_boxes = []
+        line_boxes.append(box)
+    if line_boxes:
+        lines.append(line_boxes)
+
+    return lines
+
+
+def _in_reading_order(rects, y_tolerance=3):
+    """
+    Tells whether PDFium (left, bottom, right, top) text rectangles, in the
+    order the page draws them, run top to bottom and left to right within a
+    line, so text read across them comes out in reading order.
+    """
+    for previous, rect in zip(rects, rects[1:]):
+        if rect[3] - previous[3] > y_tolerance:
+            return False  # Above the previous line
+        if abs(rect[3] - previous[3]) <= y_tolerance and rect[0] < previous[0]:
+            return False  # Left of the previous segment on its line
+    return True
+
+
+def _words_from_chars(chars, width, height, x_tolerance=3):
+    """
+    Groups (left, top, right, bottom, text) character boxes, in PDF space
+    (y measured upwards) on a width x height page, into words: runs of
+    characters with no space and no gap wider than x_tolerance between
+    them. Returns the words top to bottom and left to right as (x0, top,
+    x1, bottom, text) boxes, in fractions of the page measured from the
+    top-left corner like regions.
+    """
+    words = []
+    for line_chars in _lines_from_boxes(chars):
+        line_chars.sort(key=lambda c: c[0])
+        word = None
+        for left, top, right, bottom, text in line_chars:
+            if not text.strip():
+                word = None
+                continue
+            if word and left - word[2] <= x_tolerance:
+                word[2] = right
+                word[1] = max(word[1], top)
+                word[3] = min(word[3], bottom)
+                word[4] += text
+            else:
+                word = [left, top, right, bottom, text]
+                words.append(word)
+    return [(left / width, 1 - top / height, right / width, 1 - bottom / height, text)
+            for left, top, right, bottom, text in words]
+
+
+class PdfplumberDocument:
+    """
+    Page text through pdfplumber/pdfminer, the original extraction path.
+    Full-page lines come from page.extract_text(); region lines are built
+    from pdfminer's layout directly, which skips pdfplumber's conversion of
+    every character on the page into an object dictionary.
+    """
+
+    name = "pdfplumber"
+
+    def __init__(self, pdf_path):
+        import pdfplumber
+        self.pdf = pdfplumber.open(pdf_path)
+
+    def __len__(self):
+        return len(self.pdf.pages)
+
+    def page_lines(self, index):
+        """
+        Returns all the text lines of a page (0-indexed).
+        """
+        text = self.pdf.pages[index].extract_text()
+        return text.splitlines() if text else []  # Split text into lines or set to an empty list if no text
+
+    def region_lines(self, index, region, x_tolerance=3, y_tolerance=3):
+        """
+        Returns the text lines inside a region of a page, top to bottom.
+        region is (x0, top, x1, bottom) as fractions of the page, measured
+        from the top-left corner.
+        """
+        layout = self.pdf.pages[index].layout
+        x0, y0, x1, y1 = layout.bbox
+        width, height = x1 - x0, y1 - y0
+        left, right = x0 + region[0] * width, x0 + region[2] * width
+        top, bottom = y1 - region[1] * height, y1 - region[3] * height  # pdfminer y grows upwards
+
+        chars = [(c.x0, c.y1, c.x1, c.get_text()) for c in _iter_layout_chars(layout)
+                 if c.x0 >= left and c.x1 <= right and c.y1 <= top and c.y0 >= bottom]
+
+        text_lines = []
+        for line_chars in _lines_from_boxes(chars, y_tolerance):
+            line_chars.sort(key=lambda c: c[0])
+            text = ""
+            prev_right = None
+            for c_left, c_top, c_right, c_text in line_chars:
+                # Insert a space for visible gaps between words, like extract_text() does
+                if prev_right is not None and c_left - prev_right > x_tolerance \
+                        and not text.endswith(" ") and c_text != " ":
+                    text += " "
+                text += c_text
+                prev_right = c_right
+            text_lines.append(text.strip())
+
+        return text_lines
+
+    def page_words(self, index):
+        """
+        Returns the words of a page (0-indexed) with their positions, as
+        (x0, top, x1, bottom, text) boxes in fractions of the page measured
+        from the top-left corner.
+        """
+        layout = self.pdf.pages[index].layout
+        x0, y0, x1, y1 = layout.bbox
+        chars = [(c.x0 - x0, c.y1 - y0, c.x1 - x0, c.y0 - y0, c.get_text()) for c in _iter_layout_chars(layout)]
+        return _words_from_chars(chars, x1 - x0, y1 - y0)
+
+    def column_lines(self, index, regions):
+        """
+        Returns the text lines inside each of a list of columns of a page,
+        top to bottom, like region_lines: a word crossing a column's edges
+        is cut.
+        """
+        return [self.region_lines(index, region) for region in regions]
+
+    def release_page(self, index):
+        """
+        Drops the layout objects of a page that has been read.
+        """
+        self.pdf.pages[index].close()
+
+    def trim_cache(self):
+        """
+        Drops the PDF objects pdfminer has parsed and cached so far. They are
+        parsed again if a later page needs them.
+        """
+        # These are private caches of pdfminer's PDFDocument (as of
+        # pdfminer.six 20231228, pinned in requirements.txt); a version
+        # without them keeps its cache, it only costs memory
+        for name in ("_cached_objs", "_parsed_objs"):
+            cache = getattr(self.pdf.doc, name, None)
+            if cache is not None:
+                cache.clear()
+
+    def close(self):
+        self.pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _iter_layout_chars(container):
+    """
+    Yields every character in a pdfminer layout container, including the
+    ones nested inside figures (form XObjects).
+    """
+    from pdfminer.layout import LTChar, LTContainer
+
+    for obj in container:
+        if isinstance(obj, LTChar):
+            yield obj
+        elif isinstance(obj, LTContainer):
+            yield from _iter_layout_chars(obj)
+
+
+class PdfiumDocument:
+    """
+    Page text through PDFium (pypdfium2), which parses pages in native code.
+    PDFium splits a page's text into segment rectangles; they are grouped
+    into lines by position, so the lines come out top to bottom like
+    pdfplumber's, whatever order the content stream draws them in.
+    """
+
+    name = "pdfium"
+
+    def __init__(self, pdf_path):
+        import pypdfium2 as pdfium
+        self.pdf = pdfium.PdfDocument(pdf_path)
+
+    def __len__(self):
+        return len(self.pdf)
+
+    def _boxes(self, index, region=None):
+        """
+        Returns the text segments of a page as (left, top, right, text)
+        boxes, only those fully inside region when one is given.
+        """
+        page = self.pdf[index]
+        textpage = page.get_textpage()
+        try:
+            if region:
+                width, height = page.get_size()
+                left, right = region[0] * width, region[2] * width
+                top, bottom = height - region[1] * height, height - region[3] * height
+
+            boxes = []
+            for i in range(textpage.count_rects()):
+                rect_left, rect_bottom, rect_right, rect_top = textpage.get_rect(i)
+                if region and not (rect_left >= left and rect_right <= right
+                                   and rect_top <= top and rect_bottom >= bottom):
+                    continue
+                text = textpage.get_text_bounded(rect_left, rect_bottom, rect_right, rect_top).strip()
+                if text:
+                    boxes.append((rect_left, rect_top, rect_right, text))
+            return boxes
+        finally:
+            textpage.close()
+            page.close()
+
+    def _lines(self, boxes):
+        return [" ".join(box[3] for box in sorted(line_boxes, key=lambda box: box[0]))
+                for line_boxes in _lines_from_boxes(boxes)]
+
+    def page_lines(self, index):
+        """
+        Returns all the text lines of a page (0-indexed).
+        """
+        return self._lines(self._boxes(index))
+
+    def region_lines(self, index, region):
+        """
+        Returns the text lines inside a region of a page, top to bottom.
+        region is (x0, top, x1, bottom) as fractions of the page, measured
+        from the top-left corner.
+        """
+        return self._lines(self._boxes(index, region))
+
+    def page_words(self, index):
+        """
+        Returns the words of a page (0-indexed) with their positions, as
+        (x0, top, x1, bottom, text) boxes in fractions of the page measured
+        from the top-left corner. This reads every character box, so it is
+        slower than the other methods.
+        """
+        page = self.pdf[index]
+        textpage = page.get_textpage()
+        try:
+            width, height = page.get_size()
+            chars = []
+            for i in range(textpage.count_chars()):
+                left, bottom, right, top = textpage.get_charbox(i, loose=True)
+                chars.append((left, top, right, bottom, textpage.get_text_range(i, 1)))
+            return _words_from_chars(chars, width, height)
+        finally:
+            textpage.close()
+            page.close()
+
+    def column_lines(self, index, regions):
+        """
+        Returns the text lines inside each of a list of columns of a page,
+        top to bottom, like region_lines: a word crossing a column's edges
+        is cut. Regions are (x0, top, x1, bottom) as fractions of the page,
+        measured from the top-left corner.
+        When the page draws its text in reading order (the usual case),
+        each column is read with one PDFium call; otherwise each text
+        segment in a column is read on its own and the lines are put
+        together by position.
+        """
+        page = self.pdf[index]
+        textpage = page.get_textpage()
+        try:
+            width, height = page.get_size()
+            rects = [textpage.get_rect(i) for i in range(textpage.count_rects())]
+            in_order = _in_reading_order(rects)
+            columns = []
+            for region in regions:
+                left, right = region[0] * width, region[2] * width
+                top, bottom = height - region[1] * height, height - region[3] * height
+                if in_order:
+                    text = textpage.get_text_bounded(left, bottom, right, top)
+                    columns.append([" ".join(line.split()) for line in text.splitlines() if line.strip()])
+                    continue
+
+                boxes = []
+                for rect_left, rect_bottom, rect_right, rect_top in rects:
+                    if rect_left >= right or rect_right <= left or rect_bottom >= top or rect_top <= bottom:
+                        continue
+                    # Clipped to the column, so a cut word reads the same as above
+                    box_left, box_right = max(rect_left, left), min(rect_right, right)
+                    text = textpage.get_text_bounded(box_left, max(rect_bottom, bottom), box_right,
+                                                     min(rect_top, top)).strip()
+                    if text:
+                        boxes.append((box_left, rect_top, box_right, text))
+                columns.append([" ".join(line.split()) for line in self._lines(boxes)])
+            return columns
+        finally:
+            textpage.close()
+            page.close()
+
+    def release_page(self, index):
+        pass  # Pages are closed as soon as they have been read
+
+    def trim_cache(self):
+        pass  # PDFium keeps no per-page state between reads
+
+    def close(self):
+        self.pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+BACKENDS = {
+    PdfplumberDocument.name: PdfplumberDocument,
+    PdfiumDocument.name: PdfiumDocument,
+}
+
+
+def open_document(pdf_path, backend=DEFAULT_BACKEND):
+    """
+    Opens a PDF for text extraction with the named backend.
+    """
+    return BACKENDS[backend](pdf_path)
@@ -1,142 +1,684 @@
-import pdfplumber
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
 import re
-from PyPDF2 import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
+import resource
+import shutil
+import subprocess
+import sys
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from page_cache import file_hash
+from reorder_plan import build_plan, write_plan
+from text_backends import BACKENDS, DEFAULT_BACKEND, open_document
 
+# pdfplumber, PyPDF2 (with page_tree) and ReportLab are imported inside the
+# functions that use them: together they take longer to import than a small
+# reorder takes to run, and most runs only need some of them
 
-def extract_master_data(master_pdf_path):
+
+logger = logging.getLogger(__name__)
+
+
+# Master PDF subordinate table: the header row, the section after the
+# table, and a row, parsed like "<account number> / <subordinate number> ..."
+MASTER_TABLE_HEADER = "Account Number Name/ID Total"
+MASTER_TABLE_END = "Final Bill Transfers"
+MASTER_ROW_PATTERN = re.compile(r'(.*?) / \s*(\S+)')
+# Width added to the learned table column, as a fraction of the page, when
+# checking that no word is cut at its edge; wider than any character
+MASTER_COLUMN_MARGIN = 0.03
+
+
+def _master_rows(lines, header, strict=False):
+    """
+    Returns the subordinate accounts listed in a Master page's table: the
+    rows after the line holding header, up to the MASTER_TABLE_END line.
+    With strict, returns None if a line in between is not a row.
+    """
+    subordinates = []
+    start_extracting = False  # Track when to start reading subordinate accounts
+
+    for line in lines:
+        if header in line:
+            start_extracting = True
+            continue  # Skip this line
+
+        if start_extracting:
+            if MASTER_TABLE_END in line:
+                break  # Stop extracting when we hit this line
+
+            row = MASTER_ROW_PATTERN.match(line)
+            if row:  # Identify subordinate accounts and reformat their numbers
+                subordinates.append(f"{row.group(1).strip()} - {row.group(2)}")
+            elif strict:
+                return None
+
+    return subordinates
+
+
+def parse_master_page(lines):
+    """
+    Parses the text lines of one Master PDF page. Returns a dictionary with:
+      'first_page': True if the page starts a new Master Account (Page 1 of X)
+      'name', 'number': the Master Account Name and Number found on a first
+                        page (None when missing)
+      'subordinates': the subordinate accounts listed on the page, in order
+    """
+    parsed = {'first_page': False, 'name': None, 'number': None, 'subordinates': []}
+
+    # Check if this page starts a new Master Account (Page 1 of X)
+    if lines and "Page 1 of" in lines[0]:
+        parsed['first_page'] = True
+
+        # Extract the Master Account Name and Number
+        for i, line in enumerate(lines):
+            if "Electric Summary Billing Statement for:" in line:
+                parsed['name'] = lines[i + 1].strip()  # Line under the key phrase
+                break
+
+        for line in lines:
+            if line.startswith("Account Number:"):
+                parsed['number'] = line.replace("Account Number:", "").strip()
+                break
+
+    parsed['subordinates'] = _master_rows(lines, MASTER_TABLE_HEADER)
+    return parsed
+
+
+def _word_lines(words):
+    """
+    Groups (x0, top, x1, bottom, text) words into lines of vertically
+    overlapping words, top to bottom and left to right.
+    """
+    lines = []
+    for word in sorted(words, key=lambda word: word[1]):
+        if lines and word[1] < lines[-1][0][3]:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return [sorted(line, key=lambda word: word[0]) for line in lines]
+
+
+def learn_master_table(document, page_index, parsed):
+    """
+    Learns where the subordinate table sits from the words of a first
+    Master page (see page_words in text_backends) and its parse_master_page
+    result. The table is read as a column running down the left of the
+    page, up to halfway between the end of the widest "<account> /
+    <subordinate>" pair and the nearest text to its right.
+    Returns a template with the column 'region' and the words of the
+    table header that fit in it, or None if the page has no such column or
+    the column doesn't read the same subordinates and "Page 1 of" on its
+    first line.
+    """
+    lines = _word_lines(document.page_words(page_index))
+    texts = [" ".join(word[4] for word in line) for line in lines]
+    header = next((i for i, text in enumerate(texts) if MASTER_TABLE_HEADER in text), None)
+    if header is None:
+        return None
+
+    pair_right = 0.0
+    next_left = 1.0
+    for line, text in zip(lines[header + 1:], texts[header + 1:]):
+        if MASTER_TABLE_END in text:
+            break
+        if not MASTER_ROW_PATTERN.match(text):
+            continue
+        # The subordinate number is the word after the first "/" word
+        slash = next(i for i, word in enumerate(line) if word[4] == "/")
+        pair_right = max(pair_right, line[slash + 1][2])
+        if slash + 2 < len(line):
+            next_left = min(next_left, line[slash + 2][0])
+    if pair_right == 0.0 or pair_right >= next_left:
+        return None
+
+    region = (0.0, 0.0, (pair_right + next_left) / 2, 1.0)
+    header_words = [word[4] for word in lines[header] if word[2] <= region[2]]
+    if not header_words:
+        return None
+    template = {'region': region, 'header': " ".join(header_words)}
+
+    column, = document.column_lines(page_index, [region])
+    if not column or "Page 1 of" not in column[0] \
+            or _master_rows(column, template['header']) != parsed['subordinates']:
+        return None
+    return template
+
+
+def parse_master_column(document, page_index, template):
+    """
+    Parses a Master page like parse_master_page, reading only the table
+    column of a template from learn_master_table. The column is read a
+    second time, MASTER_COLUMN_MARGIN wider: a word cut by the column's
+    edge reads differently then. Returns None when the page must be read
+    in full instead: it starts a new Master Account (its name and number
+    are outside the column), a word is cut, or a line after the header is
+    neither a row nor the end of the table.
+    """
+    region = template['region']
+    wider = (region[0], region[1], min(region[2] + MASTER_COLUMN_MARGIN, 1.0), region[3])
+
+    subordinates = None
+    for lines in document.column_lines(page_index, [region, wider]):
+        if any("Page 1 of" in line for line in lines):
+            return None
+        rows = _master_rows(lines, template['header'], strict=True)
+        if rows is None or subordinates not in (None, rows):
+            return None
+        subordinates = rows
+
+    return {'first_page': False, 'name': None, 'number': None, 'subordinates': subordinates}
+
+
+def extract_master_data(master_pdf_path, cache=None, report=None, backend=DEFAULT_BACKEND, learn_table=True):
     """
     Extracts master account information and its subordinate accounts
     from the Master PDF. Returns a dictionary where the key is the
     Master Account (Name and Number) and the value is a list of
     subordinate accounts in order.
+    With learn_table, the position of the subordinate table is learned
+    from the first "Page 1 of" page (see learn_master_table). The other
+    pages are then read as that column only (see parse_master_column);
+    the pages starting a Master Account are still read in full.
+    With a PageCache, pages parsed on an earlier run of the same file are
+    taken from the cache instead of being read again.
+    With a RunReport, the page and account counts are recorded in it.
+    backend names the text extraction backend (see text_backends).
     """
     
-    print(f"-------Staring Master Account PDF Analysis---------")
+    logger.info("-------Staring Master Account PDF Analysis---------")
     master_data = {}  # Dictionary to store the results
     current_master_account = None  # Keep track of the current Master Account
+    master_name = master_number = None  # Carried over when a first page lacks them
+
+    cached_pages = {}
+    new_pages = {}
+    total_pages = None
+    if cache:
+        digest = file_hash(master_pdf_path)
+        if report:
+            report.set('master_file_hash', digest)  # Saved with the account index
+        # Pages read through a learned table are kept apart from full reads
+        kind = f'master:{backend}:learn_table={learn_table}'
+        cached_pages = cache.load(digest, kind)
+        total_pages = cache.page_count(digest, kind)
+
+    template = None
+    if total_pages is None or len(cached_pages) < total_pages:
+        with open_document(master_pdf_path, backend) as document:
+            total_pages = len(document)
+            for page_index in range(total_pages):
+                if page_index in cached_pages:
+                    continue
+                parsed = parse_master_column(document, page_index, template) if template else None
+                if parsed is None:
+                    parsed = parse_master_page(document.page_lines(page_index))
+                    if learn_table and parsed['first_page'] and template is None:
+                        learn_table = False  # Only the first "Page 1 of" page is learned from
+                        template = learn_master_table(document, page_index, parsed)
+                        if template:
+                            logger.info("Reading the Master subordinate table as the column %.3f-%.3f of the page",
+                                        template['region'][0], template['region'][2])
+                        else:
+                            logger.info("No subordinate table column found on Master page %d; reading full pages",
+                                        page_index + 1)
+                new_pages[page_index] = parsed
+                document.release_page(page_index)  # Release the page's layout objects once it has been read
+
+    for page_index in range(total_pages):
+        if page_index in cached_pages:
+            parsed = cached_pages[page_index]
+        else:
+            parsed = new_pages[page_index]
+
+        if parsed['first_page']:
+            master_name = parsed['name'] or master_name
+            master_number = parsed['number'] or master_number
+
+            # Define the key for the current master account
+            current_master_account = f"{master_number} - {master_name}"
+            master_data[current_master_account] = []  # Initialize the subordinate list
+
+        # If we are within a Master Account, keep its Subordinate Accounts
+        if current_master_account:
+            master_data[current_master_account].extend(parsed['subordinates'])
+
+    if cache:
+        cache.hits += len(cached_pages)
+        cache.misses += len(new_pages)
+        cache.store(digest, kind, new_pages)
+        cache.store_page_count(digest, kind, total_pages)
+
+    subordinate_count = sum(len(subordinates) for subordinates in master_data.values())
+    logger.info("Extracted %d Master Accounts listing %d subordinate accounts from %d pages",
+                len(master_data), subordinate_count, total_pages)
+    if logger.isEnabledFor(logging.DEBUG):
+        for master_account, subordinates in master_data.items():
+            logger.debug("%s: %s", master_account, ", ".join(subordinates))
 
-    with pdfplumber.open(master_pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, start=1):
-            text = page.extract_text()
-            lines = text.splitlines()  # Split the page text into lines
-            
-            # Check if this page starts a new Master Account (Page 1 of X)
-            if "Page 1 of" in lines[0]:
-                # Extract the Master Account Name and Number
-                for i, line in enumerate(lines):
-                    if "Electric Summary Billing Statement for:" in line:
-                        master_name = lines[i + 1].strip()  # Line under the key phrase
-                        break
-
-                for line in lines:
-                    if line.startswith("Account Number:"):
-                        master_number = line.replace("Account Number:", "").strip()
-                        break
-
-                # Define the key for the current master account
-                current_master_account = f"{master_number} - {master_name}"
-                master_data[current_master_account] = []  # Initialize the subordinate list
-
-            # If we are within a Master Account, extract Subordinate Accounts
-            if current_master_account:
-                start_extracting = False  # Track when to start reading subordinate accounts
-
-                for line in lines:
-                    if "Account Number Name/ID Total" in line:
-                        start_extracting = True
-                        continue  # Skip this line
-
-                    if start_extracting:
-                        if "Final Bill Transfers" in line:
-                            break  # Stop extracting when we hit this line
-
-                        if " / " in line:  # Identify subordinate accounts
-                            # Extract only the account numbers and reformat
-                            parts = line.split(" / ")
-                            if len(parts) >= 2:  # Ensure we have both parts
-                                account_number = parts[0].strip()
-                                subordinate_number = parts[1].split()[0].strip()  # Take only the first part
-                                formatted_account = f"{account_number} - {subordinate_number}"
-                                master_data[current_master_account].append(formatted_account)
-
-    print("Extracted Master Data:")
-    for master_account, subordinates in master_data.items():
-        print(f"{master_account}:")
-        for subordinate in subordinates:
-            print(f"  {subordinate}")  # Print each subordinate account on a new line
-
+    if report:
+        report.set('master_pages', total_pages)
+        report.set('master_table_column', template['region'] if template else None)
+        report.set('master_accounts', len(master_data))
+        report.set('master_subordinates_listed', subordinate_count)
 
     return master_data
 
 
 
-def extract_subordinate_data(subordinate_pdf_path):
+def detect_subordinate_account(lines):
+    """
+    Checks whether a Subordinate page starts a new account ("Page 1 of" on
+    the 3rd line and the account number on the 6th line).
+    Returns an (account number, bunchcode) tuple, or None if the page does
+    not start an account.
+    """
+    # Detect the start of a new account when "Page 1 of" is present
+    if len(lines) > 5 and "Page 1 of" in lines[2]:
+        # Extract the account number from the 6th line
+        account_match = re.search(r'(\d{9}) - (\d{7})', lines[5])
+        if account_match:
+            account_number = f"{account_match.group(1)} - {account_match.group(2)}"
+
+            # Extract the bunchcode (always the last line on page 1)
+            bunchcode = lines[-1].strip()
+            return account_number, bunchcode
+
+    return None
+
+
+# Pages handled between releases of cached PDF objects in streaming mode
+STREAMING_BATCH_SIZE = 500
+EMPTY_PAGE_CHAIN = hashlib.sha256().hexdigest()  # page_chain_hash of no pages
+
+# Page regions used for fast header detection, given as (x0, top, x1, bottom)
+# fractions of the page measured from the top-left corner. The subordinate
+# header band must hold the first 6 lines ("Page 1 of" and the account line)
+# and the footer band the bunchcode.
+DEFAULT_LAYOUT = {
+    'subordinate_header': (0.0, 0.0, 1.0, 0.25),
+    'subordinate_footer': (0.0, 0.85, 1.0, 1.0),
+}
+
+
+def read_subordinate_account(document, index, layout=DEFAULT_LAYOUT):
+    """
+    Checks whether a Subordinate page (0-indexed, in a document opened with
+    text_backends.open_document) starts a new account.
+    With a layout profile only the header band is read first, and the page is
+    skipped as soon as "Page 1 of" is missing from it; the footer band is only
+    read for account pages, to get the bunchcode. Falls back to the full page
+    text when a band comes back empty or too short to hold the header lines.
+    Returns an (account number, bunchcode) tuple, or None.
+    """
+    if layout:
+        header_lines = document.region_lines(index, layout['subordinate_header'])
+        if header_lines:
+            if not any("Page 1 of" in line for line in header_lines):
+                return None  # Not the first page of an account
+
+            if len(header_lines) > 5:
+                if "Page 1 of" not in header_lines[2]:
+                    return None
+
+                footer_lines = document.region_lines(index, layout['subordinate_footer'])
+                if footer_lines:
+                    return detect_subordinate_account(header_lines[:6] + footer_lines[-1:])
+
+    # Full page text path
+    return detect_subordinate_account(document.page_lines(index))
+
+
+def iter_subordinate_hits(subordinate_pdf_path, start=0, end=None, layout=DEFAULT_LAYOUT, streaming=False,
+                          backend=DEFAULT_BACKEND):
+    """
+    Scans pages [start, end) of the Subordinate PDF for account boundaries,
+    yielding a (page number, account number, bunchcode) tuple, with a
+    1-indexed page number, as soon as each one is found.
+    In streaming mode the backend's object cache is also emptied every
+    STREAMING_BATCH_SIZE pages, so memory does not grow with the page count.
+    """
+    with open_document(subordinate_pdf_path, backend) as document:
+        end = len(document) if end is None else end
+        for index in range(start, end):
+            account = read_subordinate_account(document, index, layout)
+            if account:
+                account_number, bunchcode = account
+                yield index + 1, account_number, bunchcode  # Page numbers are 1-indexed
+
+            # Release the page's layout objects once it has been read
+            document.release_page(index)
+            if streaming and (index + 1 - start) % STREAMING_BATCH_SIZE == 0:
+                document.trim_cache()
+
+
+def scan_subordinate_pages(subordinate_pdf_path, start=0, end=None, layout=DEFAULT_LAYOUT, streaming=False,
+                           backend=DEFAULT_BACKEND):
+    """
+    Scans pages [start, end) of the Subordinate PDF for account boundaries.
+    Opens the PDF on its own so it can run inside a worker process.
+    Returns a list of (page number, account number, bunchcode) tuples,
+    with 1-indexed page numbers.
+    """
+    return list(iter_subordinate_hits(subordinate_pdf_path, start, end, layout, streaming, backend))
+
+
+def _scan_subordinate_chunk(args):
+    """
+    Process pool entry point for scan_subordinate_pages.
+    """
+    return scan_subordinate_pages(*args)
+
+
+def build_subordinate_data(hits, total_pages):
+    """
+    Stitches account boundaries (in page order) into the subordinate data
+    dictionary. Each account owns every page from its first page up to the
+    page before the next account starts, so trailing pages (even blank ones)
+    carry over to the account that is open, across chunk edges as well.
+    An account's pages are contiguous, so they are kept as a range.
+    """
+    subordinate_data = {}  # Dictionary to store subordinate account information
+
+    for i, (page_num, account_number, bunchcode) in enumerate(hits):
+        # The account runs until the next boundary, or the end of the file
+        next_page = hits[i + 1][0] if i + 1 < len(hits) else total_pages + 1
+        subordinate_data[account_number] = {
+            'pages': range(page_num, next_page),
+            'bunchcode': bunchcode
+        }
+
+    return subordinate_data
+
+
+def _scan_chunks(subordinate_pdf_path, page_ranges, workers, layout, streaming, backend):
+    """
+    Splits (start, end) page ranges into _scan_subordinate_chunk arguments.
+    """
+    total_pages = sum(end - start for start, end in page_ranges)
+    # Several chunks per worker keeps the pool busy when some pages are slower
+    chunk_size = max(1, -(-total_pages // (workers * 4)))
+    return [(subordinate_pdf_path, chunk_start, min(chunk_start + chunk_size, end), layout, streaming, backend)
+            for start, end in page_ranges
+            for chunk_start in range(start, end, chunk_size)]
+
+
+def _scan_page_ranges(subordinate_pdf_path, page_ranges, workers, layout, streaming, backend):
+    """
+    Scans a list of (start, end) page ranges of the Subordinate PDF for
+    account boundaries. With workers > 1 the ranges are split into chunks
+    that are scanned in a process pool. Returns the hits in page order.
+    """
+    total_pages = sum(end - start for start, end in page_ranges)
+    if total_pages == 0:
+        return []
+
+    if workers <= 1 or total_pages == 1:
+        hits = []
+        for start, end in page_ranges:
+            hits.extend(scan_subordinate_pages(subordinate_pdf_path, start, end, layout, streaming, backend))
+        return hits
+
+    chunks = _scan_chunks(subordinate_pdf_path, page_ranges, workers, layout, streaming, backend)
+    logger.info("Scanning %d pages in %d chunks with %d workers...", total_pages, len(chunks), workers)
+
+    hits = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map() returns chunks in submission order, so hits stay in page order
+        for chunk_hits in executor.map(_scan_subordinate_chunk, chunks):
+            hits.extend(chunk_hits)
+    return hits
+
+
+def _missing_page_ranges(total_pages, cached_pages):
+    """
+    Returns the (start, end) ranges of 0-indexed pages not in cached_pages.
+    """
+    page_ranges = []
+    start = None
+    for page_index in range(total_pages + 1):
+        missing = page_index < total_pages and page_index not in cached_pages
+        if missing and start is None:
+            start = page_index
+        elif not missing and start is not None:
+            page_ranges.append((start, page_index))
+            start = None
+    return page_ranges
+
+
+def extract_subordinate_data(subordinate_pdf_path, workers=1, layout=DEFAULT_LAYOUT, cache=None, streaming=False,
+                             report=None, backend=DEFAULT_BACKEND):
     """
     Extracts subordinate account information from the Subordinate PDF.
     Returns a dictionary where the key is the subordinate account number,
-    and the value contains associated pages and the bunchcode.
+    and the value contains associated pages (a range of 1-indexed page
+    numbers) and the bunchcode.
     Blank pages are included in the tracked pages for each account.
+    With workers > 1 the page range is split into chunks that are scanned
+    in a process pool and stitched back together in page order.
+    Pass layout=None to detect accounts from the full page text only.
+    With a PageCache, only pages not seen on an earlier run are scanned.
+    With streaming=True memory use stays flat however long the PDF is.
+    With a RunReport, the page and account counts are recorded in it.
+    backend names the text extraction backend (see text_backends).
     """
-    subordinate_data = {}  # Dictionary to store subordinate account information
-    current_account_number = None  # Current subordinate account being processed
-    current_pages = []  # Pages associated with the current account
-    current_bunchcode = None  # Bunchcode for the current account
+    logger.info("------- Starting Subordinate Page Analysis -------")
+
+    cached_pages = {}
+    total_pages = None
+    if cache:
+        digest = file_hash(subordinate_pdf_path)
+        if report:
+            report.set('subordinate_file_hash', digest)  # Saved with the account index
+        # A page's result depends on the layout it was read with
+        kind = f'subordinate:{backend}:{json.dumps(layout)}'
+        cached_pages = cache.load(digest, kind)
+        total_pages = cache.page_count(digest, kind)
+
+    if total_pages is None:
+        with open_document(subordinate_pdf_path, backend) as document:
+            total_pages = len(document)
+
+    page_ranges = _missing_page_ranges(total_pages, cached_pages)
+    scanned_hits = _scan_page_ranges(subordinate_pdf_path, page_ranges, workers, layout, streaming, backend)
+
+    # Cached pages hold either None or an [account number, bunchcode] pair
+    hits = [(page_index + 1, account[0], account[1])
+            for page_index, account in cached_pages.items() if account]
+    hits.extend(scanned_hits)
+    hits.sort(key=lambda hit: hit[0])
+
+    if cache:
+        new_pages = {page_index: None for start, end in page_ranges for page_index in range(start, end)}
+        for page_num, account_number, bunchcode in scanned_hits:
+            new_pages[page_num - 1] = [account_number, bunchcode]
+        cache.hits += len(cached_pages)
+        cache.misses += len(new_pages)
+        cache.store(digest, kind, new_pages)
+        cache.store_page_count(digest, kind, total_pages)
+
+    subordinate_data = build_subordinate_data(hits, total_pages)
+    _log_subordinate_data(subordinate_data, total_pages, report)
+    return subordinate_data
 
-    print("------- Starting Subordinate Page Analysis -------")
-    
-    with pdfplumber.open(subordinate_pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, start=1):
-            text = page.extract_text()
-            lines = text.splitlines() if text else []  # Split text into lines or set to an empty list if no text
 
-            # Detect the start of a new account when "Page 1 of" is present
-            if len(lines) > 2 and "Page 1 of" in lines[2]:
-                # Extract the account number from the 6th line (if present)
-                if len(lines) > 5:
-                    account_line = lines[5]
-                    account_match = re.search(r'(\d{9}) - (\d{7})', account_line)
-                    if account_match:
-                        new_account_number = f"{account_match.group(1)} - {account_match.group(2)}"
-
-                        # Extract the bunchcode (always the last line on page 1)
-                        new_bunchcode = lines[-1].strip() if lines else ""
-
-                        # If processing a new account, save the current account's data
-                        if current_account_number:
-                            subordinate_data[current_account_number] = {
-                                'pages': current_pages,
-                                'bunchcode': current_bunchcode
-                            }
-
-                        # Start tracking the new account
-                        current_account_number = new_account_number
-                        current_bunchcode = new_bunchcode
-                        current_pages = [page_num]  # Start fresh with the new account's first page
-
-                        print(f"Detected New Account: {current_account_number} (Bunchcode: {current_bunchcode})")
-                        continue
-            
-            # Continue adding pages to the current account, even if blank
-            if current_account_number:
-                current_pages.append(page_num)
+def _log_subordinate_data(subordinate_data, total_pages, report):
+    """
+    Logs the extracted subordinate data for review and records its counts
+    in the RunReport, if there is one.
+    """
+    logger.info("Extracted %d subordinate accounts from %d pages", len(subordinate_data), total_pages)
+    if logger.isEnabledFor(logging.DEBUG):
+        for account_number, data in subordinate_data.items():
+            logger.debug("Account: %s Bunchcode: %s Total Pages: %d Pages: %s", account_number,
+                         data['bunchcode'], len(data['pages']), list(data['pages']))
 
-        # Save the last account's data after the loop
-        if current_account_number:
-            subordinate_data[current_account_number] = {
-                'pages': current_pages,
-                'bunchcode': current_bunchcode
-            }
+    if report:
+        report.set('subordinate_pages', total_pages)
+        report.set('accounts_found', len(subordinate_data))
+
+
+def file_prefix_hash(pdf_path, prefix_bytes):
+    """
+    Returns the SHA-256 hex digests of the first prefix_bytes bytes of a
+    file (None if it is shorter) and of the whole file, in one read.
+    """
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        remaining = prefix_bytes
+        while remaining:
+            block = f.read(min(remaining, 1024 * 1024))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+        prefix_digest = digest.hexdigest() if remaining == 0 else None
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return prefix_digest, digest.hexdigest()
+
+
+def page_chain_hash(reader, refs, digest=EMPTY_PAGE_CHAIN):
+    """
+    Hashes the raw content streams of the pages of a PyPDF2 reader at the
+    verify_output.page_refs() entries in refs, in order, each page's hash
+    taken over the hash of the page before it (digest for the first one).
+    Unlike file_hash, the hash of the old pages stays the same when pages
+    are appended and the whole file is written out again, and it can be
+    carried on over the new pages without reading the old ones.
+    """
+    from PyPDF2.generic import ArrayObject
+    from verify_output import page_leaf
+
+    for ref in refs:
+        page_digest = hashlib.sha256(bytes.fromhex(digest))
+        contents = page_leaf(reader, ref).get('/Contents')
+        contents = contents.get_object() if contents is not None else ArrayObject()
+        for stream in contents if isinstance(contents, ArrayObject) else [contents]:
+            data = stream.get_object()._data  # Still encoded; no need to decompress it
+            page_digest.update(len(data).to_bytes(8, 'big') + data)
+        digest = page_digest.hexdigest()
+    return digest
 
-    # Print extracted subordinate data for review
-    print("------- Extracted Subordinate Data -------")
-    for account_number, data in subordinate_data.items():
-        print(f"Account: {account_number}")
-        print(f"  Bunchcode: {data['bunchcode']}")
-        print(f"  Total Pages: {len(data['pages'])}")
-        print(f"  Pages: {[f'Page {page}' for page in data['pages']]}")
 
+def page_refs_hash(refs):
+    """
+    Returns the SHA-256 hex digest of a list of page object numbers, from
+    verify_output.page_refs().
+    """
+    return hashlib.sha256(json.dumps(refs).encode()).hexdigest()
+
+
+def appended_only(reader, byte_count, object_count):
+    """
+    Tells whether the objects a PyPDF2 reader finds past the first
+    byte_count bytes of its file (incremental updates) leave the pages in
+    those bytes alone: of the object_count objects already there, an
+    update may only replace page tree nodes, the document catalog and
+    information dictionary, and cross-reference and object streams, as
+    appending pages does. New objects are not checked.
+    """
+    appended = [num for offsets in reader.xref.values() for num, offset in offsets.items()
+                if offset >= byte_count and num < object_count]
+    appended += [num for num, (stream_num, _) in reader.xref_objStm.items()
+                 if num < object_count and stream_num in reader.xref.get(0, {})
+                 and reader.xref[0][stream_num] >= byte_count]
+    info = reader.trailer.raw_get('/Info') if '/Info' in reader.trailer else None
+    for num in appended:
+        if info is not None and num == info.idnum:
+            continue  # The document information dictionary, dates and all
+        obj = reader.get_object(num)
+        if not (hasattr(obj, 'get') and obj.get('/Type') in ('/Pages', '/Catalog', '/XRef', '/ObjStm')):
+            return False
+    return True
+
+
+def extract_subordinate_data_incremental(subordinate_pdf_path, index, workers=1, layout=DEFAULT_LAYOUT,
+                                         streaming=False, report=None, backend=DEFAULT_BACKEND):
+    """
+    Extracts subordinate account information from a Subordinate PDF that
+    grows by having pages appended, like extract_subordinate_data.
+    The scan state saved in the AccountIndex by the previous run holds the
+    number of pages scanned, a hash of those pages and the account
+    boundaries found. If the PDF still starts with the same pages, only the
+    new pages are scanned, and the account open on the last old page runs
+    on into the new ones until the next account starts. Otherwise (a changed
+    prefix, another backend or layout, or no saved state) every page is
+    scanned. The updated state is saved back to the index.
+    The old pages are not read when the file scanned last time is still
+    there byte for byte, followed by an incremental update that adds pages
+    (see appended_only): the run then costs as much as the new pages, plus
+    one hash over the file. A file written out again in full has its old
+    pages' content streams hashed instead (see page_chain_hash).
+    """
+    from PyPDF2 import PdfReader
+    from verify_output import page_refs
+
+    logger.info("------- Starting Incremental Subordinate Page Analysis -------")
+
+    state = index.scan_state()
+    layout_key = json.dumps(layout)
+    usable = state is not None and state['backend'] == backend and state['layout'] == layout_key
+    if state is None:
+        logger.info("No saved scan state in %s, scanning every page", index.path)
+    elif not usable:
+        logger.info("Saved scan state used another backend or layout, scanning every page")
+
+    prefix_pages = state['last_page'] if usable else 0
+    byte_count = state['byte_count'] if usable else 0
+    prefix_byte_hash, byte_hash = file_prefix_hash(subordinate_pdf_path, byte_count)
+    if report:
+        report.set('subordinate_file_hash', byte_hash)  # The SHA-256 of the whole file, as file_hash
+
+    start = 0
+    hits = []
+    with open(subordinate_pdf_path, 'rb') as f:
+        reader = PdfReader(f)
+        refs = page_refs(reader)
+        total_pages = len(refs)
+        object_count = reader.trailer['/Size']
+        if usable and prefix_byte_hash == state['byte_hash'] \
+                and page_refs_hash(refs[:prefix_pages]) == state['page_refs_hash'] \
+                and appended_only(reader, byte_count, state['object_count']):
+            # The file scanned last time is still there byte for byte, so its pages need not be read
+            start = prefix_pages
+            prefix_check = 'bytes'
+            page_hash = page_chain_hash(reader, refs[start:], state['prefix_hash'])
+        else:
+            # The file was written out again: hash the old pages to see if they changed
+            prefix_hash = page_chain_hash(reader, refs[:prefix_pages])
+            prefix_check = 'pages' if usable else None
+            if usable and prefix_pages <= total_pages and prefix_hash == state['prefix_hash']:
+                start = prefix_pages
+            page_hash = page_chain_hash(reader, refs[prefix_pages:], prefix_hash)
+
+    if start:
+        hits = state['hits']
+        if start == total_pages:
+            logger.info("All %d pages are unchanged since the last scan, nothing new to scan", total_pages)
+        else:
+            logger.info("Pages 1-%d are unchanged since the last scan, scanning pages %d-%d",
+                        start, start + 1, total_pages)
+            if hits:
+                logger.info("Carrying account %s (bunchcode %s) over into the new pages",
+                            state['open_account'], state['open_bunchcode'])
+    elif usable and prefix_pages:
+        logger.warning("The first %d pages of %s changed since the last scan, scanning every page",
+                       prefix_pages, subordinate_pdf_path)
+
+    hits.extend(_scan_page_ranges(subordinate_pdf_path, [(start, total_pages)], workers, layout, streaming, backend))
+    index.save_scan_state(subordinate_pdf_path, backend, layout_key, total_pages, page_hash, hits,
+                          os.path.getsize(subordinate_pdf_path), byte_hash, object_count, page_refs_hash(refs))
+
+    subordinate_data = build_subordinate_data(hits, total_pages)
+    _log_subordinate_data(subordinate_data, total_pages, report)
+    if report:
+        report.set('subordinate_pages_scanned', total_pages - start)
+        report.set('subordinate_prefix_check', prefix_check)
     return subordinate_data
 
 
@@ -152,9 +694,10 @@ def extract_subordinate_data_old(subordinate_pdf_path):
     current_account_number = None  # Keep track of the current subordinate account number
     current_pages = []  # List to track pages for the current subordinate account
 
-    print(f"-------Staring Subordinate Page Analysis---------")
+    logger.info(f"-------Staring Subordinate Page Analysis---------")
     
     
+    import pdfplumber
     with pdfplumber.open(subordinate_pdf_path) as pdf:
         for page_num, page in enumerate(pdf.pages, start=1):
             text = page.extract_text()
@@ -172,7 +715,7 @@ def extract_subordinate_data_old(subordinate_pdf_path):
                         last_line = lines[-1]  # Get the last line of the page
                         bunchcode = last_line.strip()  # Strip any whitespace and assign to bunchcode
                         if not bunchcode:
-                            print(f"No BUNCHCODE found for account {account_number} - defaulting to blank")
+                            logger.info(f"No BUNCHCODE found for account {account_number} - defaulting to blank")
                             bunchcode = ''
                         
                         # If we've encountered a new account and it's not the first page, store the previous account's data
@@ -181,7 +724,7 @@ def extract_subordinate_data_old(subordinate_pdf_path):
                         
                         # Start tracking the new account and its pages
                         current_account_number = account_number
-                        print(f"Working On Account: {current_account_number}")
+                        logger.info(f"Working On Account: {current_account_number}")
                         current_pages = [page_num]
                     else:
                         continue
@@ -195,107 +738,242 @@ def extract_subordinate_data_old(subordinate_pdf_path):
     
 
     # Print extracted subordinate data for review
-    print("Extracted Subordinate Data:")
+    logger.info("Extracted Subordinate Data:")
     for account_number, data in subordinate_data.items():
-        print(f"Account: {account_number}")
-        print(f"  Bunchcode: {data['bunchcode']}")
-        print(f"  Total Pages: {len(data['pages'])}")  # Print the total number of pages for the account
-        print(f"  Pages: {[f'Page {page}' for page in data['pages']]}")  
+        logger.info(f"Account: {account_number}")
+        logger.info(f"  Bunchcode: {data['bunchcode']}")
+        logger.info(f"  Total Pages: {len(data['pages'])}")  # Print the total number of pages for the account
+        logger.info(f"  Pages: {[f'Page {page}' for page in data['pages']]}")  
         
     return subordinate_data
 
 
-def reorder_and_merge(master_data, subordinate_data, subordinate_pdf_path, output_pdf_path):
+def log_output_optimization(optimization):
     """
-    Reorders and merges Subordinate PDF pages based on Master PDF structure.
+    Logs what an optimized write saved (see PageTreeWriter.optimization_stats).
+    """
+    logger.info("Output optimization: %d duplicate objects shared (%.2f MB of stream data), "
+                "%d objects packed into %d object streams (%.2f MB compressed to %.2f MB)",
+                optimization['deduplicated_objects'], optimization['deduplicated_stream_bytes'] / 2 ** 20,
+                optimization['packed_objects'], optimization['object_streams'],
+                optimization['packed_bytes'] / 2 ** 20, optimization['packed_compressed_bytes'] / 2 ** 20)
+
+
+def _finish_reorder(writer, plan, report):
+    """
+    Saves the merged output, checks the page counts against the plan and
+    records the output counters in the RunReport, if there is one.
+    """
+    writer.close()
+
+    # Verify that all pages are accounted for; blank pads are not source pages
+    total_original_pages = writer.source_page_count()
+    source_pages_processed = writer.page_count - writer.blank_count
+    logger.info("Total pages in original Subordinate PDF: %d", total_original_pages)
+    logger.info("Total pages processed into new PDF: %d (%d blank pads)", writer.page_count, writer.blank_count)
+
+    if total_original_pages == source_pages_processed:
+        logger.info("Success: All pages from the original PDF were processed.")
+    else:
+        logger.warning("Some pages may be missing in the output PDF.")
+    if writer.page_count != len(plan):
+        logger.warning("The output has %d pages, the plan %d.", writer.page_count, len(plan))
+
+    optimization = writer.optimization_stats()
+    logger.info("Output size: %.1f MB", writer.output_bytes() / 2 ** 20)
+    if optimization:
+        log_output_optimization(optimization)
+
+    if report:
+        stats = plan.stats()
+        report.set('output_pages', writer.page_count)
+        report.set('output_bytes', writer.output_bytes())
+        if optimization:
+            report.set('output_optimization', optimization)
+        report.set('blank_pages_inserted', writer.blank_count)
+        report.set('missing_subordinates', stats['missing_subordinates'])
+        report.set('missing_subordinate_accounts', stats['missing_subordinate_accounts'])
+        report.set('orphan_accounts_by_bunchcode', stats['orphan_accounts_by_bunchcode'])
+
+
+def reorder_and_merge(master_data, subordinate_data, subordinate_pdf_path, output_pdf_path, batch_size=None,
+                      report=None, optimize=False, plan=None):
+    """
+    Reorders and merges Subordinate PDF pages based on Master PDF structure,
+    following a ReorderPlan (see build_plan), built here unless one is given.
     Adds a blank page if a subordinate account has an odd number of pages.
     Appends unprocessed subordinate accounts grouped by bunchcode and sorted alphanumerically.
+    The output page tree references the source pages' objects instead of
+    copying them, and blank pads share one empty resource dictionary.
+    With a batch_size the output is written in batches of that many pages,
+    keeping memory flat for very large PDFs.
+    With optimize, identical objects are written once and the output is
+    packed into compressed object streams (see PageTreeWriter).
+    With a RunReport, the output counts and size, missing subordinates and
+    orphan accounts per bunchcode are recorded in it.
     """
-    writer = PdfWriter()
-    processed_subordinates = set()  # To track processed subordinate accounts
-    total_pages_processed = 0  # To track the total pages processed
+    from PyPDF2 import PdfReader
+    from page_tree import PageTreeWriter
 
-    print(f"-------Starting PDF Creation and Reorder---------")
+    if plan is None:
+        plan = build_plan(master_data, subordinate_data)
+
+    logger.info("-------Starting PDF Creation and Reorder---------")
     
     # Open the Subordinate PDF
-    with open(subordinate_pdf_path, 'rb') as f:
+    with open(subordinate_pdf_path, 'rb') as f, open(output_pdf_path, 'wb') as output:
         reader = PdfReader(f)
+        writer = PageTreeWriter(reader, output, batch_size=batch_size, optimize=optimize)
+        write_plan(writer, plan.entries)
+        _finish_reorder(writer, plan, report)
 
-        print(f"--Working Through Accounts In Master File--")
-        # Process subordinate accounts based on the Master Account structure
-        for master_account, subordinates in master_data.items():
-            for subordinate in subordinates:
-                if subordinate in subordinate_data:
-                    subordinate_pages = subordinate_data[subordinate]['pages']
-                    print(f"Processing {subordinate} with {len(subordinate_pages)} page(s).")
 
-                    # Add the pages of the subordinate account
-                    for page_num in subordinate_pages:
-                        writer.add_page(reader.pages[page_num - 1])  # page_num is 1-indexed
-                        total_pages_processed += 1
+def _produce_hits(subordinate_pdf_path, layout, streaming, backend, hit_queue):
+    """
+    Process entry point for the pipelined scan. Puts each account boundary
+    on hit_queue as soon as it is found, then None when the scan is done,
+    or the error that stopped it.
+    """
+    try:
+        for hit in iter_subordinate_hits(subordinate_pdf_path, 0, None, layout, streaming, backend):
+            hit_queue.put(hit)
+    except Exception as e:
+        hit_queue.put(RuntimeError(f"Subordinate scan failed: {type(e).__name__}: {e}"))
+        return
+    hit_queue.put(None)
 
-                    # Add a blank page if odd number of pages
-                    if len(subordinate_pages) % 2 != 0:
-                        print(f"Adding a blank page for {subordinate} (odd number of pages).")
-                        blank_page = create_blank_page()
-                        blank_reader = PdfReader(blank_page)
-                        writer.add_page(blank_reader.pages[0])
-                        total_pages_processed += 1
 
-                    # Mark the subordinate account as processed
-                    processed_subordinates.add(subordinate)
-                else:
-                    print(f"Warning: Subordinate account {subordinate} not found in subordinate data.")
+def _iter_pipelined_hits(subordinate_pdf_path, total_pages, workers, layout, streaming, backend):
+    """
+    Yields the account boundaries of the Subordinate PDF in page order
+    while it is scanned in other processes. With one worker a single scan
+    process streams each boundary through a queue as soon as it is found;
+    with more, chunks are scanned in a process pool and come back in order
+    as they finish.
+    """
+    if workers > 1:
+        chunks = _scan_chunks(subordinate_pdf_path, [(0, total_pages)], workers, layout, streaming, backend)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_hits in executor.map(_scan_subordinate_chunk, chunks):
+                yield from chunk_hits
+        return
+
+    hit_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_produce_hits,
+                                      args=(subordinate_pdf_path, layout, streaming, backend, hit_queue))
+    process.start()
+    try:
+        while True:
+            try:
+                hit = hit_queue.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError("Subordinate scan process exited unexpectedly")
+                continue
+            if hit is None:
+                break
+            if isinstance(hit, Exception):
+                raise hit
+            yield hit
+    finally:
+        if process.is_alive():
+            process.terminate()  # Writing failed; the rest of the scan is not needed
+        process.join()
+
+
+def scan_reorder_and_merge(master_data, subordinate_pdf_path, output_pdf_path, workers=1, layout=DEFAULT_LAYOUT,
+                           streaming=False, batch_size=None, report=None, backend=DEFAULT_BACKEND, optimize=False):
+    """
+    Pipelined extract_subordinate_data and reorder_and_merge: the Subordinate
+    PDF is scanned by other processes while this process writes.
+    Each account's pages are written to the output as soon as the next
+    account boundary (or the end of the file) closes it, whatever its place
+    in the output; since the output order only lives in the page tree, the
+    pages are put in the order of a ReorderPlan (see build_plan) once the
+    scan is over. The output is the same as
+    running the two phases one after the other, and optimize works as in
+    reorder_and_merge.
+    An account found twice is the one exception: its later copy wins, as in
+    build_subordinate_data, but the earlier copy's pages have already been
+    written. They stay in the file as page objects no page tree references,
+    so no viewer shows them, and their count is recorded in the RunReport
+    as 'unreferenced_pages'.
+    Returns the subordinate data dictionary and the ReorderPlan written.
+    """
+    from PyPDF2 import PdfReader
+    from page_tree import PageTreeWriter
 
-        # Find remaining subordinate accounts
-        remaining_subordinates = set(subordinate_data.keys()) - processed_subordinates
+    logger.info("------- Starting Pipelined Subordinate Scan and Reorder -------")
 
-        # Group remaining accounts by bunchcode
-        grouped_by_bunchcode = {}
-        for subordinate in remaining_subordinates:
-            bunchcode = subordinate_data[subordinate]['bunchcode']
-            if bunchcode not in grouped_by_bunchcode:
-                grouped_by_bunchcode[bunchcode] = []
-            grouped_by_bunchcode[bunchcode].append(subordinate)
-
-        # Sort accounts within each bunchcode group
-        for bunchcode in grouped_by_bunchcode:
-            grouped_by_bunchcode[bunchcode].sort()
-
-        print(f"--Working Through Accounts NOT In Master File, Grouped By Bunchcode--")
-        # Append the remaining accounts in grouped and sorted order
-        for bunchcode, accounts in sorted(grouped_by_bunchcode.items()):
-            print(f"Processing bunchcode {bunchcode} with {len(accounts)} account(s).")
-            for subordinate in accounts:
-                subordinate_pages = subordinate_data[subordinate]['pages']
-                print(f"  Processing subordinate {subordinate} with {len(subordinate_pages)} page(s).")
-
-                # Add the pages of the subordinate account
-                for page_num in subordinate_pages:
-                    writer.add_page(reader.pages[page_num - 1])  # page_num is 1-indexed
-                    total_pages_processed += 1
-
-                # Add a blank page if odd number of pages
-                if len(subordinate_pages) % 2 != 0:
-                    print(f"Adding a blank page for {subordinate} (odd number of pages).")
-                    blank_page = create_blank_page()
-                    blank_reader = PdfReader(blank_page)
-                    writer.add_page(blank_reader.pages[0])
-                    total_pages_processed += 1
+    with open_document(subordinate_pdf_path, backend) as document:
+        total_pages = len(document)
 
-        # Save the merged output
-        with open(output_pdf_path, 'wb') as output:
-            writer.write(output)
+    logger.info("Scanning %d pages with %d workers while writing...", total_pages, max(workers, 1))
 
-        # Verify that all pages are accounted for
-        total_original_pages = len(reader.pages)
-        print(f"Total pages in original Subordinate PDF: {total_original_pages}")
-        print(f"Total pages processed into new PDF: {total_pages_processed}")
+    subordinate_data = {}
+    written_pages = {}  # Source page -> output object number of its copy, written ahead
+    hits = []
 
-        if total_original_pages == total_pages_processed:
-            print("Success: All pages from the original PDF were processed.")
-        else:
-            print("Warning: Some pages may be missing in the output PDF.")
+    with open(subordinate_pdf_path, 'rb') as f, open(output_pdf_path, 'wb') as output:
+        reader = PdfReader(f)
+        writer = PageTreeWriter(reader, output, batch_size=batch_size, optimize=optimize)
+
+        def close_account(hit, next_page):
+            page_num, account_number, bunchcode = hit
+            if account_number in subordinate_data:
+                # The later copy wins, as in build_subordinate_data; the earlier pages stay unreferenced
+                earlier_pages = subordinate_data[account_number]['pages']
+                logger.warning("Subordinate account %s appears again on page %d; its %d earlier page(s) stay "
+                               "unreferenced in the output file.", account_number, page_num, len(earlier_pages))
+            pages = range(page_num, next_page)
+            subordinate_data[account_number] = {'pages': pages, 'bunchcode': bunchcode}
+            for page in pages:
+                written_pages[page] = writer.write_page(page - 1)
+
+        for hit in _iter_pipelined_hits(subordinate_pdf_path, total_pages, workers, layout, streaming, backend):
+            if hits:
+                close_account(hits[-1], hit[0])
+            hits.append(hit)
+        if hits:
+            close_account(hits[-1], total_pages + 1)
+        _log_subordinate_data(subordinate_data, total_pages, report)
+        if report:
+            # Every page was written once; those of the earlier copies are not in subordinate_data
+            report.set('unreferenced_pages',
+                       len(written_pages) - sum(len(data['pages']) for data in subordinate_data.values()))
+
+        plan = build_plan(master_data, subordinate_data)
+        write_plan(writer, plan.entries, written_pages)
+        _finish_reorder(writer, plan, report)
+
+    return subordinate_data, plan
+
+
+def linearize_pdf(pdf_path):
+    """
+    Rewrites a PDF in place as a linearized ("fast web view") file with the
+    qpdf command line tool, so a viewer or print server can start on the
+    first pages before the whole file has arrived. Stream data is copied
+    as is and object streams are kept, so no page changes. Returns the
+    size of the file before and after, in bytes.
+    """
+    qpdf = shutil.which("qpdf")
+    if qpdf is None:
+        raise RuntimeError("Linearizing needs the qpdf command line tool, which was not found on PATH "
+                           "(an optional dependency, see requirements.txt)")
+
+    size_before = os.path.getsize(pdf_path)
+    linearized_path = pdf_path + ".linearizing"
+    result = subprocess.run([qpdf, "--linearize", "--object-streams=preserve", "--stream-data=preserve",
+                             pdf_path, linearized_path], capture_output=True, text=True)
+    if result.returncode not in (0, 3):  # 3: written, with warnings
+        if os.path.exists(linearized_path):
+            os.unlink(linearized_path)
+        raise RuntimeError(f"qpdf could not linearize {pdf_path}: {result.stderr.strip()}")
+    if result.stderr:
+        logger.warning("qpdf: %s", result.stderr.strip())
+    os.replace(linearized_path, pdf_path)
+    return size_before, os.path.getsize(pdf_path)
 
 
 def reorder_and_merge_old(master_data, subordinate_data, subordinate_pdf_path, output_pdf_path):
@@ -304,10 +982,12 @@ def reorder_and_merge_old(master_data, subordinate_data, subordinate_pdf_path, o
     Adds a blank page if a subordinate account has an odd number of pages.
     Appends unprocessed subordinate accounts to the end.
     """
+    from PyPDF2 import PdfReader, PdfWriter
+
     writer = PdfWriter()
     processed_subordinates = set()  # To track processed subordinate accounts
 
-    print(f"-------Starting PDF Creation and Reorder---------")
+    logger.info(f"-------Starting PDF Creation and Reorder---------")
     
     # Open the Subordinate PDF
     with open(subordinate_pdf_path, 'rb') as f:
@@ -319,7 +999,7 @@ def reorder_and_merge_old(master_data, subordinate_data, subordinate_pdf_path, o
                 # Check if the subordinate account exists in the subordinate_data map
                 if subordinate in subordinate_data:
                     subordinate_pages = subordinate_data[subordinate]
-                    print(f"Processing {subordinate} with {len(subordinate_pages)} page(s).")
+                    logger.info(f"Processing {subordinate} with {len(subordinate_pages)} page(s).")
 
                     # Add the pages of the subordinate account
                     for page_num in subordinate_pages:
@@ -327,7 +1007,7 @@ def reorder_and_merge_old(master_data, subordinate_data, subordinate_pdf_path, o
 
                     # Check if the number of pages for this subordinate account is odd
                     if len(subordinate_pages) % 2 != 0:
-                        print(f"Adding a blank page for {subordinate} (odd number of pages).")
+                        logger.info(f"Adding a blank page for {subordinate} (odd number of pages).")
                         
                         # Create and add a blank page
                         blank_page = create_blank_page()
@@ -337,16 +1017,16 @@ def reorder_and_merge_old(master_data, subordinate_data, subordinate_pdf_path, o
                     # Mark the subordinate account as processed
                     processed_subordinates.add(subordinate)
                 else:
-                    print(f"Warning: Subordinate account {subordinate} not found in subordinate data.")
+                    logger.info(f"Warning: Subordinate account {subordinate} not found in subordinate data.")
 
         # Find remaining subordinate accounts
         remaining_subordinates = set(subordinate_data.keys()) - processed_subordinates
-        print(f"Appending remaining subordinate accounts: {remaining_subordinates}")
+        logger.info(f"Appending remaining subordinate accounts: {remaining_subordinates}")
 
         # Append the remaining subordinate accounts to the output PDF
         for subordinate in remaining_subordinates:
             subordinate_pages = subordinate_data[subordinate]
-            print(f"Processing remaining subordinate {subordinate} with {len(subordinate_pages)} page(s).")
+            logger.info(f"Processing remaining subordinate {subordinate} with {len(subordinate_pages)} page(s).")
 
             # Add the pages of the subordinate account
             for page_num in subordinate_pages:
@@ -354,7 +1034,7 @@ def reorder_and_merge_old(master_data, subordinate_data, subordinate_pdf_path, o
 
             # Check if the number of pages for this subordinate account is odd
             if len(subordinate_pages) % 2 != 0:
-                print(f"Adding a blank page for {subordinate} (odd number of pages).")
+                logger.info(f"Adding a blank page for {subordinate} (odd number of pages).")
                 
                 # Create and add a blank page
                 blank_page = create_blank_page()
@@ -365,7 +1045,7 @@ def reorder_and_merge_old(master_data, subordinate_data, subordinate_pdf_path, o
         with open(output_pdf_path, 'wb') as output:
             writer.write(output)
 
-        print(f"PDF successfully created: {output_pdf_path}")
+        logger.info(f"PDF successfully created: {output_pdf_path}")
 
         
 
@@ -374,6 +1054,8 @@ def create_blank_page():
     """
     Creates a blank page using ReportLab and returns it as a BytesIO object.
     """
+    from reportlab.pdfgen import canvas
+
     packet = BytesIO()
     c = canvas.Canvas(packet)
     c.showPage()  # Create a blank page
@@ -383,15 +1065,63 @@ def create_blank_page():
         
         
         
-def see_data(pdf_path):
+def check_backend_parity(master_pdf_path, subordinate_pdf_path, backends=tuple(BACKENDS), layout=DEFAULT_LAYOUT):
+    """
+    Runs both extractors with every text backend on the same input and
+    compares the master and subordinate dictionaries against the first
+    backend's. Identical dictionaries mean an identical reorder result.
+    Returns a dictionary with 'match' and, per backend, the master accounts
+    and subordinate accounts that differ.
+    """
+    results = {}
+    for backend in backends:
+        results[backend] = (extract_master_data(master_pdf_path, backend=backend, learn_table=layout is not None),
+                            extract_subordinate_data(subordinate_pdf_path, layout=layout, backend=backend))
+
+    reference = backends[0]
+    reference_master, reference_subordinate = results[reference]
+    parity = {'reference': reference, 'match': True, 'differences': {}}
+    for backend in backends[1:]:
+        master_data, subordinate_data = results[backend]
+        master_diff = sorted(key for key in set(reference_master) | set(master_data)
+                             if reference_master.get(key) != master_data.get(key))
+        subordinate_diff = sorted(key for key in set(reference_subordinate) | set(subordinate_data)
+                                  if reference_subordinate.get(key) != subordinate_data.get(key))
+        # Same contents in a different order would still change the output order
+        order_matches = list(reference_master) == list(master_data)
+
+        if master_diff or subordinate_diff or not order_matches:
+            parity['match'] = False
+        parity['differences'][backend] = {
+            'master_accounts': master_diff,
+            'master_order_matches': order_matches,
+            'subordinate_accounts': subordinate_diff,
+        }
+
+    return parity
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident memory of this process and of its largest
+    finished child process (e.g. scan workers), in MB.
+    """
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+
+def see_data(pdf_path, backend=DEFAULT_BACKEND):
     """
     Extracts data from the Master PDF, including the order of Subordinate Accounts.
     """
     master_data = {}
     
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, start=1):
-            text = page.extract_text()
+    with open_document(pdf_path, backend) as document:
+        for page_num in range(1, len(document) + 1):
+            text = "\n".join(document.page_lines(page_num - 1))
             # Implement pattern matching to extract Master and Subordinate Accounts
             # For now, we'll just log the text (modify as needed)
             #print(f"Page {page_num}: {text[:400]}...") # Preview first 100 characters
@@ -0,0 +1,365 @@
+import hashlib
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from io import BytesIO
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject, read_object
+
+from page_cache import file_hash
+from reorder_plan import BLANK, build_plan
+from sharded_output import plan_shards
+
+logger = logging.getLogger(__name__)
+
+# Keys left out of fingerprints: /Length is rewritten by the output writer
+# and /Parent links back into the page tree
+SKIPPED_KEYS = ("/Length", "/Parent")
+
+
+def _load_object_stream(reader, stream_num):
+    """
+    Reads every object packed in an object stream into the reader's cache.
+    """
+    stream = reader.get_object(IndirectObject(stream_num, 0, reader))
+    data = BytesIO(stream.get_data())
+    first = stream["/First"]
+    index = [int(value) for value in data.read(first).split()]
+    for num, offset in zip(index[::2], index[1::2]):
+        if reader.xref_objStm.get(num, (None,))[0] != stream_num or (0, num) in reader.resolved_objects:
+            continue  # Replaced by a later revision of the file, or already read
+        data.seek(first + offset)
+        while data.read(1).isspace():
+            pass
+        data.seek(-1, 1)
+        reader.cache_indirect_object(0, num, read_object(data, reader))
+
+
+def _resolve(obj):
+    """
+    Returns the object an IndirectObject points to, or obj itself if it is
+    a direct object. PyPDF2 reads an object
+    packed in an object stream by scanning the stream's index up to it, so
+    reading a stream's objects one by one takes time quadratic in its size;
+    here the first object read from a stream has the whole stream read.
+    """
+    if not isinstance(obj, IndirectObject):
+        return obj
+    reader = obj.pdf
+    location = reader.xref_objStm.get(obj.idnum)
+    if location is not None and (obj.generation, obj.idnum) not in reader.resolved_objects:
+        _load_object_stream(reader, location[0])
+    return obj.get_object()
+
+
+def _fingerprint(obj, memo):
+    """
+    Returns a canonical byte string for a PDF object. Indirect objects are
+    replaced by the digest of what they point to, so the same object gets
+    the same fingerprint whatever its object number in a given file. memo
+    holds the digest of each indirect object already seen in the file.
+    """
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        digest = memo.get(key)
+        if digest is None:
+            memo[key] = b"cycle"  # Guards against reference loops while this object is being hashed
+            digest = memo[key] = hashlib.blake2b(_fingerprint(_resolve(obj), memo), digest_size=16).digest()
+        return b"R" + digest
+    if isinstance(obj, StreamObject):
+        # The stream data is compared still encoded; the writer copies it byte for byte
+        data_digest = hashlib.blake2b(obj._data, digest_size=16).digest()
+        return _fingerprint_dict(obj, memo) + b"stream" + data_digest
+    if isinstance(obj, DictionaryObject):
+        return _fingerprint_dict(obj, memo)
+    if isinstance(obj, ArrayObject):
+        return b"[" + b" ".join(_fingerprint(value, memo) for value in obj) + b"]"
+    out = BytesIO()
+    obj.write_to_stream(out, None)
+    return out.getvalue()
+
+
+def _fingerprint_dict(obj, memo):
+    return b"<<" + b" ".join(key.encode() + b" " + _fingerprint(value, memo)
+                             for key, value in sorted(obj.items()) if key not in SKIPPED_KEYS) + b">>"
+
+
+def page_refs(reader):
+    """
+    Returns the (object number, generation) of every page of a PDF, in
+    order. Only /Pages nodes are parsed: when a node's /Count equals its
+    number of kids, each kid holds a single page and is not opened here.
+    """
+    refs = []
+    root = reader.trailer["/Root"].get_object()
+    stack = [root["/Pages"]]
+    while stack:
+        node_ref = stack.pop()
+        node = _resolve(node_ref)
+        if "/Kids" not in node:
+            refs.append((node_ref.idnum, node_ref.generation))
+            continue
+        kids = node["/Kids"]
+        if node.get("/Count") == len(kids):
+            refs.extend((kid.idnum, kid.generation) for kid in kids)
+        else:
+            # Push in reverse so the first kid is visited first
+            stack.extend(reversed(kids))
+    return refs
+
+
+def page_leaf(reader, ref):
+    """
+    Returns the page dictionary a page_refs() entry points to, going down
+    through single-page /Pages nodes.
+    """
+    node = _resolve(IndirectObject(ref[0], ref[1], reader))
+    while "/Kids" in node:
+        node = _resolve(node["/Kids"][0])
+    return node
+
+
+def _inherited_resources(page):
+    """
+    Returns the resources of a page, inherited from its /Pages ancestors
+    when the page has none of its own.
+    """
+    node = page
+    while node is not None:
+        if "/Resources" in node:
+            return node["/Resources"]
+        parent = node.get("/Parent")
+        node = parent.get_object() if parent is not None else None
+    return DictionaryObject()
+
+
+def fingerprint_pages(pdf_path, refs=None):
+    """
+    Fingerprints pages of a PDF from their content streams and (inherited)
+    resources: all of them, or the page_refs() entries in refs. Returns a
+    list with one 16-byte digest per page, or None for a page with no
+    content stream (a blank page).
+    """
+    memo = {}
+    fingerprints = []
+    with open(pdf_path, 'rb') as f:
+        reader = PdfReader(f)
+        for ref in page_refs(reader) if refs is None else refs:
+            page = page_leaf(reader, ref)
+            contents = page.get("/Contents")
+            if contents is None:
+                fingerprints.append(None)
+                continue
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(_fingerprint(contents, memo))
+            digest.update(_fingerprint(_inherited_resources(page), memo))
+            fingerprints.append(digest.digest())
+    return fingerprints
+
+
+def _fingerprint_chunk(args):
+    """
+    Process pool entry point for fingerprint_pages.
+    """
+    return fingerprint_pages(*args)
+
+
+def _fingerprint_files(pdf_paths, workers):
+    """
+    Fingerprints every page of several PDFs, in chunks spread over a
+    process pool when workers > 1. Returns one fingerprint list per PDF.
+    """
+    if workers <= 1:
+        return [fingerprint_pages(pdf_path) for pdf_path in pdf_paths]
+
+    refs = {}
+    for pdf_path in pdf_paths:
+        with open(pdf_path, 'rb') as f:
+            refs[pdf_path] = page_refs(PdfReader(f))
+    chunk_size = max(1, -(-sum(len(file_refs) for file_refs in refs.values()) // (workers * 4)))
+    chunks = [(pdf_path, refs[pdf_path][start:start + chunk_size])
+              for pdf_path in pdf_paths
+              for start in range(0, len(refs[pdf_path]), chunk_size)]
+
+    fingerprints = {pdf_path: [] for pdf_path in pdf_paths}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map() returns chunks in order, so each file's pages stay in order
+        for chunk, chunk_fingerprints in zip(chunks, executor.map(_fingerprint_chunk, chunks)):
+            fingerprints[chunk[0]].extend(chunk_fingerprints)
+    return [fingerprints[pdf_path] for pdf_path in pdf_paths]
+
+
+def _cached_fingerprints(pdf_path, cache, workers):
+    """
+    Returns the fingerprint_pages() list of a PDF, taken from a PageCache
+    when an earlier verification of the same file stored it there, and
+    stored in it otherwise.
+    """
+    digest = file_hash(pdf_path)
+    cached = cache.load(digest, 'fingerprint')
+    page_count = cache.page_count(digest, 'fingerprint')
+    if page_count is not None and len(cached) == page_count:
+        cache.hits += page_count
+        return [bytes.fromhex(cached[page]) if cached[page] else None for page in range(page_count)]
+
+    fingerprints, = _fingerprint_files([pdf_path], workers)
+    cache.misses += len(fingerprints)
+    cache.store(digest, 'fingerprint', {page: fingerprint.hex() if fingerprint else None
+                                        for page, fingerprint in enumerate(fingerprints)})
+    cache.store_page_count(digest, 'fingerprint', len(fingerprints))
+    return fingerprints
+
+
+def expected_output(master_data, subordinate_data, shard_by=None, plan=None):
+    """
+    Returns the output reorder_and_merge is expected to write, or with
+    shard_by the shards write_shards is expected to write, one after the
+    other, as a list of (subordinate account, 1-indexed source page)
+    pairs, with None as the page of a blank pad. Both follow a ReorderPlan
+    (see build_plan), built here unless one is given.
+    """
+    if plan is None:
+        plan = build_plan(master_data, subordinate_data)
+    account_indexes = {subordinate: index for index, subordinate in enumerate(plan.accounts)}
+    if shard_by:
+        ordered = [subordinate for shard in plan_shards(plan, subordinate_data, shard_by)
+                   for subordinate in shard['accounts']]
+    else:
+        ordered = plan.accounts
+
+    expected = []
+    for subordinate in ordered:
+        expected.extend((subordinate, entry if entry != BLANK else None)
+                        for entry in plan.account_entries(account_indexes[subordinate]))
+    return expected
+
+
+def _alignment_keys(fingerprints):
+    """
+    Returns page fingerprints to align, with each blank page (None) replaced
+    by a key naming the page before it. Runs of equal elements make
+    SequenceMatcher quadratic, and a file with many blank pads is full of
+    them otherwise.
+    """
+    keys = []
+    previous = None
+    blanks = 0  # Blank pages since the previous page
+    for fingerprint in fingerprints:
+        if fingerprint is None:
+            blanks += 1
+            keys.append(('blank', previous, blanks))
+        else:
+            previous = fingerprint
+            blanks = 0
+            keys.append(fingerprint)
+    return keys
+
+
+def _mismatched_accounts(expected, expected_fingerprints, output_fingerprints):
+    """
+    Returns the accounts whose output pages are not the expected ones, in
+    output order. Aligning the two sequences keeps one dropped or extra
+    page from throwing off every account after it.
+    """
+    matcher = SequenceMatcher(None, _alignment_keys(expected_fingerprints), _alignment_keys(output_fingerprints),
+                              autojunk=False)
+    mismatched_accounts = {}  # Kept in output order
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal' or not expected:
+            continue
+        # Extra output pages count against the account they were found in
+        for position in range(i1, i2) if i2 > i1 else [min(i1, len(expected) - 1)]:
+            mismatched_accounts[expected[position][0]] = True
+    return list(mismatched_accounts)
+
+
+def verify_output(master_data, subordinate_data, subordinate_pdf_path, output_pdf_paths, shard_by=None,
+                  workers=None, report=None, plan=None, cache=None):
+    """
+    Checks the reordered output against the Subordinate PDF by page
+    fingerprints (content streams and resources, see fingerprint_pages):
+      - every non-blank output page is an input page, and every input page
+        is in the output exactly once (the output is a permutation of the
+        input, plus blank pads)
+      - the output follows the expected order (see expected_output), with a
+        blank pad exactly where one is expected
+    output_pdf_paths is the output PDF, or the list of shard PDFs in
+    manifest order written with shard_by. plan is the ReorderPlan the
+    output was written from, if there is one at hand.
+    Pages are fingerprinted in parallel on workers processes (default: one
+    per CPU). With a PageCache, the Subordinate PDF's fingerprints are kept
+    in it, so verifying another output of the same file only reads the
+    output. Returns a dictionary with 'ok', the page counts and the
+    problems found: 'mismatched_accounts' (accounts whose output pages are
+    not the expected ones), 'dropped_input_pages', 'duplicated_input_pages'
+    and 'unknown_output_pages' (page numbers are 1-indexed; output page
+    numbers count across shards).
+    With a RunReport, the result is recorded in it.
+    """
+    logger.info("-------Starting Output Verification---------")
+    if isinstance(output_pdf_paths, str):
+        output_pdf_paths = [output_pdf_paths]
+
+    workers = workers or os.cpu_count()
+    if cache:
+        input_fingerprints = _cached_fingerprints(subordinate_pdf_path, cache, workers)
+        output_fingerprints = _fingerprint_files(output_pdf_paths, workers)
+    else:
+        input_fingerprints, *output_fingerprints = _fingerprint_files([subordinate_pdf_path] + output_pdf_paths, workers)
+    output_fingerprints = [fingerprint for shard in output_fingerprints for fingerprint in shard]
+    expected = expected_output(master_data, subordinate_data, shard_by, plan)
+
+    # The output must hold each input page exactly once, plus blank pads
+    input_counts = Counter(fingerprint for fingerprint in input_fingerprints if fingerprint is not None)
+    output_counts = Counter(fingerprint for fingerprint in output_fingerprints if fingerprint is not None)
+    dropped_input_pages = []
+    duplicated_input_pages = []
+    for page_num, fingerprint in enumerate(input_fingerprints, start=1):
+        if fingerprint is None:
+            continue
+        if output_counts[fingerprint] < input_counts[fingerprint]:
+            dropped_input_pages.append(page_num)
+        elif output_counts[fingerprint] > input_counts[fingerprint]:
+            duplicated_input_pages.append(page_num)
+    unknown_output_pages = [page_num for page_num, fingerprint in enumerate(output_fingerprints, start=1)
+                            if fingerprint is not None and fingerprint not in input_counts]
+
+    # And follow the expected order
+    expected_fingerprints = [input_fingerprints[page_num - 1] if page_num else None for _, page_num in expected]
+    order_ok = expected_fingerprints == output_fingerprints
+    mismatched_accounts = [] if order_ok else _mismatched_accounts(expected, expected_fingerprints,
+                                                                   output_fingerprints)
+
+    result = {
+        'ok': order_ok and not (dropped_input_pages or duplicated_input_pages or unknown_output_pages),
+        'input_pages': len(input_fingerprints),
+        'output_pages': len(output_fingerprints),
+        'expected_output_pages': len(expected),
+        'mismatched_accounts': mismatched_accounts,
+        'dropped_input_pages': dropped_input_pages,
+        'duplicated_input_pages': duplicated_input_pages,
+        'unknown_output_pages': unknown_output_pages,
+    }
+
+    if result['ok']:
+        blank_pads = sum(1 for _, page_num in expected if page_num is None)
+        logger.info("Verified: the %d output pages are the %d input pages in the expected order, plus %d blank pads",
+                    len(output_fingerprints), len(input_fingerprints), blank_pads)
+    else:
+        logger.error("Output verification failed: %d output pages, %d expected", len(output_fingerprints),
+                     len(expected))
+        for subordinate in mismatched_accounts:
+            logger.error("  Account %s: output pages differ from the expected pages", subordinate)
+        if dropped_input_pages:
+            logger.error("  Input pages missing from the output: %s", dropped_input_pages)
+        if duplicated_input_pages:
+            logger.error("  Input pages written more than once: %s", duplicated_input_pages)
+        if unknown_output_pages:
+            logger.error("  Output pages not found in the input: %s", unknown_output_pages)
+
+    if report:
+        report.set('verification', result)
+    return result